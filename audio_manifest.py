@@ -0,0 +1,174 @@
+"""
+音頻清單 - 記錄 static/audio 中已生成的音頻（哈希 -> 大小、生成時間、原文、語言）
+
+路由用清單判斷音頻是否存在，不再對每個文本調用 os.path.exists/getsize。
+清單以 JSON Lines 追加寫入 audio 目錄下的 manifest.jsonl，啟動時載入；文件不存在時掃描一次目錄生成。
+其他進程生成的音頻同樣追加到這個文件，查找未命中時讀取文件新增的部分。
+手動增刪音頻文件後執行 reconcile 重新掃描目錄並重寫清單；運行中的進程在下一次未命中時發現清單文件已被替換（inode 改變），從頭重新載入。
+
+用法:
+    python audio_manifest.py reconcile [音頻目錄]
+"""
+import json
+import os
+import sys
+import threading
+import time
+
+AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'audio')
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+class AudioManifest:
+    """音頻哈希 -> {'size', 'created', 'text', 'lang'}；線程安全，多進程通過追加寫入共享"""
+
+    def __init__(self, audio_dir):
+        self.audio_dir = audio_dir
+        self.path = os.path.join(audio_dir, MANIFEST_NAME)
+        self._entries = {}
+        self._offset = 0
+        # 已讀取的清單文件的 inode：reconcile 以 os.replace 重寫清單，inode 改變時從頭重新載入
+        self._inode = None
+        self._lock = threading.Lock()
+        # add/reconcile 後喚醒 wait_any 的等待者
+        self._changed = threading.Condition(self._lock)
+        if os.path.exists(self.path):
+            with self._lock:
+                self._read_new()
+            print(f"[AUDIO] Manifest loaded: {len(self._entries)} files")
+        else:
+            result = self.reconcile()
+            print(f"[AUDIO] Manifest created from {audio_dir}: {result['files']} files")
+
+    def _read_new(self):
+        """讀取清單文件中上次之後追加的行"""
+        try:
+            with open(self.path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._inode or stat.st_size < self._offset:
+                    # 其他進程執行了 reconcile，清單已重寫：重新載入
+                    self._entries = {}
+                    self._offset = 0
+                    self._inode = stat.st_ino
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # 只處理完整的行，另一個進程可能正寫到一半
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            key = entry.pop('hash', None)
+            if key is None:
+                continue
+            if entry.get('removed'):
+                self._entries.pop(key, None)
+            else:
+                self._entries[key] = entry
+        self._offset += end
+
+    def _refresh(self):
+        """清單文件被替換或大小有變化時讀取其他進程的改動（調用方持有鎖）"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        if stat.st_ino != self._inode or stat.st_size != self._offset:
+            self._read_new()
+
+    def has(self, key):
+        """音頻是否已生成；未命中時先讀取其他進程追加的記錄"""
+        with self._lock:
+            if key in self._entries:
+                return True
+            self._refresh()
+            return key in self._entries
+
+    def wait_any(self, keys, timeout, poll=0.5):
+        """
+        等待 keys 中至少一個音頻生成，返回已生成的鍵（超時返回空集合）
+
+        本進程生成的音頻立即喚醒；其他進程生成的音頻每 poll 秒檢查一次清單文件
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                ready = {key for key in keys if key in self._entries}
+                remaining = deadline - time.monotonic()
+                if ready or remaining <= 0:
+                    return ready
+                self._changed.wait(min(poll, remaining))
+                self._refresh()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def add(self, key, size, text='', lang=''):
+        """記錄新生成的音頻並追加到清單文件"""
+        entry = {'size': size, 'created': time.time(), 'text': text, 'lang': lang}
+        line = json.dumps(dict(entry, hash=key), ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            # 從上次的偏移量讀到文件末尾：自己的這一行和其他進程在此前後追加的行都會讀入
+            self._read_new()
+            self._entries[key] = entry
+            self._changed.notify_all()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def reconcile(self):
+        """
+        重新掃描音頻目錄：加入清單中沒有的文件，刪除已不存在或為空的文件的記錄，然後重寫清單
+
+        原有記錄的原文和語言保留；返回 {'files', 'added', 'removed'}
+        """
+        found = {}
+        with os.scandir(self.audio_dir) as entries:
+            for entry in entries:
+                name, ext = os.path.splitext(entry.name)
+                if ext != '.mp3' or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if stat.st_size > 0:
+                    found[name] = (stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._read_new()
+            old = self._entries
+            entries = {}
+            for key, (size, mtime) in found.items():
+                entry = dict(old.get(key) or {'created': mtime, 'text': '', 'lang': ''})
+                entry['size'] = size
+                entries[key] = entry
+            temp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                for key, entry in entries.items():
+                    f.write(json.dumps(dict(entry, hash=key), ensure_ascii=False) + '\n')
+                offset = f.tell()
+                inode = os.fstat(f.fileno()).st_ino
+            os.replace(temp_path, self.path)
+            self._entries = entries
+            self._offset = offset
+            self._inode = inode
+            self._changed.notify_all()
+        return {
+            'files': len(entries),
+            'added': len(entries.keys() - old.keys()),
+            'removed': len(old.keys() - entries.keys())
+        }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'reconcile':
+        print(__doc__)
+        sys.exit(1)
+    audio_dir = sys.argv[2] if len(sys.argv) > 2 else AUDIO_DIR
+    result = AudioManifest(audio_dir).reconcile()
+    print(f"✓ {audio_dir}: {result['files']} 個音頻，新增 {result['added']} 條、刪除 {result['removed']} 條記錄")
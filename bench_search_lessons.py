@@ -0,0 +1,99 @@
+"""
+課程搜索基準測試 - 比較逐個課程子串匹配（舊實現）和 n-gram 倒排索引（LessonRegistry.search）
+
+用法:
+    python bench_search_lessons.py [每種規模的查詢次數]
+"""
+import os
+import random
+import sys
+import time
+
+LESSONS = 200
+SIZES = [1000, 10000, 100000]
+# 用來生成隨機詞語和句子的漢字（大致相當於常用字表的規模）
+CHARS = [chr(0x4e00 + i) for i in range(3000)]
+
+
+def build_data(size, rng):
+    """size 個條目分到 200 個新格式課程：一半詞語（帶英文釋義），一半句子"""
+    data = {}
+    per_lesson = size // LESSONS
+    for n in range(LESSONS):
+        words = [{
+            'word': ''.join(rng.choice(CHARS) for _ in range(2)),
+            'meaning': rng.choice(['city', 'river', 'mountain', 'weather', 'family', 'school']) + f' {i}',
+            'attempts': 0
+        } for i in range(per_lesson // 2)]
+        sentences = [{
+            'sentence': ''.join(rng.choice(CHARS) for _ in range(12)) + '。',
+            'attempts': 0
+        } for _ in range(per_lesson - per_lesson // 2)]
+        data[f'課程{n}'] = {
+            '詞語': words,
+            '段落': [{
+                'id': str(p),
+                'title': f'段落{p}',
+                'sentences': sentences[p * 10:(p + 1) * 10]
+            } for p in range((len(sentences) + 9) // 10)]
+        }
+    return data
+
+
+def scan_search(registry, keyword):
+    """舊實現：逐個課程、逐條文本小寫後做子串匹配"""
+    return [lesson.summary() for lesson in registry
+            if any(keyword in text.lower() for _, text in lesson.search_texts())]
+
+
+def percentiles(samples):
+    """返回 (p50, p99)，單位微秒"""
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1e6, samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+
+
+def timed(func, keywords):
+    samples = []
+    for keyword in keywords:
+        start = time.perf_counter()
+        func(keyword)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    queries = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from vocab_model import LessonRegistry
+
+    print(f"[BENCH] {queries} queries per size, {LESSONS} lessons")
+    print(f"{'items':>7} {'build ms':>9} | {'scan p50':>9} {'scan p99':>9} "
+          f"{'index p50':>9} {'index p99':>9} {'limit10 p50':>11} (µs)")
+    for size in SIZES:
+        rng = random.Random(size)
+        data = build_data(size, rng)
+        registry = LessonRegistry(data)
+        # 關鍵字：從句子和詞語中截取 2-4 個字，另有少量英文和不存在的字
+        texts = [text for lesson in registry for _, text in lesson.search_texts()]
+        keywords = []
+        for _ in range(queries):
+            text = rng.choice(texts)
+            start = rng.randrange(max(1, len(text) - 1))
+            keywords.append(text[start:start + rng.randint(2, 4)])
+        keywords += ['river', '龍鳳'] * (queries // 20)
+
+        start = time.perf_counter()
+        registry.search('')
+        build_ms = (time.perf_counter() - start) * 1000
+
+        scan = timed(lambda keyword: scan_search(registry, keyword), keywords)
+        index = timed(registry.search, keywords)
+        limited = timed(lambda keyword: registry.search(keyword, 10), keywords)
+        print(f"{size:>7} {build_ms:>9.1f} | {scan[0]:>9.1f} {scan[1]:>9.1f} "
+              f"{index[0]:>9.1f} {index[1]:>9.1f} {limited[0]:>11.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+答題定位基準測試 - 比較 record_attempt 在不同規模數據下的延遲：
+按順序遍歷查找（舊實現）和哈希索引查找（vocab_model.LessonRegistry）
+
+用法:
+    python bench_submit_answer.py [每種規模的答題次數]
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+LESSONS = 10
+SIZES = [100, 1000, 10000, 100000]
+
+
+def build_data(size):
+    """size 個條目平均分到 10 個新格式課程：一半詞語，一半句子（每段 10 句）"""
+    data = {}
+    per_lesson = size // LESSONS
+    for n in range(LESSONS):
+        words = [{
+            'word': f'詞{n}-{i}',
+            'meaning': '',
+            'attempts': 0,
+            'correct': 0,
+            'incorrect': 0,
+            'history': []
+        } for i in range(per_lesson // 2)]
+        sentences = [{
+            'sentence': f'第{n}課第{i}句。',
+            'attempts': 0,
+            'correct': 0,
+            'incorrect': 0,
+            'history': []
+        } for i in range(per_lesson - per_lesson // 2)]
+        data[f'課程{n}'] = {
+            '詞語': words,
+            '段落': [{
+                'id': str(p),
+                'title': f'段落{p}',
+                'sentences': sentences[p * 10:(p + 1) * 10],
+                'attempts': 0,
+                'correct': 0,
+                'incorrect': 0,
+                'history': []
+            } for p in range((len(sentences) + 9) // 10)]
+        }
+    return data
+
+
+def linear_find_word(data, word):
+    """舊實現：/submit_answer 的「所有未掌握單詞」按順序遍歷所有課程查找詞語"""
+    for lesson_name, lesson_content in data.items():
+        if isinstance(lesson_content, dict) and '詞語' in lesson_content:
+            for item in lesson_content['詞語']:
+                if item.get('word') == word:
+                    return lesson_name
+    return None
+
+
+def linear_apply(data, record, normalize_text):
+    """舊實現：在課程中按順序遍歷詞語或所有段落的句子"""
+    content = data.get(record['lesson'])
+    if record['content_type'] == '詞語':
+        for item in content['詞語']:
+            if item.get('word') == record['item']:
+                item['attempts'] = item.get('attempts', 0) + 1
+                return True
+        return False
+    target = normalize_text(record['item'])
+    for para in content['段落']:
+        for sent in para.get('sentences', []):
+            if normalize_text(sent.get('sentence', '')) == target:
+                sent['attempts'] = sent.get('attempts', 0) + 1
+                para['attempts'] = para.get('attempts', 0) + 1
+                return True
+    return False
+
+
+def percentiles(samples):
+    """返回 (p50, p99)，單位微秒"""
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return p50 * 1e6, p99 * 1e6
+
+
+def timed(func, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def main():
+    answers = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from data_store import DataStore
+    from vocab_model import LessonRegistry, normalize_text
+
+    work_dir = tempfile.mkdtemp(prefix='vocab_bench_')
+    try:
+        print(f"[BENCH] {answers} answers per size, {LESSONS} lessons")
+        print(f"{'items':>7} {'build ms':>9} | {'kind':<7} {'scan p50':>9} {'scan p99':>9} "
+              f"{'index p50':>9} {'index p99':>9} {'record p50':>9} {'record p99':>9} (µs)")
+        for size in SIZES:
+            data = build_data(size)
+            rng = random.Random(size)
+            records = []
+            for _ in range(answers):
+                lesson = f'課程{rng.randrange(LESSONS)}'
+                content = data[lesson]
+                if rng.random() < 0.5:
+                    item = rng.choice(content['詞語'])['word']
+                    content_type = '詞語'
+                else:
+                    para = rng.choice(content['段落'])
+                    item = rng.choice(para['sentences'])['sentence']
+                    content_type = '段落'
+                records.append({'timestamp': '', 'language': '', 'lesson': lesson,
+                                'content_type': content_type, 'item': item, 'known': True})
+            words = [r for r in records if r['content_type'] == '詞語']
+            sentences = [r for r in records if r['content_type'] == '段落']
+
+            # 索引構建：課程表 + 每個課程的條目索引 + 全局詞語索引
+            start = time.perf_counter()
+            registry = LessonRegistry(data)
+            for lesson in registry:
+                lesson.find_word(None)
+            registry.find_word(None)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            # 舊實現的查找（只計查找和累加，不含寫日誌）
+            scan = {
+                '詞語': timed(linear_apply, [(data, r, normalize_text) for r in words]),
+                '段落': timed(linear_apply, [(data, r, normalize_text) for r in sentences]),
+                '未掌握詞語': timed(linear_find_word, [(data, r['item']) for r in words]),
+            }
+
+            # 索引查找
+            index = {
+                '詞語': timed(registry.apply_attempt, [(r,) for r in words]),
+                '段落': timed(registry.apply_attempt, [(r,) for r in sentences]),
+                '未掌握詞語': timed(registry.find_word, [(r['item'],) for r in words]),
+            }
+
+            # 完整的 DataStore.record_attempt（索引查找 + 日誌追加）
+            path = os.path.join(work_dir, f'data_{size}.json')
+            store = DataStore(path, compact_every=10 ** 9)
+            store.save(data)
+            store.registry()
+            full = {
+                '詞語': timed(store.record_attempt, [('', r['lesson'], '詞語', r['item'], True) for r in words]),
+                '段落': timed(store.record_attempt, [('', r['lesson'], '段落', r['item'], True) for r in sentences]),
+            }
+            store.close()
+
+            for n, kind in enumerate(scan):
+                label = f"{size:>7} {build_ms:>9.1f}" if n == 0 else f"{'':>7} {'':>9}"
+                row = (f"{label} | {kind:<7} {scan[kind][0]:>9.1f} {scan[kind][1]:>9.1f} "
+                       f"{index[kind][0]:>9.1f} {index[kind][1]:>9.1f}")
+                if kind in full:
+                    row += f" {full[kind][0]:>9.1f} {full[kind][1]:>9.1f}"
+                print(row)
+        print("[BENCH] scan/index 只計內存查找和累加；record 為完整的 record_attempt（含日誌追加）")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
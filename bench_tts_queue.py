@@ -0,0 +1,69 @@
+"""
+TTS 隊列基準測試 - 用本地引擎（tts_backends.LocalBackend，不需要網絡）測量音頻生成隊列：
+不同線程數下的吞吐量、注入失敗後的重試和死信，以及第二輪提交時清單緩存的命中
+
+用法:
+    python bench_tts_queue.py [文本數] [每次生成延遲秒數] [失敗率]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+WORKERS = [1, 4, 8]
+RATE = 50
+BURST = 10
+RETRIES = 3
+
+
+def run(texts, workers, latency, failure_rate, work_dir):
+    """在新的隊列、清單和音頻目錄中生成 texts 兩輪，返回兩輪的耗時和線程池統計"""
+    from audio_manifest import AudioManifest
+    from tts_backends import LocalBackend
+    from tts_service import TokenBucket, TTSJobQueue, TTSWorkerPool
+
+    audio_dir = os.path.join(work_dir, f'audio_{workers}')
+    os.makedirs(audio_dir)
+    queue = TTSJobQueue(os.path.join(work_dir, f'queue_{workers}.db'), max_retries=RETRIES, retry_delay=0.01)
+    backend = LocalBackend(latency=latency, failure_rate=failure_rate, seed=workers)
+    pool = TTSWorkerPool(backend, queue, workers=workers, limiter=TokenBucket(rate=RATE, burst=BURST),
+                         manifest=AudioManifest(audio_dir))
+    pool.start()
+    elapsed = []
+    for _ in range(2):
+        start = time.perf_counter()
+        for n, text in enumerate(texts):
+            pool.submit(text, os.path.join(audio_dir, f'{n}.mp3'))
+        pool.join()
+        elapsed.append(time.perf_counter() - start)
+    return elapsed, pool.stats(), backend.calls
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    texts = [f'第{n}個測試句子。' for n in range(count)]
+
+    work_dir = tempfile.mkdtemp(prefix='vocab_bench_tts_')
+    try:
+        print(f"[BENCH] {count} texts, latency {latency}s, failure rate {failure_rate:.0%}, "
+              f"rate limit {RATE}/s burst {BURST}, {RETRIES} attempts")
+        print(f"{'workers':>7} {'run s':>7} {'texts/s':>8} {'calls':>6} {'failed':>6} {'dead':>5} "
+              f"{'limit wait s':>12} | {'cached run s':>12} {'cached':>6}")
+        for workers in WORKERS:
+            (first, second), stats, calls = run(texts, workers, latency, failure_rate, work_dir)
+            print(f"{workers:>7} {first:>7.2f} {count / first:>8.1f} {calls:>6} {stats['failed']:>6} "
+                  f"{stats['dead_letters']:>5} {stats['rate_limit_wait_s']:>12.2f} | "
+                  f"{second:>12.3f} {stats['cached']:>6}")
+        print("[BENCH] calls 含失敗重試；第二輪提交相同文本，已生成的音頻由清單判斷，不再調用引擎")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1550 @@
+"""
+詞彙數據存儲層 - 在進程內緩存解析後的 vocabulary_data.json，只在文件變化時重新解析
+
+答題記錄以追加方式寫入日誌文件 (vocabulary_data.json.journal)，不再每次重寫整個 JSON；
+日誌累積到一定條數後合併 (compact) 回主文件。
+
+SQLiteDataStore 提供同樣的 load/save/record_attempt 接口，統計和搜索改為 SQL 查詢。
+ShardedDataStore 把每個課程存為單獨的文件，保存一個課程只重寫這個課程。
+
+多個 worker 進程共用同一份數據時，用 fcntl 文件鎖保護讀-改-寫，避免互相覆蓋答題記錄。
+"""
+
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+
+from vocab_model import Lesson, LessonRegistry, compute_lesson_stats, decode_cursor, encode_cursor, normalize_text
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 沒有 fcntl：只能保證單進程內的互斥
+    fcntl = None
+
+# DataStore 的持久化級別，見 DataStore 的說明
+DURABILITY_MODES = ('sync', 'batched', 'interval')
+
+
+def _iter_entries(data):
+    """遍歷數據樹的所有條目（包括非標準內容），產生 (語言, 名稱, 內容)，用於整樹保存"""
+    for key, value in data.items():
+        if isinstance(value, dict) and not ('詞語' in value or '段落' in value):
+            # 舊格式：語言 -> 課程
+            for lesson_num, lesson_content in value.items():
+                yield key, lesson_num, lesson_content
+        else:
+            yield '', key, value
+
+
+def _set_entry(data, language, lesson, content):
+    if language:
+        data.setdefault(language, {})[lesson] = content
+    else:
+        data[lesson] = content
+
+
+def _remove_entry(data, language, lesson):
+    """從數據樹刪除課程；舊格式的語言下沒有課程時一併刪除語言"""
+    if not language:
+        return data.pop(lesson, None) is not None
+    lessons = data.get(language)
+    if not isinstance(lessons, dict) or lesson not in lessons:
+        return False
+    del lessons[lesson]
+    if not lessons:
+        del data[language]
+    return True
+
+
+def attempt_record(language, lesson, content_type, item, known, timestamp=None):
+    """一條答題記錄（日誌中的格式）；沒有時間戳時用當前時間"""
+    return {
+        'timestamp': timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'language': language,
+        'lesson': lesson,
+        'content_type': content_type,
+        'item': item,
+        'known': known
+    }
+
+
+def _sql_lower(text):
+    """SQLite 自定義函數 py_lower：Python 的 str.lower()，非文本返回 NULL"""
+    return text.lower() if isinstance(text, str) else None
+
+
+class _TreeQueries:
+    """基於規範化課程表的查詢（子類提供 load()/load_lesson()，並在課程增刪改時維護課程表）"""
+
+    _registry = None
+    _registry_tree = None
+
+    def registry(self):
+        """當前數據的課程表；數據樹被重新解析或整樹保存後重建一次"""
+        with self._lock:
+            return self._registry_for(self.load())
+
+    def _registry_for(self, data):
+        if self._registry is None or self._registry_tree is not data:
+            self._registry = LessonRegistry(data)
+            self._registry_tree = data
+        return self._registry
+
+    def _registry_set(self, data, language, lesson, content):
+        """
+        單個課程保存到數據樹 data 後更新課程表：已有課程替換內容，新課程按它在數據樹中的位置加入；
+        課程表不是由 data 構建或新課程的位置無法確定時，下次使用時重建
+        """
+        if self._registry is None:
+            return
+        if self._registry_tree is not data or not self._registry.set_lesson(language, lesson, content, data):
+            self._registry = None
+
+    def _registry_remove(self, language, lesson):
+        if self._registry is not None:
+            self._registry.remove_lesson(language, lesson)
+
+    def record_attempt(self, language, lesson, content_type, item, known, timestamp=None):
+        """記錄一次答題，找不到內容時返回 False"""
+        return self.record_attempts([attempt_record(language, lesson, content_type, item, known, timestamp)])[0]
+
+    def unmastered_words(self, **filters):
+        """所有未掌握的詞語（按正確率從低到高），filters 見 LessonRegistry._unmastered_entries"""
+        return self.registry().unmastered_words(**filters)
+
+    def unmastered_page(self, limit, cursor=None, **filters):
+        """一頁未掌握的詞語（keyset 分頁），游標格式錯誤時拋出 ValueError"""
+        return self.registry().unmastered_page(limit, cursor, **filters)
+
+    def unmastered_count(self, **filters):
+        """符合條件的未掌握詞語數"""
+        return self.registry().unmastered_count(**filters)
+
+    def word_mastery_counts(self):
+        """詞語總數 / 已掌握 / 未掌握"""
+        return self.registry().word_mastery_counts()
+
+    def lesson_unmastered_counts(self):
+        """每個課程的未掌握詞語數"""
+        return self.registry().lesson_unmastered_counts()
+
+    def lesson_listing(self):
+        """課程列表摘要（不含課程內容），每個數據版本只生成一次"""
+        return self.registry().listing()
+
+    def data_version(self):
+        """整個數據的 (版本號, 修改時間)，任何課程改變後版本號變大"""
+        registry = self.registry()
+        return registry.version, registry.modified
+
+    def lesson_version(self, language, lesson):
+        """單個課程的 (版本號, 修改時間)，課程不存在時返回 None"""
+        found = self.registry().get(language, lesson)
+        return (found.version, found.modified) if found is not None else None
+
+    def lesson_stats(self, language, lesson):
+        """單個課程的掌握統計，課程不存在時返回 None"""
+        content = self.load_lesson(language, lesson)
+        return compute_lesson_stats(content) if content is not None else None
+
+    def search_lessons(self, keyword, limit=None):
+        """按標題和內容搜索課程（n-gram 倒排索引），最多返回 limit 個"""
+        return self.registry().search(keyword, limit)
+
+
+class FileLock:
+    """
+    跨進程文件鎖（fcntl.flock），同一進程內可重入
+
+    調用方必須已經持有所屬存儲的線程鎖；fork 之後會在子進程中重新打開鎖文件，
+    避免父子進程共用同一個文件描述符而失去互斥。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+        self._shared = False
+        self.acquired = 0
+        self.wait_time = 0.0
+
+    @contextmanager
+    def __call__(self, shared=False):
+        if self._depth == 0:
+            if fcntl is not None:
+                if self._fd is None or self._pid != os.getpid():
+                    self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                    self._pid = os.getpid()
+                start = time.perf_counter()
+                fcntl.flock(self._fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                self.wait_time += time.perf_counter() - start
+            self._shared = shared
+            self.acquired += 1
+        elif self._shared and not shared:
+            raise RuntimeError('cannot upgrade a shared file lock to exclusive')
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0 and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def stats(self):
+        return {
+            'lock_file': self.path,
+            'acquired': self.acquired,
+            'wait_ms': round(self.wait_time * 1000, 1),
+            'cross_process': fcntl is not None
+        }
+
+
+def _snapshot_id(raw):
+    """主文件內容的標識（CRC32 + 長度），日誌頭用它判斷日誌是否屬於當前主文件"""
+    return f"{zlib.crc32(raw):08x}-{len(raw)}"
+
+
+def _write_atomic(path, raw, fsync=True):
+    """原子地寫入文件：先寫臨時文件（按需 fsync），再 rename 覆蓋"""
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(raw)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class DataStore(_TreeQueries):
+    """
+    JSON 文件數據存儲
+
+    load() 返回內存中共享的數據樹，每次只用一次 os.stat() 校驗文件簽名
+    (mtime/ctime/size/inode)，文件確實改變（例如被其他進程或手動編輯）時才重新解析。
+    日誌文件只增長時，只重放新增的尾部記錄。
+
+    讀取持有共享文件鎖，寫入（記錄答題、保存、合併）持有排他文件鎖並先追上其他進程的寫入，
+    所以多個 worker 同時答題不會丟失記錄。完整的讀-改-寫要放在 locked() 裡。
+
+    durability 決定寫入何時落盤：
+      sync      save() 立即重寫文件，答題立即追加日誌，合併在請求內進行（默認）
+      batched   save() 只標記為髒，由後台線程每 flush_interval 秒最多寫一次；答題仍立即追加日誌，
+                日誌的 fsync 和合併也交給後台線程。崩潰最多丟失最近一個間隔內的課程修改
+      interval  答題記錄也先留在內存，後台線程每個間隔批量追加並 fsync 一次。
+                崩潰最多丟失最近一個間隔內的所有修改
+    batched/interval 下未寫回的修改其他進程看不到，只適合單個寫入進程；多 worker 部署請用 sync。
+    """
+
+    def __init__(self, data_file='vocabulary_data.json', journal=True, fsync=False, compact_every=200,
+                 durability='sync', flush_interval=0.5):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"unknown durability mode: {durability!r} (expected one of {DURABILITY_MODES})")
+        self.data_file = data_file
+        self.journal_file = data_file + '.journal' if journal else None
+        self.fsync = fsync
+        self.compact_every = compact_every
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(data_file + '.lock')
+        self._data = None
+        self._signature = None
+        self._snapshot_id = ''
+        # 日誌狀態：inode、已看到的大小、已消費到的偏移、是否屬於當前主文件
+        self._journal_ino = None
+        self._journal_size = 0
+        self._journal_offset = 0
+        self._journal_valid = False
+        # 數據版本號：每次重新解析、保存或記錄答題都遞增
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.journal_records = 0
+        self.replayed = 0
+        self.compactions = 0
+        # 寫回狀態：內存數據比主文件新、尚未寫入日誌的記錄、已寫入但未 fsync 的日誌
+        self._dirty = False
+        self._pending = []
+        self._unsynced = False
+        self._flusher = None
+        self._flusher_pid = None
+        self._stop = threading.Event()
+        self._closing = False
+        self.deferred_saves = 0
+        self.snapshot_writes = 0
+        self.snapshot_time = 0.0
+        self.flushes = 0
+        self.flush_time = 0.0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+
+    def _file_signature(self):
+        """返回文件簽名，文件不存在時返回 None"""
+        try:
+            st = os.stat(self.data_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+
+    def _journal_stat(self):
+        """返回日誌文件的 (inode, size)，不存在時返回 None"""
+        if self.journal_file is None:
+            return None
+        try:
+            st = os.stat(self.journal_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size)
+
+    @contextmanager
+    def locked(self):
+        """在排他鎖內完成讀-改-寫：期間 load() 返回最新數據，其他線程和進程的寫入都會等待"""
+        with self._lock, self._file_lock():
+            yield
+
+    def load(self):
+        """載入數據樹（共享對象，修改後必須調用 save() 持久化）"""
+        with self._lock, self._file_lock(shared=True):
+            if self._dirty:
+                # 內存中有尚未寫回的修改，比主文件新：只追上其他進程追加的日誌
+                journal = self._journal_stat()
+                if journal is not None and journal[0] == self._journal_ino and journal[1] > self._journal_size:
+                    if self._replay_journal(self._journal_offset):
+                        self.version += 1
+                self.hits += 1
+                return self._data
+
+            signature = self._file_signature()
+            if self._data is not None and signature == self._signature:
+                journal = self._journal_stat()
+                seen = (self._journal_ino, self._journal_size) if self._journal_ino is not None else None
+                if journal == seen:
+                    self.hits += 1
+                    return self._data
+                if journal is not None and seen is not None and journal[0] == seen[0] and journal[1] > seen[1]:
+                    # 日誌只是被追加（例如其他進程答題）：只重放尾部
+                    self.hits += 1
+                    if self._replay_journal(self._journal_offset):
+                        self.version += 1
+                    return self._data
+
+            self.misses += 1
+            self._read_snapshot()
+            if self.journal_file is not None:
+                self._replay_journal(0)
+            # 還沒寫入日誌的答題記錄重新應用到新解析的數據上
+            registry = self._registry_for(self._data)
+            for record in self._pending:
+                registry.apply_attempt(record)
+            self.version += 1
+            return self._data
+
+    def _read_snapshot(self):
+        """解析主文件"""
+        try:
+            f = open(self.data_file, 'rb')
+        except FileNotFoundError:
+            self._data = {}
+            self._signature = None
+            self._snapshot_id = ''
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            raw = f.read()
+        self._data = json.loads(raw.decode('utf-8'))
+        self._signature = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+        self._snapshot_id = _snapshot_id(raw)
+
+    def _replay_journal(self, start):
+        """從 start 偏移重放日誌中的完整記錄，返回應用成功的條數"""
+        if start == 0:
+            self._journal_valid = False
+            self.journal_records = 0
+        try:
+            f = open(self.journal_file, 'rb')
+        except FileNotFoundError:
+            self._journal_ino = None
+            self._journal_size = self._journal_offset = 0
+            return 0
+        with f:
+            st = os.fstat(f.fileno())
+            f.seek(start)
+            chunk = f.read()
+
+        # 只消費以換行結尾的完整記錄，崩潰時寫了一半的尾行留到下次追加前截斷
+        end = chunk.rfind(b'\n') + 1
+        self._journal_ino = st.st_ino
+        self._journal_size = start + len(chunk)
+        self._journal_offset = start + end
+
+        applied = 0
+        registry = self._registry_for(self._data)
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                print(f"[STORE] ⚠ Skipping corrupt journal line: {line[:80]!r}")
+                continue
+            if 'snapshot' in record:
+                # 日誌頭：只有屬於當前主文件的日誌才需要重放，否則已經合併過了
+                self._journal_valid = record['snapshot'] == self._snapshot_id
+                continue
+            if not self._journal_valid:
+                continue
+            self.journal_records += 1
+            if registry.apply_attempt(record):
+                applied += 1
+            else:
+                print(f"[STORE] ⚠ Journal record no longer matches any item: {record.get('lesson')}/{record.get('item')}")
+        self.replayed += applied
+        return applied
+
+    def _write_snapshot(self, data):
+        """原子地寫入主文件：先寫臨時文件並 fsync，再 rename 覆蓋"""
+        raw = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        _write_atomic(self.data_file, raw)
+        self._signature = self._file_signature()
+        self._snapshot_id = _snapshot_id(raw)
+
+    def _reset_journal(self):
+        """用指向當前主文件的日誌頭替換日誌文件"""
+        header = (json.dumps({'snapshot': self._snapshot_id}) + '\n').encode('utf-8')
+        _write_atomic(self.journal_file, header, self.fsync)
+        self._journal_ino = os.stat(self.journal_file).st_ino
+        self._journal_size = self._journal_offset = len(header)
+        self._journal_valid = True
+        self.journal_records = 0
+
+    def _append_journal(self, records, fsync=None):
+        """追加答題記錄到日誌（一次寫入）"""
+        fsync = self.fsync if fsync is None else fsync
+        line = b''.join((json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8') for record in records)
+        if not self._journal_valid or self._journal_ino is None:
+            self._reset_journal()
+        elif self._journal_size != self._journal_offset:
+            # 上次崩潰留下的半行記錄
+            with open(self.journal_file, 'r+b') as f:
+                f.truncate(self._journal_offset)
+        with open(self.journal_file, 'ab') as f:
+            f.write(line)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        self._journal_offset += len(line)
+        self._journal_size = self._journal_offset
+        self.journal_records += len(records)
+        self._unsynced = not fsync
+
+    def save(self, data):
+        """保存完整數據樹並更新緩存；非 sync 模式下只標記為髒，由後台線程寫回"""
+        with self._lock:
+            self._registry = None
+            self._save_tree(data)
+
+    def _save_tree(self, data):
+        with self._lock:
+            if self.durability == 'sync' or self._closing:
+                self._save_now(data)
+                return
+            self._data = data
+            self._dirty = True
+            # 快照會包含所有已應用的記錄
+            self._pending = []
+            self.version += 1
+            self.deferred_saves += 1
+            self._start_flusher()
+
+    def _save_now(self, data):
+        """立即寫入主文件（同時把日誌合併進主文件）"""
+        with self._lock, self._file_lock():
+            start = time.perf_counter()
+            self._write_snapshot(data)
+            self._data = data
+            if self.journal_file is not None:
+                self._reset_journal()
+            self._dirty = False
+            self._pending = []
+            self._unsynced = False
+            self.version += 1
+            self.snapshot_writes += 1
+            self.snapshot_time += time.perf_counter() - start
+
+    def record_attempts(self, records):
+        """
+        批量記錄答題（attempt_record() 的格式）：更新內存數據，所有記錄一次追加到日誌
+
+        返回每條記錄是否找到了內容
+        """
+        with self._lock, self._file_lock():
+            # 持有排他鎖後重新校驗，先重放其他進程追加的記錄再追加自己的
+            data = self.load()
+            registry = self._registry_for(data)
+            results = [registry.apply_attempt(record) for record in records]
+            applied = [record for record, ok in zip(records, results) if ok]
+            if not applied:
+                return results
+            if self.journal_file is None:
+                self._save_tree(data)
+                return results
+            if self.durability == 'interval' and not self._closing:
+                self._pending.extend(applied)
+            else:
+                self._append_journal(applied)
+            self.version += 1
+            if self.durability == 'sync':
+                if self.journal_records >= self.compact_every:
+                    self.compact()
+            else:
+                # fsync 和合併交給後台線程
+                self._start_flusher()
+            return results
+
+    def compact(self):
+        """把日誌合併進主文件"""
+        with self._lock, self._file_lock():
+            self._save_now(self.load())
+            self.compactions += 1
+
+    def _start_flusher(self):
+        """按需啟動後台寫回線程（fork 之後在子進程中重新啟動）"""
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            return
+        if self._flusher_pid is None:
+            # 進程退出前寫回所有修改
+            atexit.register(self.close)
+        self._flusher_pid = os.getpid()
+        self._stop.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name='DataStoreFlusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[STORE] ⚠ Background flush failed: {e}")
+
+    def flush(self):
+        """把尚未落盤的修改寫回：髒數據或日誌過長時重寫主文件，否則批量追加日誌並 fsync；沒有可寫的內容時返回 False"""
+        with self._lock:
+            compact_due = self.journal_records + len(self._pending) >= self.compact_every
+            if not (self._dirty or self._pending or self._unsynced or compact_due):
+                return False
+            with self._file_lock():
+                start = time.perf_counter()
+                if self._dirty and self._file_signature() != self._signature:
+                    print(f"[STORE] ⚠ {self.data_file} was changed by another process; "
+                          f"overwriting it with unsaved in-memory data")
+                # load() 先追上其他進程的寫入（髒數據時只重放它們的日誌）
+                data = self.load()
+                if self._dirty or compact_due:
+                    self._save_now(data)
+                    if compact_due:
+                        self.compactions += 1
+                elif self._pending:
+                    records, self._pending = self._pending, []
+                    self._append_journal(records, fsync=True)
+                else:
+                    with open(self.journal_file, 'rb') as f:
+                        os.fsync(f.fileno())
+                    self._unsynced = False
+                elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flush_time += elapsed_ms
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            return True
+
+    def close(self):
+        """停止後台線程並寫回所有修改（進程退出時自動調用）"""
+        with self._lock:
+            self._closing = True
+        self._stop.set()
+        if self._flusher is not None and self._flusher_pid == os.getpid():
+            self._flusher.join()
+        self.flush()
+
+    def load_lesson(self, language, lesson):
+        """載入單個課程（共享對象）；不存在時返回 None"""
+        found = self.registry().get(language, lesson)
+        return found.content if found is not None else None
+
+    def save_lesson(self, language, lesson, content):
+        """保存（新建或替換）單個課程；單文件格式下仍需重寫整個文件"""
+        with self.locked():
+            data = self.load()
+            _set_entry(data, language, lesson, content)
+            self._save_tree(data)
+            self._registry_set(data, language or '', lesson, content)
+
+    def delete_lesson(self, language, lesson):
+        """刪除單個課程，不存在時返回 False"""
+        with self.locked():
+            data = self.load()
+            if not _remove_entry(data, language, lesson):
+                return False
+            self._save_tree(data)
+            self._registry_remove(language or '', lesson)
+            return True
+
+    def invalidate(self):
+        """丟棄緩存，下一次 load() 強制重新解析（先寫回尚未落盤的修改）"""
+        self.flush()
+        with self._lock:
+            self._data = None
+            self._signature = None
+
+    def flush_stats(self):
+        """寫回統計：主文件重寫次數和耗時、後台寫回次數和耗時、待寫回的修改"""
+        with self._lock:
+            return {
+                'durability': self.durability,
+                'interval_ms': round(self.flush_interval * 1000),
+                'dirty': self._dirty,
+                'pending_records': len(self._pending),
+                'deferred_saves': self.deferred_saves,
+                'snapshot_writes': self.snapshot_writes,
+                'snapshot_ms': round(self.snapshot_time * 1000, 1),
+                'flushes': self.flushes,
+                'flush_ms': round(self.flush_time, 1),
+                'avg_flush_ms': round(self.flush_time / self.flushes, 2) if self.flushes else 0,
+                'last_flush_ms': round(self.last_flush_ms, 2),
+                'max_flush_ms': round(self.max_flush_ms, 2)
+            }
+
+    def stats(self):
+        """返回緩存命中和日誌統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'json',
+                'data_file': self.data_file,
+                'version': self.version,
+                'cached': self._data is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+                'journal_file': self.journal_file,
+                'journal_records': self.journal_records,
+                'journal_bytes': self._journal_size,
+                'replayed': self.replayed,
+                'compactions': self.compactions,
+                'flush': self.flush_stats(),
+                'lock': self._file_lock.stats()
+            }
+
+
+def _shard_file(language, lesson):
+    """課程分片的文件名：由 (語言, 課程) 的哈希決定，避免課程名中的特殊字符"""
+    return hashlib.md5(f'{language}\0{lesson}'.encode('utf-8')).hexdigest()[:16] + '.json'
+
+
+class ShardedDataStore(_TreeQueries):
+    """
+    分片 JSON 數據存儲 - 每個課程一個文件，外加一個小的清單文件 (manifest.json)
+
+        vocabulary_data/manifest.json        課程順序、語言、名稱、文件名、詞語/段落數、版本
+        vocabulary_data/lessons/<hash>.json  單個課程的內容
+
+    保存或刪除一個課程、記錄一次答題只重寫該課程的文件和清單；load_lesson() 只解析需要的課程。
+    清單中每個課程的版本號取自清單的全局版本，只增不減，所以其他進程改過哪些課程
+    只需比較清單即可知道，未改變的課程繼續使用緩存。load() 仍然返回兩種格式的完整數據樹。
+    """
+
+    def __init__(self, data_dir='vocabulary_data', fsync=True):
+        self.data_dir = data_dir
+        self.lesson_dir = os.path.join(data_dir, 'lessons')
+        self.manifest_file = os.path.join(data_dir, 'manifest.json')
+        os.makedirs(self.lesson_dir, exist_ok=True)
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(data_dir, '.lock'))
+        self._manifest = None
+        self._signature = None
+        # (語言, 課程) -> 清單條目；文件名 -> (版本, Lesson)
+        self._entries = {}
+        self._shards = {}
+        self._data = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.shard_reads = 0
+        self.shard_writes = 0
+        self.manifest_writes = 0
+
+    @contextmanager
+    def locked(self):
+        """在排他鎖內完成讀-改-寫"""
+        with self._lock, self._file_lock():
+            yield
+
+    def _refresh_manifest(self):
+        """清單文件改變時重新讀取；其他進程寫過時丟棄組裝好的數據樹（課程緩存按版本保留）"""
+        try:
+            st = os.stat(self.manifest_file)
+            signature = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+        except FileNotFoundError:
+            signature = None
+        if self._manifest is not None and signature == self._signature:
+            return
+        if signature is None:
+            manifest = {'version': 0, 'lessons': []}
+        else:
+            with open(self.manifest_file, 'rb') as f:
+                st = os.fstat(f.fileno())
+                manifest = json.loads(f.read().decode('utf-8'))
+            signature = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+        self._manifest = manifest
+        self._entries = {(e['language'], e['name']): e for e in manifest['lessons']}
+        self._signature = signature
+        self._data = None
+        # 已不在清單中的課程不再需要緩存
+        files = {e['file'] for e in manifest['lessons']}
+        for name in [name for name in self._shards if name not in files]:
+            del self._shards[name]
+
+    def _read_shard(self, entry):
+        """返回課程（Lesson），版本未變時直接用緩存"""
+        cached = self._shards.get(entry['file'])
+        if cached is not None and cached[0] == entry['version']:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        try:
+            with open(os.path.join(self.lesson_dir, entry['file']), 'rb') as f:
+                content = json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            print(f"[STORE] ⚠ Missing lesson file {entry['file']} for {entry['language']}/{entry['name']}")
+            return None
+        self.shard_reads += 1
+        lesson = Lesson(entry['language'], entry['name'], content)
+        self._shards[entry['file']] = (entry['version'], lesson)
+        return lesson
+
+    def _write_shard(self, entry, content, lesson=None):
+        """
+        寫入課程文件並更新清單條目（清單本身由調用方寫入）；內容未變時不寫文件
+
+        只更新了統計（結構不變）時傳入原來的 lesson，保留它的條目索引
+        """
+        raw = json.dumps(content, ensure_ascii=False, indent=2).encode('utf-8')
+        checksum = _snapshot_id(raw)
+        if entry.get('checksum') != checksum:
+            _write_atomic(os.path.join(self.lesson_dir, entry['file']), raw, self.fsync)
+            is_lesson = isinstance(content, dict)
+            entry['word_count'] = len(content.get('詞語', [])) if is_lesson else 0
+            entry['para_count'] = len(content.get('段落', [])) if is_lesson else 0
+            entry['checksum'] = checksum
+            entry['version'] = self._manifest['version'] + 1
+            self.shard_writes += 1
+        if lesson is None or lesson.content is not content:
+            lesson = Lesson(entry['language'], entry['name'], content)
+        self._shards[entry['file']] = (entry['version'], lesson)
+
+    def _write_manifest(self):
+        self._manifest['version'] += 1
+        raw = json.dumps(self._manifest, ensure_ascii=False, indent=2).encode('utf-8')
+        _write_atomic(self.manifest_file, raw, self.fsync)
+        st = os.stat(self.manifest_file)
+        self._signature = (st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino)
+        self.manifest_writes += 1
+        self.version += 1
+
+    def _entry(self, language, lesson):
+        """返回課程的清單條目，不存在時新建（不加入清單）"""
+        return self._entries.get((language, lesson)) or {
+            'language': language,
+            'name': lesson,
+            'file': _shard_file(language, lesson),
+            'version': 0
+        }
+
+    def load(self):
+        """組裝完整的數據樹（共享對象，修改後必須調用 save() 或 save_lesson() 持久化）"""
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_manifest()
+            if self._data is not None:
+                self.hits += 1
+                return self._data
+            data = {}
+            for entry in self._manifest['lessons']:
+                lesson = self._read_shard(entry)
+                if lesson is not None:
+                    _set_entry(data, entry['language'], entry['name'], lesson.content)
+            self._data = data
+            self.version += 1
+            return data
+
+    def load_lesson(self, language, lesson):
+        """只讀取單個課程（共享對象）；不存在時返回 None"""
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_manifest()
+            entry = self._entries.get((language or '', lesson))
+            found = self._read_shard(entry) if entry is not None else None
+            return found.content if found is not None and isinstance(found.content, dict) else None
+
+    def lesson_version(self, language, lesson):
+        """單個課程的 (版本號, 修改時間)：只讀取這個課程"""
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_manifest()
+            entry = self._entries.get((language or '', lesson))
+            found = self._read_shard(entry) if entry is not None else None
+            if found is None or not isinstance(found.content, dict):
+                return None
+            return found.version, found.modified
+
+    def lessons(self):
+        """清單中的課程列表（語言、名稱、詞語數、段落數、版本），不讀取課程文件"""
+        with self._lock, self._file_lock(shared=True):
+            self._refresh_manifest()
+            return [dict(e) for e in self._manifest['lessons']]
+
+    def save(self, data):
+        """保存完整數據樹：只重寫內容改變的課程文件，刪除不再存在的課程"""
+        with self._lock, self._file_lock():
+            self._refresh_manifest()
+            lessons = []
+            for language, name, content in _iter_entries(data):
+                entry = self._entry(language, name)
+                self._write_shard(entry, content)
+                lessons.append(entry)
+            kept = {e['file'] for e in lessons}
+            removed = [e for e in self._manifest['lessons'] if e['file'] not in kept]
+            self._manifest['lessons'] = lessons
+            self._entries = {(e['language'], e['name']): e for e in lessons}
+            self._write_manifest()
+            # 先寫清單再刪文件：中途崩潰只會留下多餘的文件
+            for entry in removed:
+                self._remove_shard(entry)
+            self._data = data
+            self._registry = None
+
+    def _remove_shard(self, entry):
+        self._shards.pop(entry['file'], None)
+        try:
+            os.remove(os.path.join(self.lesson_dir, entry['file']))
+        except FileNotFoundError:
+            pass
+
+    def save_lesson(self, language, lesson, content):
+        """保存（新建或替換）單個課程：只寫這個課程的文件和清單"""
+        language = language or ''
+        with self._lock, self._file_lock():
+            self._refresh_manifest()
+            entry = self._entry(language, lesson)
+            if (language, lesson) not in self._entries:
+                self._manifest['lessons'].append(entry)
+                self._entries[(language, lesson)] = entry
+            self._write_shard(entry, content)
+            self._write_manifest()
+            if self._data is not None:
+                _set_entry(self._data, language, lesson, content)
+                self._registry_set(self._data, language, lesson, content)
+
+    def delete_lesson(self, language, lesson):
+        """刪除單個課程，不存在時返回 False"""
+        language = language or ''
+        with self._lock, self._file_lock():
+            self._refresh_manifest()
+            entry = self._entries.pop((language, lesson), None)
+            if entry is None:
+                return False
+            self._manifest['lessons'].remove(entry)
+            self._write_manifest()
+            self._remove_shard(entry)
+            if self._data is not None:
+                _remove_entry(self._data, language, lesson)
+                self._registry_remove(language, lesson)
+            return True
+
+    def record_attempts(self, records):
+        """批量記錄答題：每個涉及的課程文件只重寫一次，清單只寫一次；返回每條記錄是否找到了內容"""
+        with self._lock, self._file_lock():
+            self._refresh_manifest()
+            registry = None
+            if self._registry is not None and self._data is not None and self._registry_tree is self._data:
+                registry = self._registry
+            results = []
+            touched = {}
+            for record in records:
+                key = (record.get('language') or '', record['lesson'])
+                entry = self._entries.get(key)
+                found = self._read_shard(entry) if entry is not None else None
+                if found is None or not isinstance(found.content, dict):
+                    results.append(False)
+                    continue
+                registered = registry.get(*key) if registry is not None else None
+                if registered is not None and registered.content is found.content:
+                    # 課程表和分片緩存引用同一份內容：通過課程表記錄，它的掌握計數和版本號才保持正確
+                    found = registered
+                    applied = registry.apply_attempt(record)
+                else:
+                    applied = found.apply_attempt(record)
+                results.append(applied)
+                if applied:
+                    touched[entry['file']] = (entry, found)
+            for entry, found in touched.values():
+                self._write_shard(entry, found.content, found)
+            if touched:
+                self._write_manifest()
+            return results
+
+    def compact(self):
+        """分片存儲沒有日誌需要合併"""
+
+    def invalidate(self):
+        """丟棄所有緩存，下一次讀取時重新解析清單和課程文件"""
+        with self._lock:
+            self._manifest = None
+            self._signature = None
+            self._entries = {}
+            self._shards = {}
+            self._data = None
+
+    def stats(self):
+        """返回緩存命中和讀寫統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'backend': 'sharded',
+                'data_dir': self.data_dir,
+                'version': self.version,
+                'lessons': len(self._entries),
+                'cached_lessons': len(self._shards),
+                'cached': self._data is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+                'shard_reads': self.shard_reads,
+                'shard_writes': self.shard_writes,
+                'manifest_writes': self.manifest_writes,
+                'lock': self._file_lock.stats()
+            }
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY,
+    position INTEGER NOT NULL,
+    language TEXT NOT NULL DEFAULT '',
+    name TEXT NOT NULL,
+    has_words INTEGER NOT NULL DEFAULT 1,
+    has_paragraphs INTEGER NOT NULL DEFAULT 1,
+    extra TEXT,
+    raw TEXT,
+    UNIQUE (language, name)
+);
+CREATE TABLE IF NOT EXISTS words (
+    id INTEGER PRIMARY KEY,
+    lesson_id INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    word TEXT NOT NULL,
+    meaning TEXT NOT NULL DEFAULT '',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    incorrect INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_words_lesson ON words(lesson_id, position);
+CREATE INDEX IF NOT EXISTS idx_words_word ON words(word);
+CREATE INDEX IF NOT EXISTS idx_words_unmastered ON words(lesson_id)
+    WHERE attempts = 0 OR correct < 0.75 * attempts;
+CREATE TABLE IF NOT EXISTS paragraphs (
+    id INTEGER PRIMARY KEY,
+    lesson_id INTEGER NOT NULL REFERENCES lessons(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    para_key TEXT,
+    title TEXT NOT NULL DEFAULT '',
+    attempts INTEGER,
+    correct INTEGER,
+    incorrect INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_paragraphs_lesson ON paragraphs(lesson_id, position);
+CREATE TABLE IF NOT EXISTS sentences (
+    id INTEGER PRIMARY KEY,
+    paragraph_id INTEGER NOT NULL REFERENCES paragraphs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    sentence TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    plain INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    correct INTEGER NOT NULL DEFAULT 0,
+    incorrect INTEGER NOT NULL DEFAULT 0,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sentences_paragraph ON sentences(paragraph_id, position);
+CREATE INDEX IF NOT EXISTS idx_sentences_norm ON sentences(norm);
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    item_type TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    known INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_item ON attempts(item_type, item_id, timestamp);
+"""
+
+# 以下 SQL 條件與 is_mastered() 等價（0.75 * attempts 對整數是精確的）
+_SQL_UNMASTERED = "(attempts = 0 OR correct < 0.75 * attempts)"
+_SQL_MASTERED = "(attempts > 0 AND correct >= 0.75 * attempts)"
+# 詞語正確率（百分比），與 LessonRegistry 的計算方式一致，分頁游標直接比較它
+_SQL_ACCURACY = "(CASE WHEN w.attempts > 0 THEN CAST(w.correct AS REAL) / w.attempts * 100 ELSE 0 END)"
+
+
+def _unmastered_filter(language=None, lesson=None, min_accuracy=None, max_accuracy=None, never_attempted=False):
+    """未掌握詞語過濾條件的 WHERE 子句和參數"""
+    clauses = ['(w.attempts = 0 OR w.correct < 0.75 * w.attempts)']
+    params = []
+    if language is not None:
+        clauses.append('l.language = ?')
+        params.append(language)
+    if lesson is not None:
+        clauses.append('l.name = ?')
+        params.append(lesson)
+    if min_accuracy is not None:
+        clauses.append(f'{_SQL_ACCURACY} >= ?')
+        params.append(min_accuracy)
+    if max_accuracy is not None:
+        clauses.append(f'{_SQL_ACCURACY} <= ?')
+        params.append(max_accuracy)
+    if never_attempted:
+        clauses.append('w.attempts = 0')
+    return ' AND '.join(clauses), params
+
+_WORD_KEYS = ('word', 'meaning', 'attempts', 'correct', 'incorrect', 'history')
+_PARA_KEYS = ('id', 'title', 'sentences', 'attempts', 'correct', 'incorrect', 'history')
+_SENT_KEYS = ('sentence', 'attempts', 'correct', 'incorrect', 'history')
+
+
+def _extra_json(item, known_keys):
+    """保存標準字段以外的鍵，保證數據可以原樣還原"""
+    extra = {k: v for k, v in item.items() if k not in known_keys}
+    return json.dumps(extra, ensure_ascii=False) if extra else None
+
+
+class SQLiteDataStore(_TreeQueries):
+    """
+    SQLite 數據存儲 - 與 DataStore 相同的接口
+
+    課程、詞語、段落、句子和答題記錄分表保存；記錄一次答題只是一行 INSERT 加計數器 UPDATE，
+    未掌握詞語數、課程統計和搜索都是 SQL 查詢。load() 仍然可以還原出完整的數據樹
+    （按 PRAGMA data_version 判斷其他連接是否修改過，未修改時直接返回緩存）。
+
+    記錄答題持有共享文件鎖（寫入由 SQLite 自己串行化），locked() 內的整樹讀-改-寫持有排他鎖，
+    因此整樹保存不會覆蓋其他進程剛插入的答題記錄。
+    """
+
+    def __init__(self, db_file='vocabulary_data.db'):
+        self.db_file = db_file
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(db_file + '.lock')
+        self._connection = None
+        self._pid = None
+        self._data = None
+        self._data_version = None
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def _conn(self):
+        """
+        數據庫連接：第一次使用時打開；fork 之後在子進程中重新打開，
+        預先 fork 的服務器（gunicorn 等）的各個進程不共用同一個連接
+        """
+        with self._lock:
+            if self._connection is None or self._pid != os.getpid():
+                conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute('PRAGMA foreign_keys=ON')
+                # SQLite 的 lower() 只轉換 ASCII：搜索用 Python 的 str.lower()，與其他存儲方式的結果一致
+                conn.create_function('py_lower', 1, _sql_lower, deterministic=True)
+                conn.executescript(SQLITE_SCHEMA)
+                conn.commit()
+                self._connection = conn
+                self._pid = os.getpid()
+                # data_version 只在同一個連接內可比較
+                self._data_version = None
+            return self._connection
+
+    def _db_version(self):
+        """其他連接提交後 data_version 會改變"""
+        return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    @contextmanager
+    def locked(self):
+        """在排他鎖內完成整樹的讀-改-寫"""
+        with self._lock, self._file_lock():
+            yield
+
+    def load(self):
+        """從數據庫還原完整的數據樹（共享對象，修改後必須調用 save() 持久化）"""
+        with self._lock:
+            db_version = self._db_version()
+            if self._data is not None and db_version == self._data_version:
+                self.hits += 1
+                return self._data
+            self.misses += 1
+            # 在同一個讀事務裡讀所有表，避免讀到其他進程提交到一半的狀態
+            self._conn.execute('BEGIN')
+            try:
+                self._data = self._read_tree()
+            finally:
+                self._conn.execute('COMMIT')
+            self._data_version = db_version
+            self.version += 1
+            return self._data
+
+    def _read_history(self, item_type):
+        """讀出某類條目的全部答題歷史 {item_id: [...]}"""
+        history = {}
+        rows = self._conn.execute(
+            'SELECT item_id, timestamp, known FROM attempts WHERE item_type = ? ORDER BY item_id, timestamp, id',
+            (item_type,))
+        for item_id, timestamp, known in rows:
+            history.setdefault(item_id, []).append({
+                "timestamp": timestamp,
+                "known": bool(known) if known is not None else None
+            })
+        return history
+
+    def _read_tree(self):
+        conn = self._conn
+        word_history = self._read_history('word')
+        para_history = self._read_history('paragraph')
+        sent_history = self._read_history('sentence')
+
+        sentences = {}
+        for row in conn.execute('SELECT id, paragraph_id, sentence, plain, attempts, correct, incorrect, extra '
+                                'FROM sentences ORDER BY paragraph_id, position'):
+            sent_id, para_id, sentence, plain, attempts, correct, incorrect, extra = row
+            if plain:
+                sentences.setdefault(para_id, []).append(sentence)
+                continue
+            sent = {
+                'sentence': sentence,
+                'attempts': attempts,
+                'correct': correct,
+                'incorrect': incorrect,
+                'history': sent_history.get(sent_id, [])
+            }
+            if extra:
+                sent.update(json.loads(extra))
+            sentences.setdefault(para_id, []).append(sent)
+
+        paragraphs = {}
+        for row in conn.execute('SELECT id, lesson_id, para_key, title, attempts, correct, incorrect, extra '
+                                'FROM paragraphs ORDER BY lesson_id, position'):
+            para_id, lesson_id, para_key, title, attempts, correct, incorrect, extra = row
+            para = {}
+            if para_key is not None:
+                para['id'] = para_key
+            para['title'] = title
+            para['sentences'] = sentences.get(para_id, [])
+            # 舊數據的段落可能沒有統計字段，NULL 表示原數據中不存在
+            for key, value in (('attempts', attempts), ('correct', correct), ('incorrect', incorrect)):
+                if value is not None:
+                    para[key] = value
+            if para_id in para_history or attempts is not None:
+                para['history'] = para_history.get(para_id, [])
+            if extra:
+                para.update(json.loads(extra))
+            paragraphs.setdefault(lesson_id, []).append(para)
+
+        words = {}
+        for row in conn.execute('SELECT id, lesson_id, word, meaning, attempts, correct, incorrect, extra '
+                                'FROM words ORDER BY lesson_id, position'):
+            word_id, lesson_id, word, meaning, attempts, correct, incorrect, extra = row
+            item = {
+                'word': word,
+                'meaning': meaning,
+                'attempts': attempts,
+                'correct': correct,
+                'incorrect': incorrect,
+                'history': word_history.get(word_id, [])
+            }
+            if extra:
+                item.update(json.loads(extra))
+            words.setdefault(lesson_id, []).append(item)
+
+        data = {}
+        for row in conn.execute('SELECT id, language, name, has_words, has_paragraphs, extra, raw '
+                                'FROM lessons ORDER BY position'):
+            lesson_id, language, name, has_words, has_paragraphs, extra, raw = row
+            if raw is not None:
+                content = json.loads(raw)
+            else:
+                content = {}
+                if has_words:
+                    content['詞語'] = words.get(lesson_id, [])
+                if has_paragraphs:
+                    content['段落'] = paragraphs.get(lesson_id, [])
+                if extra:
+                    content.update(json.loads(extra))
+            if language:
+                data.setdefault(language, {})[name] = content
+            else:
+                data[name] = content
+        return data
+
+    def _insert_history(self, item_type, item_id, history):
+        self._conn.executemany(
+            'INSERT INTO attempts (item_type, item_id, timestamp, known) VALUES (?, ?, ?, ?)',
+            [(item_type, item_id, h.get('timestamp', ''), h.get('known', h.get('correct')))
+             for h in history if isinstance(h, dict)])
+
+    def _insert_lesson(self, position, language, name, content):
+        """寫入一個課程及其全部條目"""
+        conn = self._conn
+        is_lesson = isinstance(content, dict) and ('詞語' in content or '段落' in content)
+        if not is_lesson:
+            # 非標準內容原樣保存
+            conn.execute('INSERT INTO lessons (position, language, name, has_words, has_paragraphs, raw) '
+                         'VALUES (?, ?, ?, 0, 0, ?)',
+                         (position, language, name, json.dumps(content, ensure_ascii=False)))
+            return
+
+        cur = conn.execute(
+            'INSERT INTO lessons (position, language, name, has_words, has_paragraphs, extra) VALUES (?, ?, ?, ?, ?, ?)',
+            (position, language, name, int('詞語' in content), int('段落' in content),
+             _extra_json(content, ('詞語', '段落'))))
+        lesson_id = cur.lastrowid
+
+        for word_pos, item in enumerate(content.get('詞語', [])):
+            cur = conn.execute(
+                'INSERT INTO words (lesson_id, position, word, meaning, attempts, correct, incorrect, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (lesson_id, word_pos, item.get('word', ''), item.get('meaning', ''), item.get('attempts', 0),
+                 item.get('correct', 0), item.get('incorrect', 0), _extra_json(item, _WORD_KEYS)))
+            self._insert_history('word', cur.lastrowid, item.get('history', []))
+
+        for para_pos, para in enumerate(content.get('段落', [])):
+            cur = conn.execute(
+                'INSERT INTO paragraphs (lesson_id, position, para_key, title, attempts, correct, incorrect, extra) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (lesson_id, para_pos, para.get('id'), para.get('title', ''), para.get('attempts'),
+                 para.get('correct'), para.get('incorrect'), _extra_json(para, _PARA_KEYS)))
+            para_id = cur.lastrowid
+            self._insert_history('paragraph', para_id, para.get('history', []))
+
+            for sent_pos, sent in enumerate(para.get('sentences', [])):
+                if not isinstance(sent, dict):
+                    conn.execute('INSERT INTO sentences (paragraph_id, position, sentence, norm, plain) '
+                                 'VALUES (?, ?, ?, ?, 1)', (para_id, sent_pos, sent, normalize_text(sent)))
+                    continue
+                text = sent.get('sentence', '')
+                cur = conn.execute(
+                    'INSERT INTO sentences (paragraph_id, position, sentence, norm, attempts, correct, incorrect, extra) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (para_id, sent_pos, text, normalize_text(text), sent.get('attempts', 0), sent.get('correct', 0),
+                     sent.get('incorrect', 0), _extra_json(sent, _SENT_KEYS)))
+                self._insert_history('sentence', cur.lastrowid, sent.get('history', []))
+
+    def save(self, data):
+        """用完整數據樹替換數據庫內容（兩種格式都支持，也用於一次性遷移）"""
+        with self._lock, self._file_lock():
+            with self._conn:
+                self._conn.execute('DELETE FROM attempts')
+                self._conn.execute('DELETE FROM lessons')
+                for position, (language, name, content) in enumerate(_iter_entries(data)):
+                    self._insert_lesson(position, language, name, content)
+            self._data = data
+            self._registry = None
+            self._data_version = self._db_version()
+            self.version += 1
+
+    def _lesson_id(self, language, lesson):
+        row = self._conn.execute('SELECT id FROM lessons WHERE language = ? AND name = ? AND raw IS NULL',
+                                 (language or '', lesson)).fetchone()
+        return row[0] if row else None
+
+    def _update_counters(self, table, item_id, known):
+        column = 'correct' if known else 'incorrect'
+        self._conn.execute(f'UPDATE {table} SET attempts = COALESCE(attempts, 0) + 1, '
+                           f'{column} = COALESCE({column}, 0) + 1 WHERE id = ?', (item_id,))
+
+    def _insert_attempt(self, record, lesson_ids):
+        """在當前事務中記錄一次答題：更新計數器並插入答題記錄，找不到內容時返回 False"""
+        key = (record.get('language') or '', record['lesson'])
+        if key not in lesson_ids:
+            lesson_ids[key] = self._lesson_id(*key)
+        lesson_id = lesson_ids[key]
+        if lesson_id is None:
+            return False
+        item = record['item']
+        known = record['known']
+        history = [{'timestamp': record['timestamp'], 'known': known}]
+        if record.get('content_type', '詞語') == '詞語':
+            row = self._conn.execute('SELECT id FROM words WHERE lesson_id = ? AND word = ? '
+                                     'ORDER BY position LIMIT 1', (lesson_id, item)).fetchone()
+            if not row:
+                return False
+            self._update_counters('words', row[0], known)
+            self._insert_history('word', row[0], history)
+            return True
+        row = self._conn.execute(
+            'SELECT s.id, s.paragraph_id, s.plain FROM sentences s JOIN paragraphs p ON p.id = s.paragraph_id '
+            'WHERE p.lesson_id = ? AND (s.norm = ? OR s.sentence = ?) '
+            'ORDER BY p.position, s.position LIMIT 1',
+            (lesson_id, normalize_text(item), item)).fetchone()
+        if not row:
+            return False
+        sent_id, para_id, plain = row
+        if not plain:
+            self._update_counters('sentences', sent_id, known)
+            self._insert_history('sentence', sent_id, history)
+        self._update_counters('paragraphs', para_id, known)
+        self._insert_history('paragraph', para_id, history)
+        return True
+
+    def record_attempts(self, records):
+        """批量記錄答題：所有記錄在同一個事務中寫入；返回每條記錄是否找到了內容"""
+        with self._lock, self._file_lock(shared=True):
+            version_before = self._db_version()
+            lesson_ids = {}
+            with self._conn:
+                results = [self._insert_attempt(record, lesson_ids) for record in records]
+            applied = [record for record, ok in zip(records, results) if ok]
+            if not applied:
+                return results
+
+            def update(data):
+                registry = self._registry_for(data)
+                for record in applied:
+                    registry.apply_attempt(record)
+
+            # 同步更新內存中的數據樹，避免整棵樹重建；自己的提交不改變 data_version，
+            # 所以前後不一致說明期間有其他進程提交過，緩存已經過期
+            self._apply_to_cache(version_before, update)
+            return results
+
+    def compact(self):
+        """SQLite 不需要合併日誌"""
+
+    def load_lesson(self, language, lesson):
+        """載入單個課程（共享對象）；不存在時返回 None"""
+        found = self.registry().get(language, lesson)
+        return found.content if found is not None else None
+
+    def _delete_lesson_rows(self, lesson_row_id):
+        """刪除課程及其條目和答題記錄（詞語、段落、句子通過外鍵級聯刪除）"""
+        conn = self._conn
+        conn.execute("DELETE FROM attempts WHERE item_type = 'word' AND item_id IN "
+                     "(SELECT id FROM words WHERE lesson_id = ?)", (lesson_row_id,))
+        conn.execute("DELETE FROM attempts WHERE item_type = 'paragraph' AND item_id IN "
+                     "(SELECT id FROM paragraphs WHERE lesson_id = ?)", (lesson_row_id,))
+        conn.execute("DELETE FROM attempts WHERE item_type = 'sentence' AND item_id IN "
+                     "(SELECT s.id FROM sentences s JOIN paragraphs p ON p.id = s.paragraph_id "
+                     "WHERE p.lesson_id = ?)", (lesson_row_id,))
+        conn.execute('DELETE FROM lessons WHERE id = ?', (lesson_row_id,))
+
+    def _apply_to_cache(self, version_before, update):
+        """在緩存仍然是最新時原地更新數據樹，否則丟棄緩存"""
+        if self._data is not None and version_before == self._data_version == self._db_version():
+            update(self._data)
+        else:
+            self._data = None
+        self.version += 1
+
+    def save_lesson(self, language, lesson, content):
+        """保存（新建或替換）單個課程：只重寫這個課程的行，保持原有順序"""
+        language = language or ''
+        with self._lock, self._file_lock():
+            version_before = self._db_version()
+            with self._conn:
+                row = self._conn.execute('SELECT id, position FROM lessons WHERE language = ? AND name = ?',
+                                         (language, lesson)).fetchone()
+                if row:
+                    self._delete_lesson_rows(row[0])
+                    position = row[1]
+                else:
+                    position = self._conn.execute('SELECT COALESCE(MAX(position), -1) + 1 FROM lessons').fetchone()[0]
+                self._insert_lesson(position, language, lesson, content)
+
+            def update(data):
+                _set_entry(data, language, lesson, content)
+                self._registry_set(data, language, lesson, content)
+            self._apply_to_cache(version_before, update)
+
+    def delete_lesson(self, language, lesson):
+        """刪除單個課程，不存在時返回 False"""
+        language = language or ''
+        with self._lock, self._file_lock():
+            version_before = self._db_version()
+            with self._conn:
+                row = self._conn.execute('SELECT id FROM lessons WHERE language = ? AND name = ?',
+                                         (language, lesson)).fetchone()
+                if not row:
+                    return False
+                self._delete_lesson_rows(row[0])
+
+            def update(data):
+                _remove_entry(data, language, lesson)
+                self._registry_remove(language, lesson)
+            self._apply_to_cache(version_before, update)
+            return True
+
+    def invalidate(self):
+        """丟棄緩存，下一次 load() 強制重建數據樹"""
+        with self._lock:
+            self._data = None
+
+    def unmastered_words(self, **filters):
+        """所有未掌握的詞語（按正確率從低到高）"""
+        where, params = _unmastered_filter(**filters)
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT w.word, l.name, l.language, w.attempts, {_SQL_ACCURACY} AS acc FROM words w '
+                f'JOIN lessons l ON l.id = w.lesson_id WHERE {where} '
+                'ORDER BY acc, l.position, w.position', params).fetchall()
+        return [self._unmastered_item(*row) for row in rows]
+
+    @staticmethod
+    def _unmastered_item(word, name, language, attempts, accuracy):
+        return {
+            'word': word,
+            'lesson': name,
+            'language': language,
+            'is_simple': not language,
+            'attempts': attempts,
+            'accuracy': accuracy
+        }
+
+    def unmastered_page(self, limit, cursor=None, **filters):
+        """一頁未掌握的詞語：按 (正確率, 課程位置, 詞語位置) 做 keyset 分頁"""
+        after = decode_cursor(cursor) if cursor else None
+        where, params = _unmastered_filter(**filters)
+        with self._lock:
+            total, avg = self._conn.execute(
+                f'SELECT COUNT(*), AVG({_SQL_ACCURACY}) FROM words w '
+                f'JOIN lessons l ON l.id = w.lesson_id WHERE {where}', params).fetchone()
+            if after is not None:
+                where += f' AND ({_SQL_ACCURACY}, l.position, w.position) > (?, ?, ?)'
+                params = params + list(after)
+            rows = self._conn.execute(
+                f'SELECT w.word, l.name, l.language, w.attempts, {_SQL_ACCURACY} AS acc, l.position, w.position '
+                f'FROM words w JOIN lessons l ON l.id = w.lesson_id WHERE {where} '
+                'ORDER BY acc, l.position, w.position LIMIT ?', params + [limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'words': [self._unmastered_item(*row[:5]) for row in rows],
+            'next_cursor': encode_cursor(rows[-1][4:]) if has_more else None,
+            'total': total,
+            'avg_accuracy': round(avg, 1) if total else 0
+        }
+
+    def unmastered_count(self, **filters):
+        """符合條件的未掌握詞語數"""
+        where, params = _unmastered_filter(**filters)
+        with self._lock:
+            return self._conn.execute(
+                f'SELECT COUNT(*) FROM words w JOIN lessons l ON l.id = w.lesson_id WHERE {where}',
+                params).fetchone()[0]
+
+    def word_mastery_counts(self):
+        """詞語總數 / 已掌握 / 未掌握"""
+        with self._lock:
+            total = self._conn.execute('SELECT COUNT(*) FROM words').fetchone()[0]
+            unmastered = self._conn.execute(f'SELECT COUNT(*) FROM words WHERE {_SQL_UNMASTERED}').fetchone()[0]
+        return {
+            'total': total,
+            'mastered': total - unmastered,
+            'unmastered': unmastered
+        }
+
+    def lesson_unmastered_counts(self):
+        """每個有詞語的課程的未掌握詞語數"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT l.language, l.name, '
+                f'(SELECT COUNT(*) FROM words WHERE lesson_id = l.id AND {_SQL_UNMASTERED}) '
+                'FROM lessons l WHERE l.has_words = 1 AND l.raw IS NULL ORDER BY l.position').fetchall()
+        return {(language + '|' + name if language else name): count for language, name, count in rows}
+
+    def lesson_stats(self, language, lesson):
+        """單個課程的掌握統計，課程不存在時返回 None"""
+        with self._lock:
+            lesson_id = self._lesson_id(language, lesson)
+            if lesson_id is None:
+                return None
+            word_total, word_mastered = self._conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM({_SQL_MASTERED}), 0) FROM words WHERE lesson_id = ?',
+                (lesson_id,)).fetchone()
+            sent_total, sent_mastered = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(s.plain = 0 AND s.attempts > 0 AND s.correct >= 0.75 * s.attempts), 0) '
+                'FROM sentences s JOIN paragraphs p ON p.id = s.paragraph_id WHERE p.lesson_id = ?',
+                (lesson_id,)).fetchone()
+        total_items = word_total + sent_total
+        mastered = word_mastered + sent_mastered
+        return {
+            'total_words': total_items,
+            'mastered': mastered,
+            'needs_review': total_items - mastered,
+            'mastered_percentage': round((mastered / total_items) * 100, 1) if total_items > 0 else 0
+        }
+
+    def search_lessons(self, keyword, limit=None):
+        """按標題和內容搜索課程，matched_field 的優先順序與 Lesson.match_field 相同"""
+        keyword = keyword.lower()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM (SELECT l.language, l.name, '
+                '(SELECT COUNT(*) FROM words WHERE lesson_id = l.id), '
+                '(SELECT COUNT(*) FROM paragraphs WHERE lesson_id = l.id), '
+                'CASE WHEN instr(py_lower(l.name), :k) > 0 THEN \'title\' '
+                'WHEN EXISTS (SELECT 1 FROM words w WHERE w.lesson_id = l.id AND instr(py_lower(w.word), :k) > 0) '
+                '     THEN \'word\' '
+                'WHEN EXISTS (SELECT 1 FROM words w WHERE w.lesson_id = l.id AND instr(py_lower(w.meaning), :k) > 0) '
+                '     THEN \'meaning\' '
+                'WHEN EXISTS (SELECT 1 FROM paragraphs p WHERE p.lesson_id = l.id AND instr(py_lower(p.title), :k) > 0) '
+                '     THEN \'paragraph_title\' '
+                'WHEN EXISTS (SELECT 1 FROM sentences s JOIN paragraphs p ON p.id = s.paragraph_id '
+                '             WHERE p.lesson_id = l.id AND instr(py_lower(s.sentence), :k) > 0) '
+                '     THEN \'sentence\' END AS field, '
+                # 與數據樹的順序一致：舊格式的課程排在所屬語言第一次出現的位置
+                'CASE WHEN l.language = \'\' THEN l.position '
+                '     ELSE (SELECT MIN(g.position) FROM lessons g WHERE g.language = l.language) END AS tree_position, '
+                'l.position '
+                'FROM lessons l WHERE l.raw IS NULL) '
+                'WHERE field IS NOT NULL ORDER BY tree_position, position LIMIT :n',
+                {'k': keyword, 'n': -1 if limit is None else limit}).fetchall()
+        return [{
+            'language': language,
+            'lesson_number': name,
+            'word_count': word_count,
+            'para_count': para_count,
+            'is_simple': not language,
+            'matched_field': field
+        } for language, name, word_count, para_count, field, _, _ in rows]
+
+    def stats(self):
+        """返回緩存命中和表行數統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            counts = {table: self._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                      for table in ('lessons', 'words', 'paragraphs', 'sentences', 'attempts')}
+            return {
+                'backend': 'sqlite',
+                'db_file': self.db_file,
+                'version': self.version,
+                'cached': self._data is not None,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0,
+                'rows': counts,
+                'lock': self._file_lock.stats()
+            }
@@ -1,13 +1,22 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, send_file, g
+from flask.sessions import SecureCookieSessionInterface
 from flask_cors import CORS
+from jinja2 import FileSystemBytecodeCache
 from urllib.parse import unquote
+import gzip
 import json
+import math
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import hashlib
 import threading
-from queue import Queue
-import time
+
+from audio_manifest import AudioManifest
+from data_store import DataStore, ShardedDataStore, SQLiteDataStore, attempt_record
+from render_cache import FragmentCache
+from tts_backends import backend_from_env
+from tts_service import AudioJobs, TokenBucket, TTSJobQueue, TTSWorkerPool
+from vocab_model import decode_cursor, is_mastered
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key_here'
@@ -15,6 +24,7 @@ app.secret_key = 'your_secret_key_here'
 # 启用 CORS 支持（生产环境需要）
 CORS(app, resources={
     r"/tts/*": {"origins": "*"},
+    r"/audio/*": {"origins": "*"},
     r"/static/*": {"origins": "*"}
 })
 
@@ -24,10 +34,45 @@ app.config['SESSION_COOKIE_HTTPONLY'] = False
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 
-# Disable Jinja2 caching
-app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.jinja_env.auto_reload = True
-app.jinja_env.cache = None
+# 不讀寫 session 的路由：響應不帶 Set-Cookie 和 Vary: Cookie，瀏覽器可以直接使用緩存
+SESSIONLESS_ENDPOINTS = {'serve_audio'}
+
+class VocabSessionInterface(SecureCookieSessionInterface):
+    """永久 session 每次請求都會重新簽發 cookie；長期緩存的音頻響應跳過保存"""
+
+    def save_session(self, app, session, response):
+        if request.endpoint in SESSIONLESS_ENDPOINTS:
+            return
+        super().save_session(app, session, response)
+
+app.session_interface = VocabSessionInterface()
+
+# 運行模式：production（默認，模板編譯一次後緩存，字節碼寫入磁盤供其他 worker 和重啟後使用，
+# 啟用片段緩存）或 development（模板修改後自動重新載入，不做任何緩存）
+APP_MODE = os.environ.get('VOCAB_MODE', 'production')
+if APP_MODE == 'development':
+    app.config['TEMPLATES_AUTO_RELOAD'] = True
+    app.jinja_env.auto_reload = True
+    app.jinja_env.cache = None
+else:
+    app.config['TEMPLATES_AUTO_RELOAD'] = False
+    app.jinja_env.auto_reload = False
+    # 目錄未設置時使用系統臨時目錄
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(os.environ.get('VOCAB_TEMPLATE_CACHE_DIR') or None)
+
+# 片段緩存：課程內容片段和統計頁按課程版本號緩存渲染結果，0 表示不緩存
+FRAGMENT_CACHE_SIZE = int(os.environ.get('VOCAB_FRAGMENT_CACHE', '0' if APP_MODE == 'development' else '256'))
+fragment_cache = FragmentCache(FRAGMENT_CACHE_SIZE)
+print(f"[TEMPLATE] Mode: {APP_MODE} (fragment cache {FRAGMENT_CACHE_SIZE} entries)")
+
+# 響應壓縮：客戶端接受 gzip 時，壓縮不小於 VOCAB_GZIP_MIN_SIZE 字節的 HTML/JSON 等文本響應
+GZIP_ENABLED = os.environ.get('VOCAB_GZIP', '1') == '1'
+GZIP_MIN_SIZE = int(os.environ.get('VOCAB_GZIP_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.environ.get('VOCAB_GZIP_LEVEL', '6'))
+GZIP_MIMETYPES = {'text/html', 'text/plain', 'text/css', 'text/javascript', 'application/javascript',
+                  'application/json'}
+# 帶數據版本 ETag 的響應（conditional_json），壓縮結果按 (路徑和查詢參數, 數據版本號) 緩存
+compressed_cache = FragmentCache(int(os.environ.get('VOCAB_GZIP_CACHE', '128')))
 
 # Disable auto-reload to prevent duplicate TTS threads
 app.config['ENV'] = 'production'
@@ -36,118 +81,176 @@ app.config['ENV'] = 'production'
 AUDIO_DIR = os.path.join(os.path.dirname(__file__), 'static', 'audio')
 if not os.path.exists(AUDIO_DIR):
     os.makedirs(AUDIO_DIR)
+# 已生成音频的清单（static/audio/manifest.jsonl）：路由查清单，不再逐个检查文件
+audio_manifest = AudioManifest(AUDIO_DIR)
 
 # 初始化文字转语音引擎和后台线程
-tts_engine = True  # gTTS 总是可用的（无需初始化）
-tts_queue = Queue()
-tts_thread = None
-gTTS_lib = None  # 全局 gTTS 引用
+tts_engine = True  # TTS 引擎是否可用（init_tts 中设置）
+
+# TTS 线程池：VOCAB_TTS_WORKERS 个线程共用令牌桶限速（每秒 VOCAB_TTS_RATE 次，最多连续 VOCAB_TTS_BURST 次），
+# 失败时自动降速，成功后逐步恢复
+TTS_WORKERS = int(os.environ.get('VOCAB_TTS_WORKERS', '4'))
+TTS_RATE = float(os.environ.get('VOCAB_TTS_RATE', '2'))
+TTS_BURST = float(os.environ.get('VOCAB_TTS_BURST', '4'))
+TTS_MAX_RETRIES = int(os.environ.get('VOCAB_TTS_RETRIES', '5'))
+# 持久化的 TTS 任务队列：重启后继续处理未完成的任务，多个 worker 进程可以共用
+TTS_QUEUE_FILE = os.environ.get('VOCAB_TTS_QUEUE_FILE', 'tts_queue.db')
+# 音频语言和语速（gTTS 只区分正常和慢速：语速小于 1 为慢速）
+TTS_LANG = os.environ.get('VOCAB_TTS_LANG', 'zh-CN')
+TTS_SPEED = float(os.environ.get('VOCAB_TTS_SPEED', '1'))
+# /tts/<word> 遇到未生成的音频时按需生成（VOCAB_TTS_ON_DEMAND=0 关闭），最多等待 VOCAB_TTS_WAIT 秒，
+# 超时返回 pending，客户端稍后再请求
+TTS_ON_DEMAND = os.environ.get('VOCAB_TTS_ON_DEMAND', '1') == '1'
+TTS_WAIT = float(os.environ.get('VOCAB_TTS_WAIT', '8'))
+
+tts_queue = TTSJobQueue(TTS_QUEUE_FILE, max_retries=TTS_MAX_RETRIES)
+# 引擎在 init_tts() 中按 VOCAB_TTS_BACKEND 创建
+tts_pool = TTSWorkerPool(None, tts_queue, workers=TTS_WORKERS,
+                         limiter=TokenBucket(rate=TTS_RATE, burst=TTS_BURST), manifest=audio_manifest,
+                         lang=TTS_LANG, speed=TTS_SPEED)
+
+def audio_hash(text):
+    """文本的音频哈希（MD5），也是音频文件名和清单的键"""
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+def audio_file_for(text):
+    """文本对应的音频文件路径"""
+    return os.path.join(AUDIO_DIR, f'{audio_hash(text)}.mp3')
+
+# /audio/<哈希>.mp3 的缓存时间：文件名由文本决定，内容不会改变，浏览器缓存一年且不必重新验证
+AUDIO_MAX_AGE = 365 * 24 * 3600
+
+# /api/audio_manifest：一次最多查询的文本数和长轮询的最长等待（秒）
+# 等待期间占用一个处理请求的线程/进程：默认只等几秒，由页面重新轮询；
+# 只有在多线程或异步服务器（如 gunicorn --threads、gevent）下运行时才适合调大
+AUDIO_MANIFEST_MAX = int(os.environ.get('VOCAB_AUDIO_MANIFEST_MAX', '1000'))
+AUDIO_POLL_MAX = float(os.environ.get('VOCAB_AUDIO_POLL_MAX', '3'))
+# 听写页面每次长轮询请求的等待时间
+app.jinja_env.globals['audio_poll_wait'] = AUDIO_POLL_MAX
+
+def audio_url_for(text_hash):
+    """音频的固定 URL（同一文本总是同一个 URL，由浏览器缓存）"""
+    return url_for('serve_audio', text_hash=text_hash)
+
+# 保存课程时的音频生成任务：请求立即返回任务 id，进度见 /api/tts_jobs/<id>
+audio_jobs = AudioJobs(tts_pool, audio_file_for)
 
 def init_tts():
-    """初始化 TTS 后台线程"""
-    global tts_thread, tts_engine, gTTS_lib
+    """初始化 TTS 引擎（VOCAB_TTS_BACKEND：gtts 或 local）和后台线程池"""
+    global tts_engine
     try:
-        from gtts import gTTS
-        gTTS_lib = gTTS
-        print("[TTS] gTTS library imported successfully")
-        
-        # 启动多个后台 TTS 线程以加速处理
-        def tts_worker():
-            """后台处理 TTS 任务"""
-            while True:
-                try:
-                    word, audio_file = tts_queue.get()
-                    if word is None:  # 停止信号
-                        break
-                    # 检查文件是否已存在
-                    if not os.path.exists(audio_file):
-                        max_retries = 5  # 增加到 5 次重试
-                        retry_count = 0
-                        success = False
-                        
-                        while retry_count < max_retries and not success:
-                            try:
-                                print(f"[TTS] Generating: {word} (attempt {retry_count + 1}/{max_retries})")
-                                tts = gTTS_lib(text=word, lang='zh-CN', slow=False)
-                                tts.save(audio_file)
-                                
-                                # 验证文件是否真的被创建了
-                                if os.path.exists(audio_file):
-                                    file_size = os.path.getsize(audio_file)
-                                    if file_size > 0:  # 确保不是空文件
-                                        # 确保文件权限正确
-                                        os.chmod(audio_file, 0o644)
-                                        print(f"[TTS] ✓ Generated successfully: {word} -> {audio_file} ({file_size} bytes)")
-                                        success = True
-                                    else:
-                                        print(f"[TTS] ✗ Generated empty file for: {word}")
-                                        retry_count += 1
-                                        if retry_count < max_retries:
-                                            wait_time = 1 + (retry_count * 0.5)  # 1s, 1.5s, 2s, 2.5s, 3s
-                                            print(f"[TTS] Retrying in {wait_time}s...")
-                                            time.sleep(wait_time)
-                                else:
-                                    print(f"[TTS] ✗ File was not created after save() call for: {word}")
-                                    retry_count += 1
-                                    if retry_count < max_retries:
-                                        wait_time = 1 + (retry_count * 0.5)
-                                        print(f"[TTS] Retrying in {wait_time}s...")
-                                        time.sleep(wait_time)
-                                    
-                            except Exception as gen_err:
-                                retry_count += 1
-                                error_type = type(gen_err).__name__
-                                if retry_count < max_retries:
-                                    wait_time = 1 + (retry_count * 0.5)  # 更短的延迟
-                                    print(f"[TTS] ✗ {error_type} for '{word}': {str(gen_err)[:100]}")
-                                    print(f"[TTS] Retrying in {wait_time}s (attempt {retry_count}/{max_retries})...")
-                                    time.sleep(wait_time)
-                                else:
-                                    print(f"[TTS] ✗ Final failure for '{word}' after {max_retries} attempts: {error_type}")
-                        
-                        if not success:
-                            print(f"[TTS] ✗ FAILED to generate audio for: {word}")
-                    else:
-                        file_size = os.path.getsize(audio_file)
-                        print(f"[TTS] ✓ Already cached: {word} ({file_size} bytes)")
-                    
-                    # 在两个请求之间添加短延迟（0.5s）以避免 API 限制
-                    time.sleep(0.5)
-                    tts_queue.task_done()
-                except Exception as e:
-                    print(f"[TTS] ✗ Worker Error: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    time.sleep(0.5)
-                    tts_queue.task_done()
-        
-        # 启动 1 个后台线程处理 TTS（避免 API 限制导致请求失败）
-        for i in range(1):
-            tts_thread = threading.Thread(target=tts_worker, daemon=True)
-            tts_thread.start()
-        print("[TTS] Engine initialized with gTTS (1 worker thread)")
-        
-    except ImportError as e:
+        tts_pool.backend = backend_from_env()
+        tts_pool.start()
+        print(f"[TTS] Engine initialized with {tts_pool.backend.name} ({TTS_WORKERS} worker threads)")
+        
+    except (ImportError, ValueError) as e:
         tts_engine = False
-        gTTS_lib = None
-        print(f"Warning: gTTS not installed - {str(e)}, TTS will be disabled")
+        print(f"Warning: TTS backend not available - {str(e)}, TTS will be disabled")
 
 # 初始化 TTS
 init_tts()
 
 DATA_FILE = 'vocabulary_data.json'
 
+# 答題日誌每條記錄後是否 fsync（更安全但更慢）
+JOURNAL_FSYNC = os.environ.get('VOCAB_JOURNAL_FSYNC', '0') == '1'
+
+# 寫入持久化級別：sync（默認，立即寫盤）、batched（課程保存由後台線程合併寫回）、
+# interval（答題記錄也按間隔批量寫入）；後兩者只適合單個 worker 進程
+DURABILITY = os.environ.get('VOCAB_DURABILITY', 'sync')
+FLUSH_INTERVAL_MS = int(os.environ.get('VOCAB_FLUSH_INTERVAL_MS', '500'))
+
+# 存儲後端：json（默認，vocabulary_data.json + 答題日誌）、sqlite 或 sharded（每個課程一個文件）
+STORAGE_BACKEND = os.environ.get('VOCAB_STORAGE', 'json')
+SQLITE_FILE = os.environ.get('VOCAB_SQLITE_FILE', 'vocabulary_data.db')
+SHARD_DIR = os.environ.get('VOCAB_SHARD_DIR', 'vocabulary_data')
+
+# 課程列表每頁顯示的課程數
+LESSONS_PER_PAGE = int(os.environ.get('VOCAB_LESSONS_PER_PAGE', '50'))
+
+# 未掌握詞語分頁每頁最多返回的詞語數
+UNMASTERED_PAGE_MAX = int(os.environ.get('VOCAB_UNMASTERED_PAGE_MAX', '500'))
+
+# 進程內共享的數據存儲：文件未變化時不再重複解析 JSON，答題記錄追加到日誌
+if STORAGE_BACKEND == 'sqlite':
+    data_store = SQLiteDataStore(SQLITE_FILE)
+elif STORAGE_BACKEND == 'sharded':
+    data_store = ShardedDataStore(SHARD_DIR)
+else:
+    data_store = DataStore(DATA_FILE, fsync=JOURNAL_FSYNC, durability=DURABILITY,
+                           flush_interval=FLUSH_INTERVAL_MS / 1000)
+    print(f"[STORE] Durability: {DURABILITY} (flush interval {FLUSH_INTERVAL_MS} ms)")
+print(f"[STORE] Using {STORAGE_BACKEND} storage backend")
+
 def load_data():
-    """載入詞彙數據"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    """載入詞彙數據（返回共享緩存，修改後需調用 save_data）"""
+    return data_store.load()
 
 def save_data(data):
-    """保存詞彙數據到文件"""
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """保存詞彙數據（batched/interval 持久化級別下由後台線程合併寫回）"""
+    data_store.save(data)
+
+# ETag 前綴：數據版本號只在進程內單調遞增，每個進程（包括 fork 出的 worker）用自己的隨機前綴
+_etag_prefix = None
+
+def data_etag(version):
+    """數據版本號對應的 ETag"""
+    global _etag_prefix
+    if _etag_prefix is None or _etag_prefix[0] != os.getpid():
+        _etag_prefix = (os.getpid(), os.urandom(4).hex())
+    return f'{_etag_prefix[1]}-{version}'
+
+def conditional_json(version, build):
+    """
+    按數據版本回答條件 GET：If-None-Match 與當前 ETag 相同時直接返回 304，不計算也不發送內容
+
+    version 為 (版本號, 修改時間)，必須在計算內容之前取得；build() 只在需要時調用
+    """
+    number, modified = version
+    etag = data_etag(number)
+    g.data_version = number
+    # 壓縮後的響應帶弱 ETag，按弱比較匹配
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(modified, timezone.utc)
+    # 瀏覽器可以緩存，但每次使用前都要帶 If-None-Match 重新驗證
+    response.cache_control.no_cache = True
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip 壓縮文本響應；文件（send_file）、流式和已編碼的響應不處理"""
+    if not GZIP_ENABLED:
+        return response
+    if response.status_code == 304 and 'ETag' in response.headers:
+        response.vary.add('Accept-Encoding')
+        return response
+    if response.status_code != 200 or response.direct_passthrough \
+            or response.is_streamed or 'Content-Encoding' in response.headers \
+            or response.mimetype not in GZIP_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.accept_encodings['gzip'] <= 0:
+        return response
+    body = response.get_data()
+    if len(body) < GZIP_MIN_SIZE:
+        return response
+    compress = lambda: gzip.compress(body, compresslevel=GZIP_LEVEL)
+    version = g.get('data_version')
+    if version is not None:
+        body = compressed_cache.get_or_render(request.full_path, version, compress)
+    else:
+        body = compress()
+    response.set_data(body)
+    response.headers['Content-Encoding'] = 'gzip'
+    # 壓縮後的字節與原內容不同，強 ETag 改為弱 ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
 
 @app.route('/')
 def index():
@@ -156,65 +259,38 @@ def index():
 
 @app.route('/vocab_list')
 def vocab_list():
-    data = load_data()
-    # Transform data for template: organize by language and lesson
-    # Support both old structure (language -> lessons) and new structure (direct lessons)
-    contents = []
-    
-    for key, value in data.items():
-        # Determine if this is a language key (with nested lessons) or a lesson key (with content)
-        if isinstance(value, dict):
-            # Check if it looks like a lesson (has '詞語' and/or '段落' keys)
-            if ('詞語' in value or '段落' in value):
-                # This is a new-format lesson (no language hierarchy)
-                # Ensure all paragraphs have IDs
-                paragraphs = value.get('段落', [])
-                for idx, para in enumerate(paragraphs):
-                    if 'id' not in para:
-                        para['id'] = str(idx)
-                
-                word_count = len(value.get('詞語', []))
-                para_count = len(paragraphs)
-                contents.append({
-                    'language': '',  # Empty for new format
-                    'lesson_number': key,
-                    'word_count': word_count,
-                    'para_count': para_count,
-                    'content': value,
-                    'is_simple': True
-                })
-            else:
-                # This looks like a language key with nested lessons (old format)
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and ('詞語' in lesson_content or '段落' in lesson_content):
-                        # Ensure all paragraphs have IDs
-                        paragraphs = lesson_content.get('段落', [])
-                        for idx, para in enumerate(paragraphs):
-                            if 'id' not in para:
-                                para['id'] = str(idx)
-                        
-                        word_count = len(lesson_content.get('詞語', []))
-                        para_count = len(paragraphs)
-                        contents.append({
-                            'language': key,
-                            'lesson_number': lesson_num,
-                            'word_count': word_count,
-                            'para_count': para_count,
-                            'content': lesson_content,
-                            'is_simple': False
-                        })
-                    else:
-                        word_count = len(lesson_content) if isinstance(lesson_content, dict) else 0
-                        contents.append({
-                            'language': key,
-                            'lesson_number': lesson_num,
-                            'word_count': word_count,
-                            'para_count': 0,
-                            'content': lesson_content,
-                            'is_simple': False
-                        })
+    # 課程表已把新舊兩種格式統一為 (語言, 課程)，按數據中的順序排列
+    # 模板只拿到當前頁課程的摘要，課程內容在展開時從 /lesson_content 載入
+    lessons = data_store.lesson_listing()
+    pages = max(1, (len(lessons) + LESSONS_PER_PAGE - 1) // LESSONS_PER_PAGE)
+    page = request.args.get('page', 1, type=int)
+    lesson = request.args.get('lesson')
+    if lesson is not None:
+        # 打開指定課程：跳到它所在的頁
+        language = request.args.get('language', '')
+        for position, item in enumerate(lessons):
+            if item['language'] == language and item['lesson_number'] == lesson:
+                page = position // LESSONS_PER_PAGE + 1
+                break
+    page = min(max(page, 1), pages)
+    contents = lessons[(page - 1) * LESSONS_PER_PAGE:page * LESSONS_PER_PAGE]
+    lesson_keys = [item['language'] + '|' + item['lesson_number'] for item in lessons]
     
-    return render_template('vocab_list.html', contents=contents)
+    return render_template('vocab_list.html', contents=contents, page=page, pages=pages,
+                           lesson_keys=lesson_keys)
+
+@app.route('/lesson_content')
+def lesson_content():
+    """課程列表中展開課程時載入的詞語和段落（HTML 片段）"""
+    # 段落沒有 id 時模板用索引代替，與聽寫路由的匹配規則一致
+    language = request.args.get('language', '')
+    lesson = request.args.get('lesson', '')
+    found = data_store.registry().get(language, lesson)
+    if found is None:
+        return '找不到課程', 404
+    return fragment_cache.get_or_render(
+        ('lesson_content', language, lesson), found.version,
+        lambda: render_template('lesson_content.html', item=found.summary(), content=found.content))
 
 @app.route('/unmastered_words')
 def unmastered_words():
@@ -225,267 +301,72 @@ def unmastered_words():
 def search_lessons():
     """搜索課程 - 支持按標題和內容搜索"""
     keyword = request.args.get('keyword', '').strip().lower()
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit <= 0:
+        limit = None
     
     if not keyword:
         return jsonify([])
     
-    data = load_data()
-    results = []
-    
-    for key, value in data.items():
-        if isinstance(value, dict):
-            if ('詞語' in value or '段落' in value):
-                # 新格式課程
-                lesson_number = key
-                language = ''
-                is_simple = True
-                lesson_content = value
-            else:
-                # 舊格式課程，需要檢查每個lesson
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and ('詞語' in lesson_content or '段落' in lesson_content):
-                        lesson_number = lesson_num
-                        language = key
-                        is_simple = False
-                        
-                        # 檢查是否匹配
-                        match = False
-                        
-                        # 1. 匹配課程標題
-                        if keyword in lesson_number.lower():
-                            match = True
-                        
-                        # 2. 匹配詞語
-                        if not match:
-                            for word_item in lesson_content.get('詞語', []):
-                                word_text = word_item.get('word', '').lower()
-                                meaning_text = word_item.get('meaning', '').lower()
-                                if keyword in word_text or keyword in meaning_text:
-                                    match = True
-                                    break
-                        
-                        # 3. 匹配段落
-                        if not match:
-                            for para in lesson_content.get('段落', []):
-                                para_title = para.get('title', '').lower()
-                                if keyword in para_title:
-                                    match = True
-                                    break
-                                
-                                for sent in para.get('sentences', []):
-                                    sent_text = sent.get('sentence', '') if isinstance(sent, dict) else sent
-                                    if keyword in sent_text.lower():
-                                        match = True
-                                        break
-                                
-                                if match:
-                                    break
-                        
-                        if match:
-                            word_count = len(lesson_content.get('詞語', []))
-                            para_count = len(lesson_content.get('段落', []))
-                            results.append({
-                                'language': language,
-                                'lesson_number': lesson_number,
-                                'word_count': word_count,
-                                'para_count': para_count,
-                                'is_simple': is_simple
-                            })
-                continue
-            
-            # 新格式課程處理
-            lesson_number = key
-            language = ''
-            is_simple = True
-            
-            # 檢查是否匹配
-            match = False
-            
-            # 1. 匹配課程標題
-            if keyword in lesson_number.lower():
-                match = True
-            
-            # 2. 匹配詞語
-            if not match:
-                for word_item in lesson_content.get('詞語', []):
-                    word_text = word_item.get('word', '').lower()
-                    meaning_text = word_item.get('meaning', '').lower()
-                    if keyword in word_text or keyword in meaning_text:
-                        match = True
-                        break
-            
-            # 3. 匹配段落
-            if not match:
-                for para in lesson_content.get('段落', []):
-                    para_title = para.get('title', '').lower()
-                    if keyword in para_title:
-                        match = True
-                        break
-                    
-                    for sent in para.get('sentences', []):
-                        sent_text = sent.get('sentence', '') if isinstance(sent, dict) else sent
-                        if keyword in sent_text.lower():
-                            match = True
-                            break
-                    
-                    if match:
-                        break
-            
-            if match:
-                word_count = len(lesson_content.get('詞語', []))
-                para_count = len(lesson_content.get('段落', []))
-                results.append({
-                    'language': language,
-                    'lesson_number': lesson_number,
-                    'word_count': word_count,
-                    'para_count': para_count,
-                    'is_simple': is_simple
-                })
-    
-    return jsonify(results)
+    return jsonify(data_store.search_lessons(keyword, limit))
 
 @app.route('/api/get_unmastered_words')
 def get_unmastered_words():
-    """获取所有未掌握的单词"""
-    data = load_data()
-    unmastered_words = []
-    
-    # 遍历所有课程
-    for key, value in data.items():
-        if isinstance(value, dict):
-            # 检查是否为新格式课程（直接包含詞語和段落）
-            if '詞語' in value or '段落' in value:
-                # 新格式：课程名为key
-                lesson_name = key
-                language = ''
-                is_simple = True
-                
-                # 提取未掌握的词语
-                if '詞語' in value:
-                    for word_item in value['詞語']:
-                        word = word_item.get('word', '')
-                        attempts = word_item.get('attempts', 0)
-                        correct = word_item.get('correct', 0)
-                        
-                        # 未掌握的标准：尝试次数为0，或正确率低于75%
-                        if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                            unmastered_words.append({
-                                'word': word,
-                                'lesson': lesson_name,
-                                'language': language,
-                                'is_simple': True,
-                                'attempts': attempts,
-                                'accuracy': (correct / attempts * 100) if attempts > 0 else 0
-                            })
-            else:
-                # 旧格式：按语言分类
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and ('詞語' in lesson_content or '段落' in lesson_content):
-                        language = key
-                        is_simple = False
-                        
-                        # 提取未掌握的词语
-                        if '詞語' in lesson_content:
-                            for word_item in lesson_content['詞語']:
-                                word = word_item.get('word', '')
-                                attempts = word_item.get('attempts', 0)
-                                correct = word_item.get('correct', 0)
-                                
-                                # 未掌握的标准：尝试次数为0，或正确率低于75%
-                                if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                                    unmastered_words.append({
-                                        'word': word,
-                                        'lesson': lesson_num,
-                                        'language': language,
-                                        'is_simple': False,
-                                        'attempts': attempts,
-                                        'accuracy': (correct / attempts * 100) if attempts > 0 else 0
-                                    })
-    
-    # 按准确率排序（准确率低的优先）
-    unmastered_words.sort(key=lambda x: x['accuracy'])
-    
-    return jsonify(unmastered_words)
+    """
+    获取未掌握的单词（按准确率排序，准确率低的优先）
+
+    不帶參數時返回完整列表；可選參數：
+      language / lesson / min_accuracy / max_accuracy / never_attempted=1  過濾
+      count_only=1         只返回 {'count': 數量}
+      limit / cursor       分頁，返回 {'words', 'next_cursor', 'total', 'avg_accuracy'}
+    """
+    args = request.args
+    filters = {
+        'language': args.get('language'),
+        'lesson': args.get('lesson'),
+        'never_attempted': args.get('never_attempted') == '1'
+    }
+    try:
+        for name in ('min_accuracy', 'max_accuracy'):
+            filters[name] = float(args[name]) if args.get(name) else None
+            if filters[name] is not None and not math.isfinite(filters[name]):
+                raise ValueError(name)
+        limit = int(args['limit']) if args.get('limit') else None
+        cursor = args.get('cursor') or None
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError:
+        return jsonify({'error': '參數格式錯誤'}), 400
+    if args.get('count_only') == '1':
+        build = lambda: {'count': data_store.unmastered_count(**filters)}
+    elif limit is not None:
+        limit = max(1, min(limit, UNMASTERED_PAGE_MAX))
+        build = lambda: data_store.unmastered_page(limit, cursor, **filters)
+    else:
+        build = lambda: data_store.unmastered_words(**filters)
+    return conditional_json(data_store.data_version(), build)
 
 @app.route('/api/get_all_words')
 def get_all_words():
     """获取所有词语的统计信息"""
-    data = load_data()
-    total_words = 0
-    mastered_words = 0
-    
-    # 遍历所有课程
-    for key, value in data.items():
-        if isinstance(value, dict):
-            # 检查是否为新格式课程（直接包含詞語和段落）
-            if '詞語' in value:
-                # 新格式：课程名为key
-                for word_item in value['詞語']:
-                    total_words += 1
-                    attempts = word_item.get('attempts', 0)
-                    correct = word_item.get('correct', 0)
-                    
-                    # 已掌握的标准：正确率≥75%
-                    if attempts > 0 and correct / attempts >= 0.75:
-                        mastered_words += 1
-            else:
-                # 旧格式：按语言分类
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and '詞語' in lesson_content:
-                        for word_item in lesson_content['詞語']:
-                            total_words += 1
-                            attempts = word_item.get('attempts', 0)
-                            correct = word_item.get('correct', 0)
-                            
-                            # 已掌握的标准：正确率≥75%
-                            if attempts > 0 and correct / attempts >= 0.75:
-                                mastered_words += 1
-    
-    return jsonify({
-        'total': total_words,
-        'mastered': mastered_words,
-        'unmastered': total_words - mastered_words
-    })
+    return conditional_json(data_store.data_version(), data_store.word_mastery_counts)
 
 @app.route('/api/get_lessons_unmastered_counts')
 def get_lessons_unmastered_counts():
     """获取每个课程的未掌握单词数量"""
-    data = load_data()
-    lesson_counts = {}
-    
-    # 遍历所有课程
-    for key, value in data.items():
-        if isinstance(value, dict):
-            # 检查是否为新格式课程（直接包含詞語和段落）
-            if '詞語' in value:
-                # 新格式：课程名为key
-                unmastered_count = 0
-                for word_item in value['詞語']:
-                    attempts = word_item.get('attempts', 0)
-                    correct = word_item.get('correct', 0)
-                    
-                    # 未掌握的标准：尝试次数为0，或正确率低于75%
-                    if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                        unmastered_count += 1
-                
-                lesson_counts[key] = unmastered_count
-            else:
-                # 旧格式：按语言分类
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and '詞語' in lesson_content:
-                        unmastered_count = 0
-                        for word_item in lesson_content['詞語']:
-                            attempts = word_item.get('attempts', 0)
-                            correct = word_item.get('correct', 0)
-                            
-                            # 未掌握的标准：尝试次数为0，或正确率低于75%
-                            if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                                unmastered_count += 1
-                        
-                        lesson_key = key + '|' + lesson_num
-                        lesson_counts[lesson_key] = unmastered_count
-    
-    return jsonify(lesson_counts)
+    return conditional_json(data_store.data_version(), data_store.lesson_unmastered_counts)
+
+@app.route('/api/metrics')
+def metrics():
+    """運行指標 - 數據緩存命中率等"""
+    return jsonify({
+        'data_store': data_store.stats(),
+        'fragment_cache': fragment_cache.stats(),
+        'compressed_cache': compressed_cache.stats(),
+        'tts': tts_pool.stats(),
+        'tts_jobs': audio_jobs.stats(),
+        'audio_manifest': {'files': len(audio_manifest)}
+    })
 
 @app.route('/api/split_sentences', methods=['POST'])
 def api_split_sentences():
@@ -511,31 +392,9 @@ def api_split_sentences():
 @app.route('/quiz_all_unmastered')
 def quiz_all_unmastered():
     """聽寫所有未掌握的單詞"""
-    data = load_data()
-    
-    # 获取所有未掌握的词语
-    unmastered_words = []
-    for key, value in data.items():
-        if isinstance(value, dict):
-            if '詞語' in value or '段落' in value:
-                # 新格式课程
-                if '詞語' in value:
-                    for word_item in value['詞語']:
-                        word = word_item.get('word', '')
-                        attempts = word_item.get('attempts', 0)
-                        correct = word_item.get('correct', 0)
-                        if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                            unmastered_words.append(word)
-            else:
-                # 旧格式课程
-                for lesson_num, lesson_content in value.items():
-                    if isinstance(lesson_content, dict) and '詞語' in lesson_content:
-                        for word_item in lesson_content['詞語']:
-                            word = word_item.get('word', '')
-                            attempts = word_item.get('attempts', 0)
-                            correct = word_item.get('correct', 0)
-                            if attempts == 0 or (attempts > 0 and correct / attempts < 0.75):
-                                unmastered_words.append(word)
+    # 获取所有未掌握的词语（按課程順序）
+    unmastered_words = [word_item.get('word', '') for lesson in data_store.registry()
+                        for word_item in lesson.words if not is_mastered(word_item)]
     
     if not unmastered_words:
         return "沒有未掌握的單詞", 404
@@ -543,11 +402,9 @@ def quiz_all_unmastered():
     # 预加载TTS
     print(f"[ALL_UNMASTERED] Preloading {len(unmastered_words)} words for TTS")
     for i, word in enumerate(unmastered_words):
-        word_hash = hashlib.md5(word.encode('utf-8')).hexdigest()
-        audio_file = os.path.join(AUDIO_DIR, f'{word_hash}.mp3')
-        if not os.path.exists(audio_file):
+        if not audio_manifest.has(audio_hash(word)):
             print(f"[ALL_UNMASTERED] Queuing word {i+1}/{len(unmastered_words)}: {word}")
-            tts_queue.put((word, audio_file))
+            tts_pool.submit(word, audio_file_for(word), priority=TTSJobQueue.INTERACTIVE)
         else:
             print(f"[ALL_UNMASTERED] Already cached: {word}")
     
@@ -573,9 +430,18 @@ def quiz_all_unmastered():
                          content_type='詞語',
                          return_to='/unmastered_words')
 
+def is_known_text(text):
+    """文本是否是当前听写中的条目或某个课程中的词语、句子：只为这些文本按需生成音频"""
+    if text in session.get('current_quiz', {}).get('words', []):
+        return True
+    return data_store.registry().has_text(text)
+
 @app.route('/tts/<word>')
 def generate_tts(word):
-    """获取已生成的音频文件 URL（只读取不生成）"""
+    """
+    获取音频文件 URL；未生成时按需生成并最多等待 TTS_WAIT 秒（同一音频的并发请求共用一次生成），
+    超时返回 202 和 status=pending。只为课程内容和当前听写中的文本按需生成，其他文本仍返回 404
+    """
     if not tts_engine:
         print("[TTS] TTS engine not available")
         return jsonify({'error': 'TTS engine not available'}), 500
@@ -586,27 +452,51 @@ def generate_tts(word):
         print(f"[TTS] Request for: {word}")
         
         # 生成文件名（使用MD5哈希）
-        word_hash = hashlib.md5(word.encode('utf-8')).hexdigest()
-        audio_file = os.path.join(AUDIO_DIR, f'{word_hash}.mp3')
-        
-        # 检查文件是否存在（不再尝试生成）
-        if os.path.exists(audio_file):
-            file_size = os.path.getsize(audio_file)
-            audio_url = f'/static/audio/{word_hash}.mp3?v={int(time.time())}'
-            print(f"[TTS] ✓ Found: '{word}' ({file_size} bytes)")
+        word_hash = audio_hash(word)
+        
+        # 查音频清单
+        entry = audio_manifest.get(word_hash)
+        cached = entry is not None
+        status = 'ready' if cached else None
+        if not cached and TTS_ON_DEMAND and is_known_text(word):
+            print(f"[TTS] On-demand generation for: '{word}' (waiting up to {TTS_WAIT}s)")
+            status = tts_pool.generate_wait(word, audio_file_for(word), TTS_WAIT)
+        if status == 'ready':
+            audio_url = audio_url_for(word_hash)
+            print(f"[TTS] ✓ {'Found' if cached else 'Generated'}: '{word}'")
             return jsonify({
                 'success': True,
+                'status': 'ready',
                 'url': audio_url,
-                'cached': True,
+                'cached': cached,
                 'ready': True,
                 'word': word,
                 'hash': word_hash
             })
+        elif status == 'pending':
+            print(f"[TTS] … Still generating: '{word}'")
+            return jsonify({
+                'success': False,
+                'status': 'pending',
+                'ready': False,
+                'word': word,
+                'hash': word_hash
+            }), 202
+        elif status == 'failed':
+            print(f"[TTS] ✗ Generation failed: '{word}'")
+            return jsonify({
+                'success': False,
+                'status': 'failed',
+                'error': f'Audio generation failed for: {word}. Please try again later.',
+                'word': word,
+                'hash': word_hash
+            }), 503
         else:
             # 文件不存在 - 返回错误，不尝试生成
             print(f"[TTS] ✗ Not found: '{word}' - file was not pre-generated during save")
             return jsonify({
                 'success': False,
+                'status': 'missing',
                 'error': f'Audio file not found for: {word}. Please re-save the lesson to generate audio.',
                 'word': word,
                 'hash': word_hash
@@ -620,6 +510,99 @@ def generate_tts(word):
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/audio/<text_hash>.mp3')
+def serve_audio(text_hash):
+    """
+    按文本哈希提供音频：长期缓存（immutable），强 ETag 为哈希本身，
+    支持 If-None-Match 和 Range（send_file conditional）
+    """
+    if len(text_hash) != 32 or not all(c in '0123456789abcdef' for c in text_hash) \
+            or not audio_manifest.has(text_hash):
+        return jsonify({'error': 'Audio not found'}), 404
+    try:
+        response = send_file(os.path.join(AUDIO_DIR, f'{text_hash}.mp3'), mimetype='audio/mpeg',
+                             conditional=True, etag=text_hash, max_age=AUDIO_MAX_AGE)
+    except FileNotFoundError:
+        # 文件被手动删除而清单未更新（见 audio_manifest.py reconcile）
+        return jsonify({'error': 'Audio not found'}), 404
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/audio_manifest', methods=['POST'])
+def get_audio_manifest():
+    """
+    一次返回整个听写所有条目的音频状态：{"texts": [...], "wait": 秒}
+    status 为 ready（附 url）、pending（在生成队列中）、failed（死信）或 missing（未生成也不在队列中）。
+    wait 大于 0 且有 pending 条目时长轮询：等到至少一个 pending 条目生成完成或超时再返回
+    """
+    payload = request.get_json(silent=True) or {}
+    texts = payload.get('texts')
+    try:
+        wait = float(payload.get('wait', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': '參數格式錯誤'}), 400
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts) or not math.isfinite(wait):
+        return jsonify({'error': '參數格式錯誤'}), 400
+    if len(texts) > AUDIO_MANIFEST_MAX:
+        return jsonify({'error': f'一次最多查詢 {AUDIO_MANIFEST_MAX} 個文本'}), 400
+
+    hashes = {text: audio_hash(text) for text in texts}
+
+    def statuses():
+        missing = {h for h in hashes.values() if not audio_manifest.has(h)}
+        queued = tts_queue.states(missing)
+        result = {}
+        for text, text_hash in hashes.items():
+            if text_hash not in missing:
+                result[text] = 'ready'
+            else:
+                state = queued.get(text_hash)
+                result[text] = 'failed' if state == 'dead' else 'pending' if state else 'missing'
+        return result
+
+    status = statuses()
+    wait = min(max(wait, 0), AUDIO_POLL_MAX)
+    pending = {hashes[text] for text, state in status.items() if state == 'pending'}
+    if wait > 0 and pending:
+        if audio_manifest.wait_any(pending, wait):
+            status = statuses()
+
+    items = []
+    counts = {'ready': 0, 'pending': 0, 'failed': 0, 'missing': 0}
+    for text, text_hash in hashes.items():
+        item = {'text': text, 'hash': text_hash, 'status': status[text]}
+        if status[text] == 'ready':
+            item['url'] = audio_url_for(text_hash)
+        counts[status[text]] += 1
+        items.append(item)
+    return jsonify(dict(counts, items=items))
+
+@app.route('/api/tts_jobs/<job_id>')
+def tts_job_status(job_id):
+    """音频生成任务的进度：status 为 pending/done/failed，另有完成、失败和等待中的数量"""
+    progress = audio_jobs.snapshot(job_id)
+    if progress is None:
+        return jsonify({'error': f'找不到任務: {job_id}'}), 404
+    return jsonify(progress)
+
+@app.route('/api/tts_jobs/<job_id>/retry', methods=['POST'])
+def retry_tts_job(job_id):
+    """重新生成任务中失败的文本"""
+    if audio_jobs.retry(job_id) is None:
+        return jsonify({'error': f'找不到任務: {job_id}'}), 404
+    return jsonify(audio_jobs.snapshot(job_id))
+
+@app.route('/api/tts_queue/dead')
+def tts_dead_letters():
+    """重试次数用完的音频任务（死信）"""
+    return jsonify(tts_queue.dead_letters(request.args.get('limit', 100, type=int)))
+
+@app.route('/api/tts_queue/dead/retry', methods=['POST'])
+def retry_tts_dead_letters():
+    """把所有死信重新加入队列"""
+    return jsonify({'requeued': tts_queue.revive_dead()})
+
 @app.route('/create_lesson', methods=['GET', 'POST'])
 def create_lesson():
     """顯示簡化的課程創建頁面"""
@@ -638,53 +621,48 @@ def add_content():
         if not all([language, lesson_number, content_type]):
             return jsonify({'error': '缺少必要參數'}), 400
         
-        data = load_data()
+        # 持有排他鎖完成讀-改-寫，避免多個 worker 互相覆蓋
+        with data_store.locked():
+            # 檢查課程是否已存在
+            if data_store.load_lesson(language, lesson_number) is not None:
+                return jsonify({'error': '該課程已存在'}), 400
         
-        # 確保語言分類存在
-        if language not in data:
-            data[language] = {}
-        
-        # 檢查課程是否已存在
-        if lesson_number in data[language]:
-            return jsonify({'error': '該課程已存在'}), 400
-        
-        # 初始化課程結構
-        lesson_data = {
-            '詞語': [],
-            '段落': []
-        }
-        
-        # 處理詞語內容
-        if content_type == '詞語':
-            words = req_data.get('words', [])
-            for word in words:
-                lesson_data['詞語'].append({
-                    'word': word,
-                    'meaning': '',
-                    'attempts': 0,
-                    'correct': 0,
-                    'incorrect': 0,
-                    'history': []
-                })
+            # 初始化課程結構
+            lesson_data = {
+                '詞語': [],
+                '段落': []
+            }
         
-        # 處理段落內容 (新結構：每個段落是獨立項)
-        elif content_type == '段落':
-            paragraphs = req_data.get('paragraphs', [])
-            for idx, para in enumerate(paragraphs):
-                para_obj = {
-                    'id': f"para_{idx+1}",
-                    'title': para.get('title', f'段落{idx+1}'),
-                    'sentences': para.get('sentences', []),
-                    'attempts': 0,
-                    'correct': 0,
-                    'incorrect': 0,
-                    'history': []
-                }
-                lesson_data['段落'].append(para_obj)
-        
-        # 保存到數據文件
-        data[language][lesson_number] = lesson_data
-        save_data(data)
+            # 處理詞語內容
+            if content_type == '詞語':
+                words = req_data.get('words', [])
+                for word in words:
+                    lesson_data['詞語'].append({
+                        'word': word,
+                        'meaning': '',
+                        'attempts': 0,
+                        'correct': 0,
+                        'incorrect': 0,
+                        'history': []
+                    })
+        
+            # 處理段落內容 (新結構：每個段落是獨立項)
+            elif content_type == '段落':
+                paragraphs = req_data.get('paragraphs', [])
+                for idx, para in enumerate(paragraphs):
+                    para_obj = {
+                        'id': f"para_{idx+1}",
+                        'title': para.get('title', f'段落{idx+1}'),
+                        'sentences': para.get('sentences', []),
+                        'attempts': 0,
+                        'correct': 0,
+                        'incorrect': 0,
+                        'history': []
+                    }
+                    lesson_data['段落'].append(para_obj)
+        
+            # 只保存這個課程
+            data_store.save_lesson(language, lesson_number, lesson_data)
         
         # 計算詞語和段落的數量用於前端記錄
         word_count = len(lesson_data.get('詞語', []))
@@ -711,9 +689,7 @@ def add_content():
         # 將所有文本加入 TTS 生成隊列
         print(f"[ADD_CONTENT] Queueing {len(texts_to_generate)} texts for TTS generation")
         for text in texts_to_generate:
-            word_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-            audio_file = os.path.join(AUDIO_DIR, f'{word_hash}.mp3')
-            tts_queue.put((text, audio_file))
+            tts_pool.submit(text, audio_file_for(text), revive=True)
             print(f"[ADD_CONTENT] Queued: {text}")
         
         return jsonify({
@@ -741,25 +717,26 @@ def create_lesson_simple():
         if not lesson_name:
             return jsonify({'error': '課程名稱不能為空'}), 400
         
-        data = load_data()
+        # 持有排他鎖完成讀-改-寫，避免多個 worker 互相覆蓋
+        with data_store.locked():
+            data = load_data()
         
-        # 確保根層級存在（不再按語言分類）
-        if not isinstance(data, dict):
-            data = {}
+            # 確保根層級存在（不再按語言分類）
+            if not isinstance(data, dict):
+                data = {}
         
-        # 檢查課程是否已存在
-        if lesson_name in data:
-            return jsonify({'error': '該課程已存在'}), 400
+            # 檢查課程是否已存在
+            if lesson_name in data:
+                return jsonify({'error': '該課程已存在'}), 400
         
-        # 創建空課程結構
-        lesson_data = {
-            '詞語': [],
-            '段落': []
-        }
+            # 創建空課程結構
+            lesson_data = {
+                '詞語': [],
+                '段落': []
+            }
         
-        # 保存到數據文件
-        data[lesson_name] = lesson_data
-        save_data(data)
+            # 只保存這個課程
+            data_store.save_lesson('', lesson_name, lesson_data)
         
         return jsonify({
             'status': 'success', 
@@ -782,13 +759,11 @@ def edit_content_simple(lesson_name):
     # 解碼 URL 參數
     lesson_name = unquote(lesson_name)
     
-    data = load_data()
+    lesson_content = data_store.load_lesson('', lesson_name)
     
-    if lesson_name not in data:
+    if lesson_content is None:
         return "課程未找到", 404
     
-    lesson_content = data[lesson_name]
-    
     # 使用 edit_content_new.html 模板（如果存在），否則使用改進版的 edit_content.html
     return render_template('edit_content.html',
                           language='',  # 新流程不需要語言
@@ -803,13 +778,11 @@ def edit_content(language, lesson_num):
     language = unquote(language)
     lesson_num = unquote(lesson_num)
     
-    data = load_data()
+    lesson_content = data_store.load_lesson(language, lesson_num)
     
-    if language not in data or lesson_num not in data[language]:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[language][lesson_num]
-    
     return render_template('edit_content.html',
                           language=language,
                           lesson_number=lesson_num,
@@ -829,88 +802,88 @@ def update_content():
         if not all([language, lesson_number]):
             return jsonify({'error': '缺少必要參數'}), 400
         
-        data = load_data()
-        
-        if language not in data or lesson_number not in data[language]:
-            return jsonify({'error': '內容未找到'}), 404
+        # 持有排他鎖完成讀-改-寫，避免多個 worker 互相覆蓋
+        with data_store.locked():
+            lesson_content = data_store.load_lesson(language, lesson_number)
         
-        lesson_content = data[language][lesson_number]
+            if lesson_content is None:
+                return jsonify({'error': '內容未找到'}), 404
         
-        # 更新詞語
-        updated_words = []
-        for word_data in words:
-            # 查找原有的詞語記錄（保留統計數據）
-            original = None
-            for old_word in lesson_content.get('詞語', []):
-                if old_word['word'] == word_data['original_word']:
-                    original = old_word
-                    break
+            # 更新詞語
+            updated_words = []
+            for word_data in words:
+                # 查找原有的詞語記錄（保留統計數據）
+                original = None
+                for old_word in lesson_content.get('詞語', []):
+                    if old_word['word'] == word_data['original_word']:
+                        original = old_word
+                        break
             
-            if original:
-                # 保留原有的統計數據
-                updated_words.append({
-                    'word': word_data['word'],
-                    'meaning': word_data.get('meaning', ''),
-                    'attempts': original.get('attempts', 0),
-                    'correct': original.get('correct', 0),
-                    'incorrect': original.get('incorrect', 0),
-                    'history': original.get('history', [])
-                })
-            else:
-                # 新詞語
-                updated_words.append({
-                    'word': word_data['word'],
-                    'meaning': word_data.get('meaning', ''),
-                    'attempts': 0,
-                    'correct': 0,
-                    'incorrect': 0,
-                    'history': []
-                })
+                if original:
+                    # 保留原有的統計數據
+                    updated_words.append({
+                        'word': word_data['word'],
+                        'meaning': word_data.get('meaning', ''),
+                        'attempts': original.get('attempts', 0),
+                        'correct': original.get('correct', 0),
+                        'incorrect': original.get('incorrect', 0),
+                        'history': original.get('history', [])
+                    })
+                else:
+                    # 新詞語
+                    updated_words.append({
+                        'word': word_data['word'],
+                        'meaning': word_data.get('meaning', ''),
+                        'attempts': 0,
+                        'correct': 0,
+                        'incorrect': 0,
+                        'history': []
+                    })
         
-        # 更新段落 (新結構)
-        updated_paragraphs = []
-        para_id_counter = 1
-        for para_data in paragraphs:
-            # 查找原有的段落記錄（保留統計數據）
-            original = None
-            original_para_id = para_data.get('id')
-            if original_para_id:
-                for old_para in lesson_content.get('段落', []):
-                    if old_para.get('id') == original_para_id:
-                        original = old_para
-                        break
+            # 更新段落 (新結構)
+            updated_paragraphs = []
+            para_id_counter = 1
+            for para_data in paragraphs:
+                # 查找原有的段落記錄（保留統計數據）
+                original = None
+                original_para_id = para_data.get('id')
+                if original_para_id:
+                    for old_para in lesson_content.get('段落', []):
+                        if old_para.get('id') == original_para_id:
+                            original = old_para
+                            break
             
-            if original:
-                # 保留原有的統計數據
-                updated_para = {
-                    'id': original.get('id'),
-                    'title': para_data.get('title', original.get('title', '')),
-                    'sentences': para_data.get('sentences', []),
-                    'attempts': original.get('attempts', 0),
-                    'correct': original.get('correct', 0),
-                    'incorrect': original.get('incorrect', 0),
-                    'history': original.get('history', [])
-                }
-            else:
-                # 新段落
-                updated_para = {
-                    'id': f"para_{para_id_counter}",
-                    'title': para_data.get('title', f'段落{para_id_counter}'),
-                    'sentences': para_data.get('sentences', []),
-                    'attempts': 0,
-                    'correct': 0,
-                    'incorrect': 0,
-                    'history': []
-                }
-                para_id_counter += 1
+                if original:
+                    # 保留原有的統計數據
+                    updated_para = {
+                        'id': original.get('id'),
+                        'title': para_data.get('title', original.get('title', '')),
+                        'sentences': para_data.get('sentences', []),
+                        'attempts': original.get('attempts', 0),
+                        'correct': original.get('correct', 0),
+                        'incorrect': original.get('incorrect', 0),
+                        'history': original.get('history', [])
+                    }
+                else:
+                    # 新段落
+                    updated_para = {
+                        'id': f"para_{para_id_counter}",
+                        'title': para_data.get('title', f'段落{para_id_counter}'),
+                        'sentences': para_data.get('sentences', []),
+                        'attempts': 0,
+                        'correct': 0,
+                        'incorrect': 0,
+                        'history': []
+                    }
+                    para_id_counter += 1
             
-            updated_paragraphs.append(updated_para)
+                updated_paragraphs.append(updated_para)
         
-        # 更新數據
-        lesson_content['詞語'] = updated_words
-        lesson_content['段落'] = updated_paragraphs
+            # 更新數據
+            lesson_content['詞語'] = updated_words
+            lesson_content['段落'] = updated_paragraphs
         
-        save_data(data)
+            data_store.save_lesson(language, lesson_number, lesson_content)
         
         return jsonify({'status': 'success', 'message': '內容已成功更新'}), 200
     
@@ -925,27 +898,12 @@ def delete_content(language, lesson_num):
         language = unquote(language)
         lesson_num = unquote(lesson_num)
         
-        data = load_data()
+        # 支持新流程：language 為 'simple' 或空字符串，課程直接存储在數据根級別
+        if language == 'simple':
+            language = ''
         
-        # 支持新流程：language 為 'simple' 或空字符串
-        if language == 'simple' or language == '':
-            # 新格式：課程直接存储在數据根級別
-            if lesson_num in data:
-                del data[lesson_num]
-                save_data(data)
-        else:
-            # 舊格式：按语言分类
-            if language not in data or lesson_num not in data[language]:
-                # 即使未找到，也重定向回列表頁面
-                return redirect(url_for('vocab_list'))
-            
-            del data[language][lesson_num]
-            
-            # 如果語言下沒有課程了，刪除語言
-            if not data[language]:
-                del data[language]
-            
-            save_data(data)
+        # 只刪除這個課程；舊格式下語言沒有課程了會一併刪除語言，未找到時也重定向回列表頁面
+        data_store.delete_lesson(language, lesson_num)
         
         # 成功刪除後重定向回列表頁面
         return redirect(url_for('vocab_list'))
@@ -962,19 +920,12 @@ def quiz_simple(lesson_name):
     content_type = request.args.get('content_type', '詞語').strip()
     paragraph_id = request.args.get('paragraph_id', '').strip()
     
-    data = load_data()
-    
-    # 查找簡化格式的課程
+    # 查找簡化格式的課程（只讀取這一個課程）
     print(f"DEBUG: Looking for lesson_name: {repr(lesson_name)}")
-    print(f"DEBUG: Available keys: {[repr(k) for k in data.keys() if '17' in k]}")
-    
-    if lesson_name not in data:
-        return "聽寫內容未找到", 404
-    
-    lesson_content = data[lesson_name]
+    lesson_content = data_store.load_lesson('', lesson_name)
     
     # 驗證是否為簡化格式（包含詞語或段落）
-    if not isinstance(lesson_content, dict) or ('詞語' not in lesson_content and '段落' not in lesson_content):
+    if lesson_content is None or ('詞語' not in lesson_content and '段落' not in lesson_content):
         return "聽寫內容未找到", 404
     
     words_to_practice = []
@@ -1002,11 +953,9 @@ def quiz_simple(lesson_name):
     # 預先將所有詞語/句子加入 TTS 生成隊列，避免延遲
     print(f"[QUIZ_SIMPLE] Preloading {len(words_to_practice)} items for TTS (content_type={content_type})")
     for i, word in enumerate(words_to_practice):
-        word_hash = hashlib.md5(word.encode('utf-8')).hexdigest()
-        audio_file = os.path.join(AUDIO_DIR, f'{word_hash}.mp3')
-        if not os.path.exists(audio_file):
+        if not audio_manifest.has(audio_hash(word)):
             print(f"[QUIZ] Queuing word {i+1}/{len(words_to_practice)}: {word}")
-            tts_queue.put((word, audio_file))
+            tts_pool.submit(word, audio_file_for(word), priority=TTSJobQueue.INTERACTIVE)
         else:
             print(f"[QUIZ] Already cached: {word}")
     
@@ -1042,13 +991,11 @@ def quiz_new(language, lesson_num):
     paragraph_id = request.args.get('paragraph_id', '').strip()  # 特定段落ID
     print(f"[QUIZ] content_type={content_type}, paragraph_id={paragraph_id}")
     
-    data = load_data()
+    lesson_content = data_store.load_lesson(language, lesson_num)
     
-    if language not in data or lesson_num not in data[language]:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[language][lesson_num]
-    
     words_to_practice = []
     if content_type == '詞語' and '詞語' in lesson_content:
         # 詞語作為整體框，總是聽寫所有詞語
@@ -1094,14 +1041,6 @@ def quiz_new(language, lesson_num):
                           words_json=words_json,
                           content_type=content_type)
 
-def normalize_text(text):
-    """Normalize text for comparison - removes extra whitespace and normalizes newlines"""
-    if not isinstance(text, str):
-        return ""
-    # Convert all types of newlines and extra whitespace to single spaces
-    normalized = ' '.join(text.split())
-    return normalized
-
 def get_chinese_char_count(text):
     """计算仅汉字的字数（不计标点、数字、英文）"""
     if not text:
@@ -1416,8 +1355,6 @@ def format_sentences_new(text):
 @app.route('/submit_answer', methods=['POST'])
 def submit_answer():
     """Handle quiz answer submission - works with or without session"""
-    data = load_data()
-    
     # Get parameters from request - these are sent from JavaScript
     word = request.form.get('word', '').strip()
     language = request.form.get('language', '').strip()
@@ -1429,165 +1366,93 @@ def submit_answer():
     if not word or not lesson:
         return jsonify({'error': '缺少必要參數'}), 400
     
-    # Normalize word for comparison (especially for paragraphs with newlines)
-    word_normalized = normalize_text(word)
-    
-    # 特殊处理：所有未掌握单词
+    # 特殊处理：所有未掌握单词 - 先找到单词所在的课程
     if lesson == '所有未掌握單詞':
-        # 遍历所有课程查找并更新单词
-        word_found = False
-        for key, value in data.items():
-            if isinstance(value, dict):
-                # 新格式课程
-                if '詞語' in value:
-                    for word_item in value['詞語']:
-                        if word_item['word'] == word:
-                            word_item['attempts'] += 1
-                            if is_known:
-                                word_item['correct'] += 1
-                            else:
-                                word_item['incorrect'] += 1
-                            
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            word_item['history'].append({
-                                "timestamp": timestamp,
-                                "known": is_known
-                            })
-                            word_found = True
-                            break
-                    if word_found:
-                        break
-                else:
-                    # 旧格式课程
-                    for lesson_num, lesson_content in value.items():
-                        if isinstance(lesson_content, dict) and '詞語' in lesson_content:
-                            for word_item in lesson_content['詞語']:
-                                if word_item['word'] == word:
-                                    word_item['attempts'] += 1
-                                    if is_known:
-                                        word_item['correct'] += 1
-                                    else:
-                                        word_item['incorrect'] += 1
-                                    
-                                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                                    word_item['history'].append({
-                                        "timestamp": timestamp,
-                                        "known": is_known
-                                    })
-                                    word_found = True
-                                    break
-                            if word_found:
-                                break
-                if word_found:
-                    break
-        
-        if not word_found:
+        found = data_store.registry().find_word(word)
+        if not found:
             return jsonify({'error': f'找不到單詞: {word}'}), 400
-    else:
-        # 普通课程处理
-        # Validate data structure
-        try:
-            # Support both old format (language/lesson) and new format (direct lesson)
-            if language and language in data and lesson in data[language]:
-                # Old format: language/lesson
-                lesson_data = data[language][lesson]
-            elif not language and lesson in data:
-                # New format: direct lesson
-                lesson_data = data[lesson]
-            else:
-                return jsonify({'error': f'找不到課程: {language or ""}/{lesson}'}), 400
-        except KeyError:
-            return jsonify({'error': f'找不到課程: {language or ""}/{lesson}'}), 400
-        
-        # Find and update the record based on content type
-        word_found = False
-        
-        if content_type == '詞語' and '詞語' in lesson_data:
-            # Handle word entries
-            for word_item in lesson_data['詞語']:
-                if word_item['word'] == word:
-                    word_item['attempts'] += 1
-                    if is_known:
-                        word_item['correct'] += 1
-                    else:
-                        word_item['incorrect'] += 1
-                    
-                    # Record history
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    word_item['history'].append({
-                        "timestamp": timestamp,
-                        "known": is_known
-                    })
-                    word_found = True
-                    break
-        
-        elif content_type == '段落' and '段落' in lesson_data:
-            # Handle paragraph/sentence entries (新結構：同時更新段落和句子的統計)
-            for para in lesson_data['段落']:
-                for sent_item in para.get('sentences', []):
-                    sent_text = sent_item.get('sentence') if isinstance(sent_item, dict) else sent_item
-                    # Normalize both texts for comparison (handles newlines and whitespace differences)
-                    sent_text_normalized = normalize_text(sent_text)
-                    if sent_text_normalized == word_normalized or sent_text == word:
-                        # 更新句子統計
-                        if isinstance(sent_item, dict):
-                            sent_item['attempts'] = sent_item.get('attempts', 0) + 1
-                            if is_known:
-                                sent_item['correct'] = sent_item.get('correct', 0) + 1
-                            else:
-                                sent_item['incorrect'] = sent_item.get('incorrect', 0) + 1
-                            
-                            # Record history for sentence
-                            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                            if 'history' not in sent_item:
-                                sent_item['history'] = []
-                            sent_item['history'].append({
-                                "timestamp": timestamp,
-                                "known": is_known
-                            })
-                        
-                        # 同時更新段落統計 (新結構)
-                        para['attempts'] = para.get('attempts', 0) + 1
-                        if is_known:
-                            para['correct'] = para.get('correct', 0) + 1
-                        else:
-                            para['incorrect'] = para.get('incorrect', 0) + 1
-                        
-                        # Record history for paragraph
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        if 'history' not in para:
-                            para['history'] = []
-                        para['history'].append({
-                            "timestamp": timestamp,
-                            "known": is_known
-                        })
-                        
-                        word_found = True
-                        break
-                if word_found:
-                    break
-        
-        if not word_found:
-            return jsonify({'error': f'找不到內容: {word}'}), 400
+        language, lesson = found.key
+        content_type = '詞語'
+    elif data_store.load_lesson(language, lesson) is None:
+        return jsonify({'error': f'找不到課程: {language or ""}/{lesson}'}), 400
     
-    # Save data
-    save_data(data)
+    # 只追加一條日誌記錄，不再重寫整個數據文件
+    if not data_store.record_attempt(language, lesson, content_type, word, is_known):
+        return jsonify({'error': f'找不到內容: {word}'}), 400
     
     return jsonify({'status': 'success', 'message': f'已保存 {word} 的答題結果'})
 
 
+@app.route('/submit_answers', methods=['POST'])
+def submit_answers():
+    """
+    批量提交一次聽寫的答題結果：所有結果一次加鎖、一次寫入
+
+    JSON: {"language": "", "lesson": "...", "content_type": "詞語",
+           "results": [{"item": "...", "known": true, "timestamp": "YYYY-MM-DD HH:MM:SS"}, ...]}
+    返回每條結果的狀態；時間戳缺失或格式不對時用服務器時間
+    """
+    payload = request.get_json(silent=True) or {}
+    language = str(payload.get('language') or '').strip()
+    lesson = str(payload.get('lesson') or '').strip()
+    content_type = str(payload.get('content_type') or '詞語').strip()
+    results = payload.get('results')
+
+    if not lesson or not isinstance(results, list):
+        return jsonify({'error': '缺少必要參數'}), 400
+
+    all_unmastered = lesson == '所有未掌握單詞'
+    if all_unmastered:
+        registry = data_store.registry()
+    elif data_store.load_lesson(language, lesson) is None:
+        return jsonify({'error': f'找不到課程: {language or ""}/{lesson}'}), 400
+
+    statuses = []
+    records = []
+    for result in results:
+        item = str(result.get('item') or '').strip() if isinstance(result, dict) else ''
+        status = {'item': item, 'status': 'error'}
+        statuses.append(status)
+        if not item:
+            status['error'] = '缺少必要參數'
+            continue
+        record_language, record_lesson, record_type = language, lesson, content_type
+        if all_unmastered:
+            # 所有未掌握單詞：每個單詞先找到所在的課程
+            found = registry.find_word(item)
+            if not found:
+                status['error'] = f'找不到單詞: {item}'
+                continue
+            record_language, record_lesson = found.key
+            record_type = '詞語'
+        timestamp = result.get('timestamp')
+        try:
+            datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            timestamp = None
+        records.append((status, attempt_record(record_language, record_lesson, record_type, item,
+                                               result.get('known') is True, timestamp)))
+
+    applied = data_store.record_attempts([record for _, record in records]) if records else []
+    for (status, _), ok in zip(records, applied):
+        if ok:
+            status['status'] = 'success'
+        else:
+            status['error'] = f'找不到內容: {status["item"]}'
+
+    return jsonify({'status': 'success', 'saved': sum(applied), 'results': statuses})
+
+
 @app.route('/review_simple/<lesson_name>')
 def review_simple(lesson_name):
     """複習路由 - 新簡化流程，不需要語言參數"""
     lesson_name = unquote(lesson_name)
     
-    data = load_data()
+    lesson_content = data_store.load_lesson('', lesson_name)
     
-    if lesson_name not in data:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[lesson_name]
-    
     # Collect words needing review
     review_words = []
     if '詞語' in lesson_content:
@@ -1626,13 +1491,11 @@ def review_new(language, lesson_num):
     language = unquote(language)
     lesson_num = unquote(lesson_num)
     
-    data = load_data()
+    lesson_content = data_store.load_lesson(language, lesson_num)
     
-    if language not in data or lesson_num not in data[language]:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[language][lesson_num]
-    
     # Collect words needing review
     review_words = []
     if '詞語' in lesson_content:
@@ -1702,13 +1565,11 @@ def review_quiz(language, lesson_num):
     lesson_num = unquote(lesson_num)
     content_type = request.args.get('content_type', '詞語').strip()
     
-    data = load_data()
+    lesson_content = data_store.load_lesson(language, lesson_num)
     
-    if language not in data or lesson_num not in data[language]:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[language][lesson_num]
-    
     # Get only items that need review (accuracy < 0.75)
     items_to_review = []
     
@@ -1773,68 +1634,31 @@ def lesson_stats_api(language, lesson_num):
     language = unquote(language)
     lesson_num = unquote(lesson_num)
     
-    data = load_data()
-    
-    if language not in data or lesson_num not in data[language]:
+    version = data_store.lesson_version(language, lesson_num)
+    if version is None:
         return jsonify({'error': '聽寫內容未找到'}), 404
     
-    lesson_content = data[language][lesson_num]
-    
-    total_items = 0
-    mastered = 0
-    needs_review = 0
-    
-    # Count words (詞語)
-    if '詞語' in lesson_content:
-        for item in lesson_content['詞語']:
-            total_items += 1
-            
-            # Only count tested words (attempts > 0) for statistics
-            if item['attempts'] > 0:
-                accuracy = item['correct'] / item['attempts']
-                if accuracy >= 0.75:
-                    mastered += 1
-                else:
-                    needs_review += 1
-            else:
-                # Untested words are counted in needs_review
-                needs_review += 1
-    
-    # Count sentences in paragraphs (段落)
-    if '段落' in lesson_content:
-        for para in lesson_content['段落']:
-            for sent in para.get('sentences', []):
-                total_items += 1
-                
-                if sent['attempts'] > 0:
-                    accuracy = sent['correct'] / sent['attempts']
-                    if accuracy >= 0.75:
-                        mastered += 1
-                    else:
-                        needs_review += 1
-                else:
-                    # Untested sentences are counted in needs_review
-                    needs_review += 1
-    
-    return jsonify({
-        'total_words': total_items,
-        'mastered': mastered,
-        'needs_review': needs_review,
-        'mastered_percentage': round((mastered / total_items) * 100, 1) if total_items > 0 else 0
-    })
+    return conditional_json(version, lambda: data_store.lesson_stats(language, lesson_num))
 
 @app.route('/stats_simple/<lesson_name>')
 def stats_simple(lesson_name):
     """統計頁面 - 新簡化流程，不需要語言參數"""
     lesson_name = unquote(lesson_name)
+    return cached_stats_page('', lesson_name, lambda: _stats_simple_page(lesson_name))
+
+def cached_stats_page(language, lesson, render):
+    """統計頁按課程版本號緩存；版本號在渲染之前取得，課程不存在時不緩存"""
+    version = data_store.lesson_version(language, lesson)
+    if version is None:
+        return render()
+    return fragment_cache.get_or_render(('stats', language, lesson), version[0], render)
+
+def _stats_simple_page(lesson_name):
+    lesson_content = data_store.load_lesson('', lesson_name)
     
-    data = load_data()
-    
-    if lesson_name not in data:
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
-    lesson_content = data[lesson_name]
-    
     # Collect word statistics
     word_stats = {
         'total': 0,
@@ -1946,17 +1770,12 @@ def lesson_stats_new(language, lesson_num):
     """統計頁面 - 返回HTML"""
     language = unquote(language)
     lesson_num = unquote(lesson_num)
-    
-    data = load_data()
-    
+    return cached_stats_page(language, lesson_num, lambda: _lesson_stats_page(language, lesson_num))
+
+def _lesson_stats_page(language, lesson_num):
     # 支持新格式（language 為空）和舊格式
-    if language and language in data and lesson_num in data[language]:
-        # 舊格式：language/lesson
-        lesson_content = data[language][lesson_num]
-    elif not language and lesson_num in data:
-        # 新格式：直接 lesson
-        lesson_content = data[lesson_num]
-    else:
+    lesson_content = data_store.load_lesson(language, lesson_num)
+    if lesson_content is None:
         return "聽寫內容未找到", 404
     
     # Collect word statistics
@@ -2086,115 +1905,114 @@ def save_content():
         if not lesson:
             return jsonify({'status': 'error', 'message': '缺少必要參數'}), 400
         
-        data = load_data()
-        print(f"[SAVE] Data loaded, total lessons: {len(data)}")
-        print(f"[SAVE] Available lessons: {list(data.keys())}")
-        print(f"[SAVE] Looking for lesson: '{lesson}' (is_simple={is_simple}, language='{language}')")
-        
-        # 支持兩種數據結構：新流程（無語言）和舊流程（有語言）
-        if is_simple or not language:
-            # 新流程：直接在數據根層級查找課程
-            if lesson not in data:
-                print(f"[SAVE] ERROR: Lesson '{lesson}' not found in root level")
-                print(f"[SAVE] Available lessons: {list(data.keys())}")
-                return jsonify({'status': 'error', 'message': f'課程未找到: {lesson}'}), 404
-            lesson_content = data[lesson]
-        else:
-            # 舊流程：通過語言和課程查找
-            if language not in data or lesson not in data[language]:
-                print(f"[SAVE] ERROR: Language '{language}' or lesson '{lesson}' not found in language level")
-                return jsonify({'status': 'error', 'message': '內容未找到'}), 404
-            lesson_content = data[language][lesson]
-        
-        # Update words (preserve statistics from existing words)
-        if words:
-            updated_words = []
-            existing_words = {w['word']: w for w in lesson_content.get('詞語', [])}
+        # 持有排他鎖完成讀-改-寫，避免多個 worker 互相覆蓋
+        with data_store.locked():
+            print(f"[SAVE] Looking for lesson: '{lesson}' (is_simple={is_simple}, language='{language}')")
+        
+            # 支持兩種數據結構：新流程（無語言）和舊流程（有語言）
+            lesson_language = '' if is_simple or not language else language
+            if not lesson_language:
+                # 新流程：直接在數據根層級查找課程
+                lesson_content = data_store.load_lesson('', lesson)
+                if lesson_content is None:
+                    print(f"[SAVE] ERROR: Lesson '{lesson}' not found in root level")
+                    return jsonify({'status': 'error', 'message': f'課程未找到: {lesson}'}), 404
+            else:
+                # 舊流程：通過語言和課程查找
+                lesson_content = data_store.load_lesson(language, lesson)
+                if lesson_content is None:
+                    print(f"[SAVE] ERROR: Language '{language}' or lesson '{lesson}' not found in language level")
+                    return jsonify({'status': 'error', 'message': '內容未找到'}), 404
+        
+            # Update words (preserve statistics from existing words)
+            if words:
+                updated_words = []
+                existing_words = {w['word']: w for w in lesson_content.get('詞語', [])}
             
-            for word_text in words:
-                if word_text in existing_words:
-                    # Keep existing word with its statistics
-                    updated_words.append(existing_words[word_text])
-                else:
-                    # Create new word entry with empty statistics
-                    updated_words.append({
-                        'word': word_text,
-                        'meaning': '',
-                        'attempts': 0,
-                        'correct': 0,
-                        'incorrect': 0,
-                        'history': []
-                    })
+                for word_text in words:
+                    if word_text in existing_words:
+                        # Keep existing word with its statistics
+                        updated_words.append(existing_words[word_text])
+                    else:
+                        # Create new word entry with empty statistics
+                        updated_words.append({
+                            'word': word_text,
+                            'meaning': '',
+                            'attempts': 0,
+                            'correct': 0,
+                            'incorrect': 0,
+                            'history': []
+                        })
             
-            lesson_content['詞語'] = updated_words
+                lesson_content['詞語'] = updated_words
         
-        # Update paragraphs (preserve statistics from existing sentences)
-        if paragraphs:
-            updated_paragraphs = []
-            existing_paras = {p['title']: p for p in lesson_content.get('段落', [])}
+            # Update paragraphs (preserve statistics from existing sentences)
+            if paragraphs:
+                updated_paragraphs = []
+                existing_paras = {p['title']: p for p in lesson_content.get('段落', [])}
             
-            for para_idx, para_data in enumerate(paragraphs):
-                title = para_data.get('title')
-                sentences_text = para_data.get('sentences', [])
+                for para_idx, para_data in enumerate(paragraphs):
+                    title = para_data.get('title')
+                    sentences_text = para_data.get('sentences', [])
                 
-                # Create sentence objects
-                updated_sentences = []
-                existing_para = existing_paras.get(title)
-                existing_sentences = {}
+                    # Create sentence objects
+                    updated_sentences = []
+                    existing_para = existing_paras.get(title)
+                    existing_sentences = {}
                 
-                if existing_para:
-                    # Build map of existing sentences
-                    existing_sentences = {s['sentence']: s for s in existing_para.get('sentences', [])}
+                    if existing_para:
+                        # Build map of existing sentences
+                        existing_sentences = {s['sentence']: s for s in existing_para.get('sentences', [])}
                 
-                for sent_text in sentences_text:
-                    # 检查和清理空白文本
-                    if not sent_text or not isinstance(sent_text, str):
-                        print(f"[SAVE] ⚠ Skipping invalid sentence: {repr(sent_text)}")
-                        continue
+                    for sent_text in sentences_text:
+                        # 检查和清理空白文本
+                        if not sent_text or not isinstance(sent_text, str):
+                            print(f"[SAVE] ⚠ Skipping invalid sentence: {repr(sent_text)}")
+                            continue
                     
-                    sent_text = sent_text.strip()
-                    if not sent_text:
-                        print(f"[SAVE] ⚠ Skipping empty sentence after strip")
-                        continue
+                        sent_text = sent_text.strip()
+                        if not sent_text:
+                            print(f"[SAVE] ⚠ Skipping empty sentence after strip")
+                            continue
                     
-                    if sent_text in existing_sentences:
-                        # Keep existing sentence with statistics
-                        updated_sentences.append(existing_sentences[sent_text])
-                    else:
-                        # Create new sentence entry with empty statistics
-                        updated_sentences.append({
-                            'sentence': sent_text,
-                            'attempts': 0,
-                            'correct': 0,
-                            'incorrect': 0,
-                            'history': []
-                        })
+                        if sent_text in existing_sentences:
+                            # Keep existing sentence with statistics
+                            updated_sentences.append(existing_sentences[sent_text])
+                        else:
+                            # Create new sentence entry with empty statistics
+                            updated_sentences.append({
+                                'sentence': sent_text,
+                                'attempts': 0,
+                                'correct': 0,
+                                'incorrect': 0,
+                                'history': []
+                            })
                 
-                # Generate paragraph ID (use index as ID)
-                para_id = str(para_idx)
+                    # Generate paragraph ID (use index as ID)
+                    para_id = str(para_idx)
                 
-                # Calculate paragraph statistics from sentences
-                para_attempts = sum(s.get('attempts', 0) for s in updated_sentences)
-                para_correct = sum(s.get('correct', 0) for s in updated_sentences)
-                para_history = []
-                for s in updated_sentences:
-                    para_history.extend(s.get('history', []))
-                # 按时间戳排序
-                para_history = sorted(para_history, key=lambda x: x.get('timestamp', ''))
+                    # Calculate paragraph statistics from sentences
+                    para_attempts = sum(s.get('attempts', 0) for s in updated_sentences)
+                    para_correct = sum(s.get('correct', 0) for s in updated_sentences)
+                    para_history = []
+                    for s in updated_sentences:
+                        para_history.extend(s.get('history', []))
+                    # 按时间戳排序
+                    para_history = sorted(para_history, key=lambda x: x.get('timestamp', ''))
                 
-                updated_paragraphs.append({
-                    'id': para_id,
-                    'title': title,
-                    'sentences': updated_sentences,
-                    'attempts': para_attempts,
-                    'correct': para_correct,
-                    'history': para_history
-                })
+                    updated_paragraphs.append({
+                        'id': para_id,
+                        'title': title,
+                        'sentences': updated_sentences,
+                        'attempts': para_attempts,
+                        'correct': para_correct,
+                        'history': para_history
+                    })
             
-            lesson_content['段落'] = updated_paragraphs
+                lesson_content['段落'] = updated_paragraphs
         
-        # Save the updated data
-        save_data(data)
+            # 只保存這個課程
+            data_store.save_lesson(lesson_language, lesson, lesson_content)
         
         # 计算词语和段落数量
         word_count = len(lesson_content.get('詞語', []))
@@ -2216,73 +2034,20 @@ def save_content():
                 if text:
                     texts_to_generate.append(text)
         
-        # ✓ 同步生成音频：阻塞等待所有文件生成完成，确保可靠性
-        print(f"[SAVE] Starting synchronous TTS generation for lesson: {lesson}")
-        print(f"[SAVE] Generating {len(texts_to_generate)} audio files...")
-        
-        generated_count = 0
-        failed_texts = []
-        
-        for idx, text in enumerate(texts_to_generate, 1):
-            word_hash = hashlib.md5(text.encode('utf-8')).hexdigest()
-            audio_file = os.path.join(AUDIO_DIR, f'{word_hash}.mp3')
-            
-            # 检查文件是否已存在且有效
-            if os.path.exists(audio_file) and os.path.getsize(audio_file) > 0:
-                file_size = os.path.getsize(audio_file)
-                print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [OK] Cached: '{text}' ({file_size} bytes)")
-                generated_count += 1
-                continue
-            
-            # 生成新文件
-            print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] Generating: '{text}'...")
-            max_retries = 5
-            success = False
-            
-            for attempt in range(1, max_retries + 1):
-                try:
-                    tts = gTTS_lib(text=text, lang='zh-CN', slow=False)
-                    tts.save(audio_file)
-                    
-                    # 验证文件
-                    if os.path.exists(audio_file):
-                        file_size = os.path.getsize(audio_file)
-                        if file_size > 0:
-                            os.chmod(audio_file, 0o644)
-                            print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [OK] Generated: '{text}' ({file_size} bytes)")
-                            generated_count += 1
-                            success = True
-                            break
-                        else:
-                            print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [WARN] Empty file for: '{text}'")
-                    else:
-                        print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [WARN] File not created for: '{text}'")
-                    
-                except Exception as e:
-                    error_type = type(e).__name__
-                    print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [FAIL] Attempt {attempt}/{max_retries} failed ({error_type}): {str(e)[:80]}")
-                
-                # 如果不是最后一次尝试，等待后重试
-                if attempt < max_retries and not success:
-                    wait_time = 0.5 * attempt  # 0.5s, 1s, 1.5s, 2s, 2.5s
-                    print(f"[SAVE]      Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-            
-            if not success:
-                print(f"[SAVE]   [{idx}/{len(texts_to_generate)}] [FAIL] FAILED: '{text}'")
-                failed_texts.append(text)
-        
-        print(f"[SAVE] [OK] Generation complete: {generated_count}/{len(texts_to_generate)} successful")
-        if failed_texts:
-            print(f"[SAVE] [WARN] Failed files: {failed_texts}")
+        # 音频在后台生成：请求立即返回任务 id，前端通过 /api/tts_jobs/<id> 查询进度
+        job_id = audio_jobs.create(texts_to_generate, label=f'{language}/{lesson}' if language else lesson)
+        progress = audio_jobs.snapshot(job_id)
+        print(f"[SAVE] Queued audio job {job_id}: {progress['total']} texts, {progress['done']} already cached")
         
         # 返回课程元数据供前端记录到最近访问
         return jsonify({
             'status': 'success', 
-            'message': f'內容已保存！{generated_count}/{len(texts_to_generate)} 个音频文件已生成。',
-            'text_count': len(texts_to_generate),
-            'generated_count': generated_count,
-            'failed_texts': failed_texts,
+            'message': f'內容已保存！{progress["done"]}/{progress["total"]} 个音频文件已就緒，其餘在後台生成。',
+            'text_count': progress['total'],
+            'generated_count': progress['done'],
+            'failed_texts': progress['failed_texts'],
+            'job_id': job_id,
+            'job': progress,
             'lesson': {
                 'language': language,
                 'lesson_number': lesson,
@@ -0,0 +1,72 @@
+"""
+數據遷移腳本 - 把 vocabulary_data.json（含未合併的答題日誌）遷移到其他存儲後端
+
+用法:
+    python migrate_data.py sqlite [JSON文件] [數據庫文件]
+    python migrate_data.py sharded [JSON文件] [分片目錄]
+"""
+import sys
+
+from data_store import DataStore, ShardedDataStore, SQLiteDataStore
+from vocab_model import LessonRegistry
+
+DATA_FILE = 'vocabulary_data.json'
+SQLITE_FILE = 'vocabulary_data.db'
+SHARD_DIR = 'vocabulary_data'
+
+
+def migrate_to_sqlite(data_file=DATA_FILE, db_file=SQLITE_FILE):
+    """一次性遷移到 SQLite：舊格式（語言 -> 課程）和新格式（直接課程）都支持"""
+    data = DataStore(data_file).load()
+    store = SQLiteDataStore(db_file)
+    store.save(data)
+
+    lesson_count = len(LessonRegistry(data))
+    print(f"✓ 已遷移 {lesson_count} 個課程到 {db_file}")
+    for table, count in store.stats()['rows'].items():
+        print(f"  - {table}: {count} 行")
+
+    # 校驗：從數據庫還原的數據應與原數據的課程一致
+    restored = SQLiteDataStore(db_file).load()
+    restored_count = len(LessonRegistry(restored))
+    if restored_count != lesson_count:
+        print(f"⚠️  校驗失敗：還原出 {restored_count} 個課程")
+        return False
+    print("✓ 校驗通過")
+    return True
+
+
+def migrate_to_sharded(data_file=DATA_FILE, data_dir=SHARD_DIR):
+    """拆分為每個課程一個文件 + 清單；原文件保持不變"""
+    data = DataStore(data_file).load()
+    store = ShardedDataStore(data_dir)
+    store.save(data)
+
+    lessons = store.lessons()
+    print(f"✓ 已拆分 {len(lessons)} 個課程到 {data_dir}/")
+    for entry in lessons:
+        name = f"{entry['language']}/{entry['name']}" if entry['language'] else entry['name']
+        print(f"  - {name}: {entry['word_count']} 個詞語, {entry['para_count']} 個段落 -> lessons/{entry['file']}")
+
+    # 校驗：重新組裝的數據樹應與原數據完全一致
+    if ShardedDataStore(data_dir).load() != data:
+        print("⚠️  校驗失敗：重新組裝的數據與原數據不一致")
+        return False
+    print("✓ 校驗通過")
+    return True
+
+
+MIGRATIONS = {
+    'sqlite': migrate_to_sqlite,
+    'sharded': migrate_to_sharded
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in MIGRATIONS:
+        print(__doc__)
+        sys.exit(1)
+    backend = sys.argv[1]
+    ok = MIGRATIONS[backend](*sys.argv[2:4])
+    print(f"\n✓ 完成！設置 VOCAB_STORAGE={backend} 後重新啟動應用程式。" if ok else "\n✗ 遷移失敗")
+    sys.exit(0 if ok else 1)
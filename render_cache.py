@@ -0,0 +1,59 @@
+"""
+渲染片段緩存 - 按 (鍵, 數據版本號) 緩存渲染結果（HTML 片段、壓縮後的響應體）
+
+鍵標識頁面或片段（例如 ('stats', 語言, 課程)），版本號取自 data_store.lesson_version() 等。
+課程改變後版本號變大，舊內容不再命中，下一次渲染直接覆蓋；條目數超過上限時按 LRU 淘汰。
+版本號必須在渲染之前取得：渲染期間數據被修改時，緩存的內容對應舊版本號，下一次請求會重新渲染。
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class FragmentCache:
+    """線程安全的 LRU 片段緩存；max_entries 為 0 時不緩存"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, version, render):
+        """返回 key 在 version 下的內容，沒有緩存時調用 render() 渲染並保存"""
+        if self.max_entries <= 0:
+            return render()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        html = render()
+        with self._lock:
+            cached = self._entries.get(key)
+            # 並發渲染時不讓舊版本覆蓋新版本
+            if cached is None or cached[0] < version:
+                self._entries[key] = (version, html)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """返回命中率和條目數"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0
+            }
@@ -0,0 +1,207 @@
+"""
+並發答題壓力測試 - 多個 worker 進程、每個進程多個線程同時調用 /submit_answer，
+中間穿插創建課程（整個數據文件重寫），最後檢查答題記錄和課程沒有丟失
+
+用法:
+    python stress_submit_answer.py [進程數] [每進程線程數] [每線程請求數]
+    VOCAB_STORAGE=sqlite python stress_submit_answer.py
+    VOCAB_STORAGE=sharded python stress_submit_answer.py
+    VOCAB_DURABILITY=batched python stress_submit_answer.py 1   # 後台寫回只支持單個寫入進程
+"""
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+WORD_COUNT = 30
+LESSON_NAME = '壓力測試'
+
+
+def build_data():
+    """一個新格式課程：詞語和一個段落，全部未測試"""
+    return {
+        LESSON_NAME: {
+            '詞語': [{
+                'word': f'詞{i}',
+                'meaning': '',
+                'attempts': 0,
+                'correct': 0,
+                'incorrect': 0,
+                'history': []
+            } for i in range(WORD_COUNT)],
+            '段落': [{
+                'id': '0',
+                'title': '段落',
+                'sentences': [{
+                    'sentence': f'第{i}句。',
+                    'attempts': 0,
+                    'correct': 0,
+                    'incorrect': 0,
+                    'history': []
+                } for i in range(5)],
+                'attempts': 0,
+                'correct': 0,
+                'incorrect': 0,
+                'history': []
+            }]
+        }
+    }
+
+
+def worker(work_dir, worker_id, threads, requests_per_thread, results):
+    """一個 worker 進程：導入應用並用多個線程並發答題"""
+    os.chdir(work_dir)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import flask_app
+    # 頻繁合併日誌，讓合併和其他進程的追加交錯發生
+    flask_app.data_store.compact_every = 25
+
+    sent = {'詞語': 0, '段落': 0, 'known': 0, 'lessons': []}
+    sent_lock = threading.Lock()
+    errors = []
+
+    def run(thread_id):
+        client = flask_app.app.test_client()
+        rng = random.Random(worker_id * 1000 + thread_id)
+        for n in range(requests_per_thread):
+            if n % 40 == 0:
+                # 偶爾創建課程：整樹保存必須和答題日誌互不覆蓋
+                name = f'課程-{worker_id}-{thread_id}-{n}'
+                resp = client.post('/create_lesson_simple', json={'lesson_name': name})
+                if resp.status_code != 201:
+                    errors.append(f'create {name}: {resp.status_code}')
+                else:
+                    with sent_lock:
+                        sent['lessons'].append(name)
+            content_type = '詞語' if rng.random() < 0.8 else '段落'
+            if content_type == '詞語':
+                item = f'詞{rng.randrange(WORD_COUNT)}'
+            else:
+                item = f'第{rng.randrange(5)}句。'
+            known = rng.random() < 0.5
+            resp = client.post('/submit_answer', data={
+                'word': item,
+                'language': '',
+                'lesson': LESSON_NAME,
+                'content_type': content_type,
+                'is_known': 'true' if known else 'false'
+            })
+            if resp.status_code != 200:
+                errors.append(f'submit {item}: {resp.status_code} {resp.get_data(as_text=True)[:80]}')
+                continue
+            with sent_lock:
+                sent[content_type] += 1
+                sent['known'] += int(known)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    flask_app.data_store.compact()
+    sent['errors'] = errors
+    results.put(sent)
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    requests_per_thread = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    backend = os.environ.get('VOCAB_STORAGE', 'json')
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from data_store import DataStore, ShardedDataStore, SQLiteDataStore
+
+    work_dir = tempfile.mkdtemp(prefix='vocab_stress_')
+    try:
+        data_file = os.path.join(work_dir, 'vocabulary_data.json')
+        with open(data_file, 'w', encoding='utf-8') as f:
+            json.dump(build_data(), f, ensure_ascii=False, indent=2)
+        if backend == 'sqlite':
+            SQLiteDataStore(os.path.join(work_dir, 'vocabulary_data.db')).save(build_data())
+        elif backend == 'sharded':
+            ShardedDataStore(os.path.join(work_dir, 'vocabulary_data')).save(build_data())
+
+        total = processes * threads * requests_per_thread
+        print(f"[STRESS] backend={backend}: {processes} processes x {threads} threads x "
+              f"{requests_per_thread} requests = {total} answers")
+
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        start = time.perf_counter()
+        procs = [ctx.Process(target=worker, args=(work_dir, i, threads, requests_per_thread, results))
+                 for i in range(processes)]
+        for p in procs:
+            p.start()
+        sent = []
+        while len(sent) < len(procs):
+            try:
+                sent.append(results.get(timeout=1))
+            except queue.Empty:
+                # 崩潰的 worker 不會回報結果，不要一直等下去
+                if not any(p.is_alive() for p in procs) and results.empty():
+                    break
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+        crashed = [p.exitcode for p in procs if p.exitcode != 0]
+
+        errors = [e for s in sent for e in s['errors']]
+        sent_words = sum(s['詞語'] for s in sent)
+        sent_sentences = sum(s['段落'] for s in sent)
+        sent_known = sum(s['known'] for s in sent)
+        created = [name for s in sent for name in s['lessons']]
+
+        if backend == 'sqlite':
+            data = SQLiteDataStore(os.path.join(work_dir, 'vocabulary_data.db')).load()
+        elif backend == 'sharded':
+            data = ShardedDataStore(os.path.join(work_dir, 'vocabulary_data')).load()
+        else:
+            data = DataStore(data_file).load()
+        lesson = data[LESSON_NAME]
+        word_attempts = sum(w['attempts'] for w in lesson['詞語'])
+        word_history = sum(len(w['history']) for w in lesson['詞語'])
+        sent_attempts = sum(s['attempts'] for s in lesson['段落'][0]['sentences'])
+        para_attempts = lesson['段落'][0]['attempts']
+        correct = (sum(w['correct'] for w in lesson['詞語']) +
+                   sum(s['correct'] for s in lesson['段落'][0]['sentences']))
+        missing_lessons = [name for name in created if name not in data]
+
+        print(f"[STRESS] {sent_words + sent_sentences} answers in {elapsed:.2f}s "
+              f"({(sent_words + sent_sentences) / elapsed:.0f}/s), {len(created)} lessons created")
+        print(f"[STRESS] words: sent={sent_words} stored={word_attempts} history={word_history}")
+        print(f"[STRESS] sentences: sent={sent_sentences} stored={sent_attempts} paragraph={para_attempts}")
+        print(f"[STRESS] known: sent={sent_known} stored={correct}")
+
+        failures = []
+        if crashed or len(sent) < len(procs):
+            failures.append(f"{len(procs) - len(sent)} worker processes crashed (exit codes {crashed})")
+        if errors:
+            failures.append(f"{len(errors)} request errors, e.g. {errors[:3]}")
+        if word_attempts != sent_words or word_history != sent_words:
+            failures.append(f"lost word attempts: {sent_words - word_attempts}")
+        if sent_attempts != sent_sentences or para_attempts != sent_sentences:
+            failures.append(f"lost sentence attempts: {sent_sentences - sent_attempts}")
+        if correct != sent_known:
+            failures.append(f"correct count mismatch: {correct} != {sent_known}")
+        if missing_lessons:
+            failures.append(f"lost lessons: {missing_lessons[:5]}")
+
+        if failures:
+            for failure in failures:
+                print(f"[STRESS] ✗ {failure}")
+            return 1
+        print("[STRESS] ✓ No attempts or lessons lost")
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+TTS 引擎 - generate(text, lang, speed) 返回音頻數據（bytes），失敗時拋出異常
+
+    gtts   Google 翻譯 TTS（需要網絡和 gtts 庫），默認
+    local  本地確定性合成：按文本哈希生成一段短的 WAV 音調，不需要網絡；
+           可以設置延遲和失敗率，用於測試和基準測試隊列的吞吐量、重試和緩存
+           （仍保存為 .mp3 文件名，瀏覽器按內容識別為 WAV）
+
+由 VOCAB_TTS_BACKEND 選擇，見 backend_from_env()。
+"""
+import io
+import math
+import os
+import random
+import struct
+import threading
+import time
+import wave
+import zlib
+
+
+class TTSBackendError(Exception):
+    """引擎生成失敗（local 引擎注入的失敗也用這個異常）"""
+
+
+class GTTSBackend:
+    """gTTS：音頻直接寫入內存，不經過臨時文件"""
+
+    name = 'gtts'
+
+    def __init__(self):
+        # 沒有安裝 gtts 時拋出 ImportError，調用方據此禁用 TTS
+        from gtts import gTTS
+        self._gtts = gTTS
+
+    def generate(self, text, lang='zh-CN', speed=1.0):
+        # gTTS 只支持正常和慢速兩種語速
+        tts = self._gtts(text=text, lang=lang, slow=speed < 1.0)
+        buffer = io.BytesIO()
+        tts.write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class LocalBackend:
+    """
+    本地合成：同一文本總是得到相同的音頻（8 kHz 單聲道 WAV，音高由文本哈希決定，時長隨字數增加）
+
+    latency 為每次生成的延遲（秒），jitter 為額外的隨機延遲上限，failure_rate 為拋出 TTSBackendError 的概率。
+    延遲和失敗由 seed 決定的隨機數產生，同樣的調用順序得到同樣的結果
+    """
+
+    name = 'local'
+    SAMPLE_RATE = 8000
+
+    def __init__(self, latency=0.0, jitter=0.0, failure_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def generate(self, text, lang='zh-CN', speed=1.0):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._random.random() * self.jitter
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise TTSBackendError(f'injected failure for: {text}')
+        return self.render(text, lang, speed)
+
+    def render(self, text, lang='zh-CN', speed=1.0):
+        """生成 text 的 WAV 數據"""
+        seed = zlib.crc32(f'{lang}:{text}'.encode('utf-8'))
+        frequency = 300 + seed % 500
+        seconds = min(5.0, 0.25 + 0.15 * len(text)) / max(speed, 0.1)
+        frames = int(self.SAMPLE_RATE * seconds)
+        samples = struct.pack(f'<{frames}h', *(
+            int(8000 * math.sin(2 * math.pi * frequency * i / self.SAMPLE_RATE)) for i in range(frames)))
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out:
+            out.setnchannels(1)
+            out.setsampwidth(2)
+            out.setframerate(self.SAMPLE_RATE)
+            out.writeframes(samples)
+        return buffer.getvalue()
+
+
+BACKENDS = {
+    'gtts': GTTSBackend,
+    'local': LocalBackend
+}
+
+
+def make_backend(name, **options):
+    """按名稱創建引擎；名稱未知時拋出 ValueError，gtts 未安裝時拋出 ImportError"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f'unknown TTS backend: {name} (expected one of {", ".join(BACKENDS)})')
+    return backend_class(**options)
+
+
+def backend_from_env():
+    """
+    按環境變量創建引擎：VOCAB_TTS_BACKEND（gtts/local，默認 gtts）；local 引擎另讀
+    VOCAB_TTS_LOCAL_LATENCY、VOCAB_TTS_LOCAL_JITTER（秒）、VOCAB_TTS_LOCAL_FAILURE_RATE（0-1）、VOCAB_TTS_LOCAL_SEED
+    """
+    name = os.environ.get('VOCAB_TTS_BACKEND', 'gtts')
+    if name == 'local':
+        return make_backend(
+            name,
+            latency=float(os.environ.get('VOCAB_TTS_LOCAL_LATENCY', '0.05')),
+            jitter=float(os.environ.get('VOCAB_TTS_LOCAL_JITTER', '0')),
+            failure_rate=float(os.environ.get('VOCAB_TTS_LOCAL_FAILURE_RATE', '0')),
+            seed=int(os.environ.get('VOCAB_TTS_LOCAL_SEED', '0'))
+        )
+    return make_backend(name)
@@ -0,0 +1,732 @@
+"""
+語音生成服務 - 多個後台線程共用一個令牌桶限速器生成音頻文件
+
+每次調用 TTS 服務之前先從令牌桶取一個令牌，桶的速率按觀察到的結果自適應調整（AIMD）：
+失敗時速率減半，成功時逐步回升到上限，這樣吞吐量能接近服務允許的速率而不會持續觸發限流。
+任務保存在 SQLite 隊列（TTSJobQueue）中，以音頻哈希去重，重啟後繼續處理；
+單個文本失敗時按遞增的間隔重試，重試次數用完後進入死信列表。
+任務分為 interactive（學生正在等待的聽寫條目）和 bulk（保存、導入課程時的批量生成）兩個優先級，
+interactive 的任務總是先處理。
+
+音頻先寫入臨時文件，確認非空後再改名為最終文件名，讀取方不會看到寫了一半的文件。
+
+AudioJobs 把一批文本（例如保存課程時的所有詞語和句子）作為一個任務交給線程池，
+請求立即返回任務 id；任務記錄在隊列數據庫中，任何進程都可以按清單和隊列查詢完成、失敗和等待中的數量，
+失敗的文本可以重新提交。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+
+def _percentile(samples, fraction):
+    """已排序樣本的百分位數（最近秩），沒有樣本時返回 None"""
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, int(len(samples) * fraction))], 3)
+
+
+class TokenBucket:
+    """
+    令牌桶限速器：每秒補充 rate 個令牌，最多積累 burst 個
+
+    on_success()/on_failure() 根據調用結果調整速率：失敗時乘以 decrease（不低於 min_rate），
+    成功時加上 increase（不高於 max_rate）
+    """
+
+    def __init__(self, rate, burst, min_rate=None, increase=None, decrease=0.5):
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate is not None else self.max_rate / 16
+        self.increase = float(increase) if increase is not None else self.max_rate / 20
+        self.decrease = decrease
+        self.rate = self.max_rate
+        self.burst = max(1.0, float(burst))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """取一個令牌，不足時等待；返回等待的秒數"""
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - start
+                    self.waited += waited
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            # 在鎖外等待，其他線程和 on_success/on_failure 不被阻塞；醒來後重新檢查
+            time.sleep(delay)
+
+    def on_success(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_failure(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # 失敗後清空積累的令牌，避免緊接著又發出一批請求
+            self._tokens = min(self._tokens, 0.0)
+
+
+class TTSJobQueue:
+    """
+    持久化的 TTS 任務隊列（SQLite），以音頻哈希為鍵：同一個音頻同時只有一條記錄
+
+    狀態：pending（等待，available_at 之後可取）→ running（已被某個工作線程取走）→ 完成後刪除；
+    失敗時 retries 加一並延遲後回到 pending，達到 max_retries 後進入 dead（死信，不再自動重試）。
+    進程重啟後 pending 的任務繼續處理；running 超過 stale_after 秒的任務（進程中途退出）重新變為 pending。
+    多個進程可以共用同一個隊列文件，取任務在 BEGIN IMMEDIATE 事務中完成，不會重複領取。
+
+    priority 為 INTERACTIVE 或 BULK，先按優先級、再按加入時間取任務。
+    wait_stats() 按優先級統計本進程領取的任務從加入到開始生成的等待時間
+    """
+
+    INTERACTIVE = 0
+    BULK = 1
+    PRIORITY_NAMES = {INTERACTIVE: 'interactive', BULK: 'bulk'}
+    # 每個優先級保留最近多少個等待時間用於計算百分位數
+    WAIT_SAMPLES = 1000
+
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS tts_jobs (
+    key TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    audio_file TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    retries INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    enqueued REAL NOT NULL,
+    available_at REAL NOT NULL,
+    updated REAL NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_tts_jobs_state ON tts_jobs(state, available_at);
+CREATE TABLE IF NOT EXISTS audio_jobs (
+    id TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS audio_job_items (
+    job_id TEXT NOT NULL REFERENCES audio_jobs(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    key TEXT NOT NULL,
+    PRIMARY KEY (job_id, position)
+);
+"""
+
+    def __init__(self, db_file, max_retries=5, retry_delay=1.0, stale_after=300, poll_interval=1.0):
+        self.db_file = db_file
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self._connection = None
+        self._pid = None
+        # 打開連接用的鎖（可重入：打開時回收任務又會用到連接）；不能用 _lock，調用方常常已持有它
+        self._connect_lock = threading.RLock()
+        self._lock = threading.Lock()
+        self._waits = {priority: deque(maxlen=self.WAIT_SAMPLES) for priority in self.PRIORITY_NAMES}
+        self._available = threading.Condition()
+        self._reclaimed_at = 0
+
+    @property
+    def _conn(self):
+        """
+        隊列數據庫連接：第一次使用時打開；fork 之後在子進程中重新打開，
+        預先 fork 的服務器（gunicorn 等）的各個進程不共用同一個連接
+        """
+        with self._connect_lock:
+            if self._connection is None or self._pid != os.getpid():
+                conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30, isolation_level=None)
+                conn.execute('PRAGMA journal_mode=WAL')
+                # 刪除舊的音頻任務時一併刪除其文本（ON DELETE CASCADE）
+                conn.execute('PRAGMA foreign_keys=ON')
+                conn.executescript(self.SCHEMA)
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(tts_jobs)')}
+                if 'priority' not in columns:
+                    # 沒有優先級的舊隊列文件：原有任務都按 bulk 處理
+                    conn.execute(f'ALTER TABLE tts_jobs ADD COLUMN priority INTEGER NOT NULL DEFAULT {self.BULK}')
+                conn.execute('CREATE INDEX IF NOT EXISTS idx_tts_jobs_claim ON tts_jobs(state, priority, enqueued)')
+                self._connection = conn
+                self._pid = os.getpid()
+                resumed = self._reclaim(time.time())
+                pending = conn.execute("SELECT COUNT(*) FROM tts_jobs WHERE state = 'pending'").fetchone()[0]
+                print(f"[TTS] Job queue {self.db_file}: {pending} pending ({resumed} resumed after restart)")
+            return self._connection
+
+    def _reclaim(self, now):
+        """把長時間處於 running 的任務放回 pending；返回放回的條數"""
+        self._reclaimed_at = now
+        return self._conn.execute(
+            "UPDATE tts_jobs SET state = 'pending', available_at = ?, updated = ? "
+            "WHERE state = 'running' AND updated < ?", (now, now, now - self.stale_after)).rowcount
+
+    def put(self, key, text, audio_file, revive=False, priority=BULK):
+        """
+        加入隊列；已在隊列中（pending/running）時不重複加入，返回 False。
+        等待中的 bulk 任務再以 interactive 提交時提升為 interactive（排在 interactive 任務的最後）
+
+        死信中的任務只有 revive=True（用戶主動保存或重試）時才重新加入
+        """
+        now = time.time()
+        with self._lock:
+            added = self._conn.execute(
+                'INSERT OR IGNORE INTO tts_jobs (key, text, audio_file, enqueued, available_at, updated, priority) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (key, text, audio_file, now, now, now, priority)).rowcount > 0
+            if not added and revive:
+                added = self._conn.execute(
+                    "UPDATE tts_jobs SET state = 'pending', retries = 0, last_error = NULL, enqueued = ?, "
+                    "available_at = ?, updated = ?, priority = ? WHERE key = ? AND state = 'dead'",
+                    (now, now, now, priority, key)).rowcount > 0
+            if not added:
+                self._conn.execute(
+                    "UPDATE tts_jobs SET priority = ?, enqueued = ?, updated = ? "
+                    "WHERE key = ? AND state = 'pending' AND priority > ?", (priority, now, now, key, priority))
+        if added:
+            with self._available:
+                self._available.notify()
+        return added
+
+    def get(self, timeout=None):
+        """取一個可處理的任務 (key, text, audio_file, retries)，沒有時等待；超時返回 None"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                job = self._claim()
+            if job is not None:
+                return job
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return None
+            with self._available:
+                self._available.wait(wait)
+
+    def _claim(self):
+        now = time.time()
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            if now - self._reclaimed_at > self.stale_after / 10:
+                self._reclaim(now)
+            row = self._conn.execute(
+                "SELECT key, text, audio_file, retries, priority, enqueued FROM tts_jobs "
+                "WHERE state = 'pending' AND available_at <= ? ORDER BY priority, enqueued LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE tts_jobs SET state = 'running', updated = ? WHERE key = ?", (now, row[0]))
+            self._conn.execute('COMMIT')
+        except Exception:
+            self._conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        key, text, audio_file, retries, priority, enqueued = row
+        # 只統計第一次嘗試：重試的等待包含重試延遲
+        if retries == 0 and priority in self._waits:
+            self._waits[priority].append(max(0.0, now - enqueued))
+        return key, text, audio_file, retries
+
+    def done(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM tts_jobs WHERE key = ?', (key,))
+
+    def fail(self, key, error=''):
+        """記錄一次失敗：返回 'pending'（稍後重試）或 'dead'（重試次數用完）"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT retries FROM tts_jobs WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return 'dead'
+            retries = row[0] + 1
+            state = 'dead' if retries >= self.max_retries else 'pending'
+            delay = self.retry_delay * (1 + retries * 0.5)
+            self._conn.execute(
+                'UPDATE tts_jobs SET state = ?, retries = ?, last_error = ?, available_at = ?, updated = ? '
+                'WHERE key = ?', (state, retries, str(error)[:200], now + delay, now, key))
+        return state
+
+    def state(self, key):
+        """任務狀態，不在隊列中（已完成或從未加入）時返回 None"""
+        with self._lock:
+            row = self._conn.execute('SELECT state FROM tts_jobs WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def states(self, keys):
+        """多個任務的狀態：{鍵: 狀態}，不在隊列中的鍵不出現"""
+        keys = list(keys)
+        result = {}
+        with self._lock:
+            # SQLite 限制單條語句的參數個數
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                result.update(self._conn.execute(
+                    f'SELECT key, state FROM tts_jobs WHERE key IN ({placeholders})', chunk).fetchall())
+        return result
+
+    def wait_stats(self):
+        """
+        每個優先級：等待中的任務數和最近領取的任務從加入到開始生成的等待時間百分位數（秒）
+        """
+        with self._lock:
+            pending = dict(self._conn.execute(
+                "SELECT priority, COUNT(*) FROM tts_jobs WHERE state = 'pending' GROUP BY priority").fetchall())
+            samples = {priority: sorted(waits) for priority, waits in self._waits.items()}
+        stats = {}
+        for priority, name in self.PRIORITY_NAMES.items():
+            waits = samples[priority]
+            stats[name] = {
+                'pending': pending.get(priority, 0),
+                'samples': len(waits),
+                'wait_p50_s': _percentile(waits, 0.5),
+                'wait_p95_s': _percentile(waits, 0.95),
+                'wait_p99_s': _percentile(waits, 0.99)
+            }
+        return stats
+
+    def add_audio_job(self, job_id, label, items, max_jobs):
+        """記錄一個音頻生成任務：items 為 [(文本, 音頻鍵)]；只保留最近 max_jobs 個任務"""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute('INSERT INTO audio_jobs (id, label, created) VALUES (?, ?, ?)', (job_id, label, now))
+                self._conn.executemany(
+                    'INSERT INTO audio_job_items (job_id, position, text, key) VALUES (?, ?, ?, ?)',
+                    [(job_id, position, text, key) for position, (text, key) in enumerate(items)])
+                self._conn.execute(
+                    'DELETE FROM audio_jobs WHERE id NOT IN (SELECT id FROM audio_jobs ORDER BY created DESC LIMIT ?)',
+                    (max_jobs,))
+        return now
+
+    def audio_job(self, job_id):
+        """任務記錄 (標籤, 創建時間, 完成時間, [(文本, 音頻鍵)])，不存在時返回 None"""
+        with self._lock:
+            row = self._conn.execute('SELECT label, created, finished FROM audio_jobs WHERE id = ?',
+                                     (job_id,)).fetchone()
+            if row is None:
+                return None
+            items = self._conn.execute('SELECT text, key FROM audio_job_items WHERE job_id = ? ORDER BY position',
+                                       (job_id,)).fetchall()
+        return row[0], row[1], row[2], items
+
+    def set_audio_job_finished(self, job_id, finished):
+        """記錄任務完成時間（None 表示重新開始等待）"""
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE audio_jobs SET finished = ? WHERE id = ?', (finished, job_id))
+
+    def audio_job_counts(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*), COUNT(*) - COUNT(finished) FROM audio_jobs').fetchone()
+
+    def dead_letters(self, limit=100):
+        """死信列表：重試次數用完的任務"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, text, retries, last_error, updated FROM tts_jobs WHERE state = 'dead' "
+                "ORDER BY updated DESC LIMIT ?", (limit,)).fetchall()
+        return [{'key': key, 'text': text, 'retries': retries, 'last_error': last_error, 'failed_at': updated}
+                for key, text, retries, last_error, updated in rows]
+
+    def revive_dead(self):
+        """把所有死信重新加入隊列，返回條數"""
+        now = time.time()
+        with self._lock:
+            count = self._conn.execute(
+                "UPDATE tts_jobs SET state = 'pending', retries = 0, last_error = NULL, enqueued = ?, "
+                "available_at = ?, updated = ? WHERE state = 'dead'", (now, now, now)).rowcount
+        with self._available:
+            self._available.notify_all()
+        return count
+
+    def counts(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT state, COUNT(*) FROM tts_jobs GROUP BY state').fetchall()
+        counts = {'pending': 0, 'running': 0, 'dead': 0}
+        counts.update(rows)
+        return counts
+
+
+class TTSWorkerPool:
+    """
+    TTS 後台線程池：submit(text, audio_file) 把任務放入持久化隊列，workers 個線程共用 limiter 生成音頻
+
+    backend 為 tts_backends 中的引擎，backend.generate(text, lang, speed) 返回音頻數據，失敗時拋出異常；
+    可以在 start() 之前再設置。
+    每次從隊列取出只嘗試一次，失敗後由隊列延遲重試；同一個音頻在隊列中只有一條，
+    重複提交只多登記一個完成回調。
+    傳入 manifest（audio_manifest.AudioManifest）時用清單判斷音頻是否已生成，生成成功後記入清單
+    """
+
+    # 吞吐量統計窗口（秒）
+    WINDOW = 60
+
+    def __init__(self, backend, queue, workers=4, limiter=None, manifest=None, lang='zh-CN', speed=1.0):
+        self.backend = backend
+        self.queue = queue
+        self.manifest = manifest
+        self.lang = lang
+        self.speed = speed
+        self.workers = workers
+        self.limiter = limiter or TokenBucket(rate=2, burst=4)
+        self._threads = []
+        # 音頻鍵 -> [callback, ...]，任務完成或進入死信時調用
+        self._callbacks = {}
+        # 音頻鍵 -> 正在等待該音頻的 generate_wait 請求共用的 _Flight，最後一個等待者離開時刪除
+        self._inflight = {}
+        self._stats_lock = threading.Lock()
+        self._completions = deque()
+        self._busy = 0
+        self.generated = 0
+        self.cached = 0
+        self.failed = 0
+        self.deduplicated = 0
+        self.attempts = 0
+        self.attempt_failures = 0
+        self.started_at = None
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def start(self):
+        """啟動工作線程（只啟動一次）；隊列中上次未完成的任務會繼續處理"""
+        if self._threads:
+            return
+        self.started_at = time.time()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'TTSWorker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[TTS] Worker pool started: {self.workers} workers, "
+              f"rate {self.limiter.max_rate}/s, burst {self.limiter.burst:g}")
+
+    @staticmethod
+    def key_for(audio_file):
+        """隊列鍵：音頻文件名（文本的哈希）"""
+        return os.path.splitext(os.path.basename(audio_file))[0]
+
+    def has_audio(self, audio_file):
+        """音頻是否已生成：有清單時查清單，否則檢查文件"""
+        if self.manifest is not None:
+            return self.manifest.has(self.key_for(audio_file))
+        return os.path.exists(audio_file) and os.path.getsize(audio_file) > 0
+
+    def submit(self, text, audio_file, callback=None, revive=False, priority=TTSJobQueue.BULK):
+        """
+        加入隊列；callback(成功與否) 在完成或進入死信後由工作線程調用。
+        revive=True 時死信中的任務也重新加入；priority 為 TTSJobQueue.INTERACTIVE 或 BULK（見 TTSJobQueue.put）
+        """
+        key = self.key_for(audio_file)
+        if callback is not None:
+            with self._stats_lock:
+                self._callbacks.setdefault(key, []).append(callback)
+        if not self.queue.put(key, text, audio_file, revive=revive, priority=priority):
+            with self._stats_lock:
+                self.deduplicated += 1
+            if revive is False and callback is not None and self.queue.state(key) == 'dead':
+                self._finish(key, False)
+
+    def generate_wait(self, text, audio_file, timeout, priority=TTSJobQueue.INTERACTIVE, poll=0.5):
+        """
+        按需生成並最多等待 timeout 秒：返回 'ready'、'failed'（已在死信中或生成失敗）或 'pending'（超時）
+
+        同一音頻的並發請求只提交一次，共同等待同一個結果（single-flight）；
+        其他進程的工作線程處理的任務每 poll 秒按清單和隊列狀態檢查一次
+        """
+        if self.has_audio(audio_file):
+            return 'ready'
+        key = self.key_for(audio_file)
+        with self._stats_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                flight.callback = lambda ok, flight=flight: self._land(key, flight, ok)
+            flight.waiters += 1
+        try:
+            if leader:
+                self.submit(text, audio_file, callback=flight.callback, priority=priority)
+            deadline = time.monotonic() + timeout
+            while not flight.event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return 'pending'
+                if flight.event.wait(min(poll, remaining)):
+                    break
+                if self.has_audio(audio_file):
+                    self._finish(key, True)
+                elif self.queue.state(key) == 'dead':
+                    self._finish(key, False)
+            return 'ready' if flight.ok else 'failed'
+        finally:
+            self._leave(key, flight)
+
+    def _land(self, key, flight, ok):
+        """generate_wait 的任務完成：喚醒所有等待者"""
+        with self._stats_lock:
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+        flight.ok = ok
+        flight.event.set()
+
+    def _leave(self, key, flight):
+        """
+        等待者離開；最後一個離開且任務還沒完成時（超時）刪除共用狀態和完成回調，
+        之後的請求重新檢查清單並重新提交（隊列中已有的任務不會重複加入）
+        """
+        with self._stats_lock:
+            flight.waiters -= 1
+            if flight.waiters or flight.event.is_set():
+                return
+            if self._inflight.get(key) is flight:
+                del self._inflight[key]
+            callbacks = self._callbacks.get(key)
+            if callbacks is not None and flight.callback in callbacks:
+                callbacks.remove(flight.callback)
+                if not callbacks:
+                    del self._callbacks[key]
+
+    def join(self, poll=0.05):
+        """等待隊列中沒有可處理的任務（pending/running）"""
+        while True:
+            counts = self.queue.counts()
+            with self._stats_lock:
+                busy = self._busy
+            if not counts['pending'] and not counts['running'] and not busy:
+                return
+            time.sleep(poll)
+
+    def _finish(self, key, ok):
+        with self._stats_lock:
+            callbacks = self._callbacks.pop(key, [])
+        for callback in callbacks:
+            callback(ok)
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            with self._stats_lock:
+                self._busy += 1
+            try:
+                self.process(*job)
+            except Exception as e:
+                print(f"[TTS] ✗ Worker Error: {str(e)}")
+                import traceback
+                traceback.print_exc()
+                # 意外錯誤也按失敗處理，避免任務一直停在 running
+                if self.queue.fail(job[0], e) == 'dead':
+                    self._finish(job[0], False)
+            finally:
+                with self._stats_lock:
+                    self._busy -= 1
+
+    def process(self, key, text, audio_file, retries=0):
+        """處理隊列中的一個任務：生成一次，成功時從隊列刪除，失敗時交給隊列延遲重試或進入死信"""
+        if self.has_audio(audio_file):
+            with self._stats_lock:
+                self.cached += 1
+            self.queue.done(key)
+            self._finish(key, True)
+            return True
+        self.limiter.acquire()
+        error = self._attempt(text, audio_file, retries + 1)
+        with self._stats_lock:
+            self.attempts += 1
+            if error is not None:
+                self.attempt_failures += 1
+        if error is None:
+            self.limiter.on_success()
+            if self.manifest is not None:
+                self.manifest.add(key, os.path.getsize(audio_file), text, self.lang)
+            with self._stats_lock:
+                self.generated += 1
+                self._completions.append(time.monotonic())
+            self.queue.done(key)
+            self._finish(key, True)
+            return True
+        self.limiter.on_failure()
+        if self.queue.fail(key, error) == 'dead':
+            print(f"[TTS] ✗ FAILED to generate audio for: {text} after {retries + 1} attempts (dead letter)")
+            with self._stats_lock:
+                self.failed += 1
+            self._finish(key, False)
+        else:
+            print(f"[TTS] Will retry '{text}' (attempt {retries + 1}/{self.queue.max_retries})")
+        return False
+
+    def _attempt(self, text, audio_file, attempt):
+        """嘗試生成一次，成功返回 None，失敗返回錯誤描述"""
+        temp_file = f'{audio_file}.{threading.get_ident()}.tmp'
+        try:
+            print(f"[TTS] Generating: {text} (attempt {attempt}/{self.queue.max_retries})")
+            audio = self.backend.generate(text, self.lang, self.speed)
+            if not audio:
+                print(f"[TTS] ✗ Generated empty file for: {text}")
+                return 'empty file'
+            with open(temp_file, 'wb') as f:
+                f.write(audio)
+            os.chmod(temp_file, 0o644)
+            os.replace(temp_file, audio_file)
+            print(f"[TTS] ✓ Generated successfully: {text} -> {audio_file} ({os.path.getsize(audio_file)} bytes)")
+            return None
+        except Exception as e:
+            print(f"[TTS] ✗ {type(e).__name__} for '{text}': {str(e)[:100]}")
+            return f'{type(e).__name__}: {e}'
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+
+    def stats(self):
+        """吞吐量、隊列長度、失敗率和當前限速"""
+        counts = self.queue.counts()
+        waits = self.queue.wait_stats()
+        now = time.monotonic()
+        with self._stats_lock:
+            while self._completions and self._completions[0] < now - self.WINDOW:
+                self._completions.popleft()
+            recent = len(self._completions)
+            return {
+                'workers': len(self._threads),
+                'queue_depth': counts['pending'],
+                'running': counts['running'],
+                'dead_letters': counts['dead'],
+                'generated': self.generated,
+                'cached': self.cached,
+                'failed': self.failed,
+                'deduplicated': self.deduplicated,
+                'attempts': self.attempts,
+                'failure_rate': round(self.attempt_failures / self.attempts, 4) if self.attempts else 0,
+                'throughput_per_min': recent * 60 / self.WINDOW,
+                'rate_limit': round(self.limiter.rate, 3),
+                'rate_limit_wait_s': round(self.limiter.waited, 3),
+                'on_demand_inflight': len(self._inflight),
+                'priorities': waits
+            }
+
+
+class _Flight:
+    """generate_wait 中同一音頻的等待者共用的狀態"""
+
+    __slots__ = ('event', 'ok', 'waiters', 'callback')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.ok = None
+        self.waiters = 0
+        self.callback = None
+
+
+class AudioJobs:
+    """
+    音頻生成任務：create() 提交一批文本並立即返回任務 id，snapshot() 查詢進度，retry() 重新提交失敗的文本
+
+    任務和它包含的文本記錄在隊列的數據庫中（所有 worker 進程共用，重啟後仍在）；
+    每個文本的狀態由音頻清單和隊列計算：已生成為 done，在隊列中等待或生成中為 pending，
+    在死信中或既未生成也不在隊列中為 failed。audio_file_for(text) 返回文本的音頻文件路徑，只保留最近 max_jobs 個任務
+    """
+
+    def __init__(self, pool, audio_file_for, max_jobs=200):
+        self.pool = pool
+        self.audio_file_for = audio_file_for
+        self.max_jobs = max_jobs
+
+    def create(self, texts, label=''):
+        """提交文本（同一文本只生成一次，保持原順序），返回任務 id"""
+        job_id = uuid.uuid4().hex[:12]
+        texts = list(OrderedDict.fromkeys(texts))
+        items = [(text, self.pool.key_for(self.audio_file_for(text))) for text in texts]
+        self.pool.queue.add_audio_job(job_id, label, items, self.max_jobs)
+        self._submit(texts)
+        return job_id
+
+    def snapshot(self, job_id):
+        """任務進度：總數、完成/失敗/等待中的數量和失敗的文本；任務不存在時返回 None"""
+        record = self.pool.queue.audio_job(job_id)
+        if record is None:
+            return None
+        label, created, finished, items = record
+        states = self._states(items)
+        counts = {'pending': 0, 'done': 0, 'failed': 0}
+        for state in states.values():
+            counts[state] += 1
+        if counts['pending']:
+            status = 'pending'
+        else:
+            status = 'failed' if counts['failed'] else 'done'
+            if finished is None:
+                finished = time.time()
+                self.pool.queue.set_audio_job_finished(job_id, finished)
+                print(f"[TTS] Job {job_id} ({label}) finished: {counts}")
+        return {
+            'id': job_id,
+            'label': label,
+            'status': status,
+            'total': len(items),
+            'done': counts['done'],
+            'failed': counts['failed'],
+            'pending': counts['pending'],
+            'failed_texts': [text for text, state in states.items() if state == 'failed'],
+            'created': created,
+            'finished': finished if status != 'pending' else None
+        }
+
+    def _states(self, items):
+        """文本 -> pending/done/failed"""
+        missing = [(text, key) for text, key in items if not self.pool.has_audio(self.audio_file_for(text))]
+        queued = self.pool.queue.states(key for _, key in missing)
+        states = OrderedDict((text, 'done') for text, _ in items)
+        for text, key in missing:
+            state = queued.get(key)
+            if state in ('pending', 'running'):
+                states[text] = 'pending'
+            elif state is not None or not self.pool.has_audio(self.audio_file_for(text)):
+                # 不在隊列中時再查一次清單：任務可能在兩次查詢之間完成並從隊列刪除
+                states[text] = 'failed'
+        return states
+
+    def retry(self, job_id):
+        """重新提交任務中失敗的文本，任務不存在時返回 None"""
+        record = self.pool.queue.audio_job(job_id)
+        if record is None:
+            return None
+        failed = [text for text, state in self._states(record[3]).items() if state == 'failed']
+        if failed:
+            self.pool.queue.set_audio_job_finished(job_id, None)
+            self._submit(failed)
+        return job_id
+
+    def _submit(self, texts):
+        # 沒有可用的 TTS 引擎時不提交：文本既未生成也不在隊列中，記為失敗，引擎可用後可以重試
+        if not self.pool.running:
+            return
+        for text in texts:
+            audio_file = self.audio_file_for(text)
+            if not self.pool.has_audio(audio_file):
+                # 用戶主動保存或重試：死信中的文本也重新生成
+                self.pool.submit(text, audio_file, revive=True)
+
+    def stats(self):
+        jobs, running = self.pool.queue.audio_job_counts()
+        return {
+            'jobs': jobs,
+            'running': running
+        }
@@ -0,0 +1,672 @@
+"""
+規範化的課程模型 - 把兩種數據格式統一成按 (語言, 課程) 索引的課程表
+
+    舊格式：{語言: {課程: {'詞語': [...], '段落': [...]}}}
+    新格式：{課程: {'詞語': [...], '段落': [...]}}，語言為空字符串
+
+LessonRegistry 每個數據版本只構建一次，路由用字典查找代替遍歷整棵數據樹。
+Lesson 直接引用數據樹中的課程內容，記錄答題只改變條目的統計，不需要重建。
+
+答題定位用哈希索引：每個課程按 (內容類型, 文本) 索引條目，課程表按詞語索引所有課程中的條目，
+第一次使用時構建，課程內容被替換時重建。
+
+掌握計數（詞語總數、已掌握數）按課程緩存，同樣第一次使用時統計，之後答題時增量更新，
+課程被替換時重新統計；全局計數是各課程計數之和。最近練習時間同樣按課程緩存和增量更新。
+課程列表只用摘要（名稱、條目數、未掌握數、最近練習時間），按課程表版本緩存，不把課程內容交給模板。
+
+搜索用倒排索引：課程標題、詞語、釋義、段落標題和句子的每個字和相鄰兩字（小寫）-> 課程，
+查詢時取關鍵字各個二元組的交集作為候選，再逐個用子串匹配確認。課程保存或刪除時增量更新。
+
+數據版本：課程表和每個課程都有 version（進程內單調遞增，取自同一個計數器）和 modified（時間戳），
+記錄答題、替換或刪除課程時更新，重建課程表時全部取新值。用於 HTTP 的 ETag/Last-Modified。
+"""
+
+import heapq
+import itertools
+import time
+from operator import itemgetter
+
+# 數據版本計數器：只增不減，不同課程表和課程之間也不會重複
+_versions = itertools.count(1)
+
+# 掌握標準：正確率 ≥ 75%
+MASTERY_THRESHOLD = 0.75
+
+
+def normalize_text(text):
+    """Normalize text for comparison - removes extra whitespace and normalizes newlines"""
+    if not isinstance(text, str):
+        return ""
+    # Convert all types of newlines and extra whitespace to single spaces
+    normalized = ' '.join(text.split())
+    return normalized
+
+
+def is_mastered(item):
+    """已掌握：至少測試過一次且正確率 ≥ 75%"""
+    attempts = item.get('attempts', 0)
+    return attempts > 0 and item.get('correct', 0) / attempts >= MASTERY_THRESHOLD
+
+
+def paragraph_id(para, index):
+    """段落 ID：沒有 id 字段的舊數據用索引代替（與聽寫路由的匹配規則一致）"""
+    return para.get('id') or str(index)
+
+
+def sentence_text(sent):
+    """句子可能是帶統計的對象，也可能是舊數據中的純字符串"""
+    return sent.get('sentence', '') if isinstance(sent, dict) else sent
+
+
+def encode_cursor(key):
+    """未掌握詞語分頁的游標：排序鍵 (正確率, 課程位置, 詞語位置) 編碼成字符串"""
+    accuracy, lesson_position, word_position = key
+    return f'{float(accuracy)!r}:{lesson_position}:{word_position}'
+
+
+def decode_cursor(cursor):
+    """解析 encode_cursor() 的結果，格式不對時拋出 ValueError"""
+    parts = cursor.split(':')
+    if len(parts) != 3:
+        raise ValueError(f'invalid cursor: {cursor!r}')
+    return float(parts[0]), int(parts[1]), int(parts[2])
+
+
+def unmastered_item(lesson, word_item, accuracy):
+    """未掌握詞語列表中的一項"""
+    return {
+        'word': word_item.get('word', ''),
+        'lesson': lesson.name,
+        'language': lesson.language,
+        'is_simple': lesson.is_simple,
+        'attempts': word_item.get('attempts', 0),
+        'accuracy': accuracy
+    }
+
+
+def search_grams(text):
+    """文本（小寫）中的單字和相鄰兩字，中文按字切分，英文和數字同樣按字符處理"""
+    text = text.lower()
+    grams = set(text)
+    grams.update(text[i:i + 2] for i in range(len(text) - 1))
+    return grams
+
+
+def _query_grams(keyword):
+    """查詢用的 n-gram：單字關鍵字用單字，其餘用所有相鄰兩字"""
+    if len(keyword) < 2:
+        return {keyword} if keyword else set()
+    return {keyword[i:i + 2] for i in range(len(keyword) - 1)}
+
+
+def add_attempt(item, known, timestamp):
+    """累加一次答題統計並記錄歷史"""
+    item['attempts'] = item.get('attempts', 0) + 1
+    if known:
+        item['correct'] = item.get('correct', 0) + 1
+    else:
+        item['incorrect'] = item.get('incorrect', 0) + 1
+    item.setdefault('history', []).append({
+        "timestamp": timestamp,
+        "known": known
+    })
+
+
+def compute_lesson_stats(content):
+    """單個課程的詞語和句子掌握統計（未測試的計入需複習）"""
+    total_items = 0
+    mastered = 0
+    for item in content.get('詞語', []):
+        total_items += 1
+        if is_mastered(item):
+            mastered += 1
+    for para in content.get('段落', []):
+        for sent in para.get('sentences', []):
+            total_items += 1
+            if isinstance(sent, dict) and is_mastered(sent):
+                mastered += 1
+    return {
+        'total_words': total_items,
+        'mastered': mastered,
+        'needs_review': total_items - mastered,
+        'mastered_percentage': round((mastered / total_items) * 100, 1) if total_items > 0 else 0
+    }
+
+
+class Lesson:
+    """一個課程：語言（新格式為空字符串）、名稱和數據樹中的內容對象"""
+
+    __slots__ = ('language', 'name', 'content', 'version', 'modified',
+                 '_words', '_sentences', '_counts', '_search_fields', '_last_practiced')
+
+    def __init__(self, language, name, content):
+        self.language = language
+        self.name = name
+        self.content = content
+        self.version = next(_versions)
+        self.modified = time.time()
+        self._words = None
+        self._sentences = None
+        self._counts = None
+        self._search_fields = None
+        self._last_practiced = None
+
+    def touch(self):
+        """課程內容改變：取新的版本號"""
+        self.version = next(_versions)
+        self.modified = time.time()
+
+    def reset(self, content):
+        """課程內容被替換或修改了結構（增刪條目）：下次查找時重建索引和掌握計數"""
+        self.content = content
+        self._words = None
+        self._sentences = None
+        self._counts = None
+        self._search_fields = None
+        self._last_practiced = None
+        self.touch()
+
+    @property
+    def key(self):
+        return (self.language, self.name)
+
+    @property
+    def is_simple(self):
+        return not self.language
+
+    @property
+    def is_lesson(self):
+        """包含詞語或段落的標準課程；舊格式的語言下可能混有非標準內容"""
+        return isinstance(self.content, dict) and ('詞語' in self.content or '段落' in self.content)
+
+    @property
+    def count_key(self):
+        """未掌握數統計使用的鍵：舊格式為 "語言|課程" """
+        return self.language + '|' + self.name if self.language else self.name
+
+    @property
+    def words(self):
+        return self.content.get('詞語', []) if self.is_lesson else []
+
+    @property
+    def paragraphs(self):
+        return self.content.get('段落', []) if self.is_lesson else []
+
+    def iter_sentences(self):
+        """產生 (段落, 句子條目, 句子文本)"""
+        for para in self.paragraphs:
+            for sent in para.get('sentences', []):
+                yield para, sent, sentence_text(sent)
+
+    def _build_index(self):
+        # 同一文本出現多次時保留第一個，與按順序查找的結果一致
+        words = {}
+        for item in self.words:
+            words.setdefault(item.get('word'), item)
+        sentences = {}
+        for para, sent, text in self.iter_sentences():
+            sentences.setdefault(normalize_text(text), (para, sent))
+        self._words = words
+        self._sentences = sentences
+
+    def find_word(self, word):
+        """按詞語文本（精確匹配）查找詞語條目"""
+        if self._words is None:
+            self._build_index()
+        return self._words.get(word)
+
+    def find_sentence(self, text):
+        """按規範化的句子文本查找，返回 (段落, 句子條目)；舊數據中的句子條目可能是字符串"""
+        if self._sentences is None:
+            self._build_index()
+        return self._sentences.get(normalize_text(text))
+
+    def word_counts(self):
+        """詞語總數和已掌握數 (total, mastered)"""
+        if self._counts is None:
+            words = self.words
+            self._counts = [len(words), sum(1 for item in words if is_mastered(item))]
+        return self._counts[0], self._counts[1]
+
+    def last_practiced(self):
+        """最近一次答題的時間戳（"%Y-%m-%d %H:%M:%S" 字符串），從未練習時返回空字符串"""
+        if self._last_practiced is None:
+            latest = ''
+            for item in self.words:
+                for entry in item.get('history', []):
+                    latest = max(latest, entry.get('timestamp') or '')
+            for para in self.paragraphs:
+                for entry in para.get('history', []):
+                    latest = max(latest, entry.get('timestamp') or '')
+            self._last_practiced = latest
+        return self._last_practiced
+
+    def _practiced(self, timestamp):
+        if self._last_practiced is not None and timestamp:
+            self._last_practiced = max(self._last_practiced, timestamp)
+
+    def apply_attempt(self, record):
+        """把一條答題記錄應用到課程上：段落同時更新句子和所屬段落的統計；找不到內容時返回 False"""
+        known = record['known']
+        timestamp = record['timestamp']
+        if record.get('content_type', '詞語') == '詞語':
+            item = self.find_word(record['item'])
+            if item is None:
+                return False
+            was_mastered = is_mastered(item)
+            add_attempt(item, known, timestamp)
+            if self._counts is not None:
+                self._counts[1] += is_mastered(item) - was_mastered
+            self._practiced(timestamp)
+            self.touch()
+            return True
+        found = self.find_sentence(record['item'])
+        if found is None:
+            return False
+        para, sent = found
+        if isinstance(sent, dict):
+            add_attempt(sent, known, timestamp)
+        add_attempt(para, known, timestamp)
+        self._practiced(timestamp)
+        self.touch()
+        return True
+
+    def summary(self):
+        """課程列表和搜索結果使用的摘要"""
+        if self.is_lesson:
+            word_count = len(self.content.get('詞語', []))
+            para_count = len(self.content.get('段落', []))
+        else:
+            word_count = len(self.content) if isinstance(self.content, dict) else 0
+            para_count = 0
+        return {
+            'language': self.language,
+            'lesson_number': self.name,
+            'word_count': word_count,
+            'para_count': para_count,
+            'is_simple': self.is_simple
+        }
+
+    def listing(self):
+        """課程列表的一項：摘要加未掌握詞語數和最近練習時間，不含課程內容"""
+        item = self.summary()
+        if self.is_lesson:
+            total, mastered = self.word_counts()
+            item['unmastered_count'] = total - mastered
+            item['last_practiced'] = self.last_practiced()
+        else:
+            item['unmastered_count'] = 0
+            item['last_practiced'] = ''
+        return item
+
+    def search_texts(self):
+        """可搜索的文本，產生 (字段, 文本)；字段順序即 match_field 的優先順序"""
+        yield 'title', self.name
+        for word_item in self.words:
+            yield 'word', word_item.get('word', '')
+        for word_item in self.words:
+            yield 'meaning', word_item.get('meaning', '')
+        for para in self.paragraphs:
+            yield 'paragraph_title', para.get('title', '')
+        for _, _, text in self.iter_sentences():
+            yield 'sentence', text
+
+    def search_fields(self):
+        """每個字段的所有文本小寫後用 \\0 連接：[(字段, 文本)]，課程內容被替換前一直有效"""
+        if self._search_fields is None:
+            fields = {}
+            for field, text in self.search_texts():
+                if isinstance(text, str):
+                    fields.setdefault(field, []).append(text.lower())
+            self._search_fields = [(field, '\0'.join(texts)) for field, texts in fields.items()]
+        return self._search_fields
+
+    def match_field(self, keyword):
+        """第一個包含關鍵字（已小寫）的字段：title/word/meaning/paragraph_title/sentence，沒有則返回 None"""
+        for field, text in self.search_fields():
+            if keyword in text:
+                return field
+        return None
+
+
+def _walk_tree(data):
+    """遍歷數據樹的課程條目（兩種格式），按數據樹中的順序產生 (語言, 名稱, 內容)"""
+    for key, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        if '詞語' in value or '段落' in value:
+            yield '', key, value
+        else:
+            for lesson_num, lesson_content in value.items():
+                yield key, lesson_num, lesson_content
+
+
+class LessonRegistry:
+    """
+    規範化的課程表：(語言, 課程) -> Lesson，保持數據樹中的順序
+
+    遍歷只產生標準課程；entries() 還包括舊格式語言下的非標準條目（課程列表頁會顯示它們）。
+    """
+
+    def __init__(self, data):
+        self._lessons = {(language, name): Lesson(language, name, content)
+                         for language, name, content in _walk_tree(data)}
+        # 課程在數據樹中的順序，同一個詞語出現在多個課程時按它排序
+        self._position = {key: position for position, key in enumerate(self._lessons)}
+        # 詞語 -> [(課程, 條目), ...]，第一次使用時構建；另記下每個課程索引了哪些詞語，
+        # 因為課程內容可能被原地修改後才保存
+        self._word_index = None
+        self._indexed_words = {}
+        # 搜索索引：n-gram -> {課程鍵}，第一次搜索時構建；另記下每個課程索引了哪些 n-gram
+        self._gram_index = None
+        self._indexed_grams = {}
+        # 課程列表摘要：(版本號, [摘要, ...])
+        self._listing = None
+        self.version = next(_versions)
+        self.modified = time.time()
+
+    def touch(self):
+        """任何課程改變：取新的版本號"""
+        self.version = next(_versions)
+        self.modified = time.time()
+
+    def __iter__(self):
+        return (lesson for lesson in self._lessons.values() if lesson.is_lesson)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def entries(self):
+        """所有條目（包括非標準內容），按數據樹中的順序"""
+        return list(self._lessons.values())
+
+    def listing(self):
+        """所有條目（包括非標準內容）的課程列表摘要，按數據樹中的順序；每個版本只生成一次"""
+        if self._listing is None or self._listing[0] != self.version:
+            self._listing = (self.version, [lesson.listing() for lesson in self._lessons.values()])
+        return self._listing[1]
+
+    def get(self, language, name):
+        """按 (語言, 課程) 查找；內容不是對象時返回 None"""
+        lesson = self._lessons.get((language or '', name))
+        return lesson if lesson is not None and isinstance(lesson.content, dict) else None
+
+    def _index_words(self, lesson, sort=True):
+        words = []
+        for item in lesson.words:
+            word = item.get('word')
+            words.append(word)
+            entries = self._word_index.setdefault(word, [])
+            entries.append((lesson, item))
+            if sort and len(entries) > 1:
+                # 穩定排序：課程按數據樹中的順序，同一課程內按條目順序
+                entries.sort(key=lambda entry: self._position[entry[0].key])
+        self._indexed_words[lesson.key] = words
+
+    def _unindex_words(self, lesson):
+        for word in set(self._indexed_words.pop(lesson.key, ())):
+            entries = self._word_index.get(word)
+            if entries is None:
+                continue
+            entries[:] = [entry for entry in entries if entry[0] is not lesson]
+            if not entries:
+                del self._word_index[word]
+
+    def _index_grams(self, lesson):
+        grams = set()
+        for _, text in lesson.search_fields():
+            grams |= search_grams(text)
+        key = lesson.key
+        index = self._gram_index
+        for gram in grams:
+            keys = index.get(gram)
+            if keys is None:
+                index[gram] = {key}
+            else:
+                keys.add(key)
+        self._indexed_grams[key] = grams
+
+    def _unindex_grams(self, lesson):
+        for gram in self._indexed_grams.pop(lesson.key, ()):
+            keys = self._gram_index.get(gram)
+            if keys is None:
+                continue
+            keys.discard(lesson.key)
+            if not keys:
+                del self._gram_index[gram]
+
+    def word_items(self, word):
+        """所有課程中文本為 word 的詞語條目 [(課程, 條目), ...]，按課程順序"""
+        if self._word_index is None:
+            self._word_index = {}
+            for lesson in self:
+                # 按課程順序構建，不需要排序
+                self._index_words(lesson, sort=False)
+        return self._word_index.get(word, [])
+
+    def find_word(self, word):
+        """返回第一個包含該詞語的課程，找不到返回 None"""
+        entries = self.word_items(word)
+        return entries[0][0] if entries else None
+
+    def has_text(self, text):
+        """text 是否是某個課程中的詞語或句子（句子按規範化文本比較）"""
+        if self.word_items(text):
+            return True
+        return any(lesson.find_sentence(text) is not None for lesson in self)
+
+    def apply_attempt(self, record):
+        """把一條答題記錄應用到所屬課程上，找不到課程或內容時返回 False"""
+        lesson = self.get(record.get('language', ''), record['lesson'])
+        if lesson is None or not lesson.apply_attempt(record):
+            return False
+        self.touch()
+        return True
+
+    def set_lesson(self, language, name, content, data=None):
+        """
+        替換已有課程的內容並更新索引。新課程按它在 data（已加入該課程的數據樹）中的位置加入，
+        只索引這個課程；沒有 data 或位置無法確定時返回 False，由調用方重建
+        """
+        lesson = self._lessons.get((language or '', name))
+        if lesson is None:
+            return data is not None and self._insert_lesson(language or '', name, content, data)
+        if self._word_index is not None:
+            self._unindex_words(lesson)
+        if self._gram_index is not None:
+            self._unindex_grams(lesson)
+        lesson.reset(content)
+        if self._word_index is not None:
+            self._index_words(lesson)
+        if self._gram_index is not None and lesson.is_lesson:
+            self._index_grams(lesson)
+        self.touch()
+        return True
+
+    def _insert_lesson(self, language, name, content, data):
+        """
+        新課程在數據樹中是新加入的鍵，位於所在字典的末尾：新格式課程排在課程表最後，
+        舊格式課程排在同一語言的最後一個課程之後（語言也是新的時排在最後）
+        """
+        if not data:
+            return False
+        if language:
+            group = data.get(language)
+            if not isinstance(group, dict) or '詞語' in group or '段落' in group \
+                    or not group or next(reversed(group)) != name:
+                return False
+            siblings = [key for key in self._lessons if key[0] == language]
+            if siblings:
+                after = siblings[-1]
+            elif next(reversed(data)) == language:
+                after = None
+            else:
+                return False
+        else:
+            if next(reversed(data)) != name or not isinstance(content, dict) \
+                    or not ('詞語' in content or '段落' in content):
+                return False
+            # 同名的舊格式語言被替換成了課程
+            if any(key[0] == name for key in self._lessons):
+                return False
+            after = None
+        lesson = Lesson(language, name, content)
+        if after is None or after == next(reversed(self._lessons)):
+            self._lessons[lesson.key] = lesson
+            self._position[lesson.key] = len(self._position)
+        else:
+            lessons = {}
+            for key, existing in self._lessons.items():
+                lessons[key] = existing
+                if key == after:
+                    lessons[lesson.key] = lesson
+            self._lessons = lessons
+            # 只重新編號課程位置，詞語索引中已有條目的相對順序不變
+            self._position = {key: position for position, key in enumerate(lessons)}
+        if self._word_index is not None:
+            self._index_words(lesson)
+        if self._gram_index is not None and lesson.is_lesson:
+            self._index_grams(lesson)
+        self.touch()
+        return True
+
+    def remove_lesson(self, language, name):
+        """刪除課程，不存在時返回 False"""
+        lesson = self._lessons.pop((language or '', name), None)
+        if lesson is None:
+            return False
+        if self._word_index is not None:
+            self._unindex_words(lesson)
+        if self._gram_index is not None:
+            self._unindex_grams(lesson)
+        self.touch()
+        return True
+
+    def _unmastered_entries(self, language=None, lesson=None, min_accuracy=None, max_accuracy=None,
+                            never_attempted=False):
+        """
+        符合條件的未掌握詞語，產生 (排序鍵, 課程, 詞語條目)
+
+        排序鍵為 (正確率, 課程位置, 詞語位置)，即按正確率從低到高、同正確率按課程和詞語順序；
+        正確率為百分比，過濾範圍包含兩端。全部掌握的課程直接跳過
+        """
+        for found in self:
+            if language is not None and found.language != language:
+                continue
+            if lesson is not None and found.name != lesson:
+                continue
+            total, mastered = found.word_counts()
+            if mastered == total:
+                continue
+            position = self._position[found.key]
+            for index, word_item in enumerate(found.words):
+                if is_mastered(word_item):
+                    continue
+                attempts = word_item.get('attempts', 0)
+                if never_attempted and attempts:
+                    continue
+                accuracy = (word_item.get('correct', 0) / attempts * 100) if attempts > 0 else 0
+                if min_accuracy is not None and accuracy < min_accuracy:
+                    continue
+                if max_accuracy is not None and accuracy > max_accuracy:
+                    continue
+                yield (accuracy, position, index), found, word_item
+
+    def unmastered_words(self, **filters):
+        """所有未掌握的詞語（未測試或正確率低於75%），按正確率從低到高排序"""
+        entries = sorted(self._unmastered_entries(**filters), key=itemgetter(0))
+        return [unmastered_item(found, word_item, key[0]) for key, found, word_item in entries]
+
+    def unmastered_page(self, limit, cursor=None, **filters):
+        """
+        一頁未掌握的詞語：排在 cursor 之後最難的 limit 個，用有界堆選出，不排序全部詞語
+
+        返回 {'words', 'next_cursor', 'total', 'avg_accuracy'}，total 和平均正確率針對所有符合條件的詞語
+        """
+        after = decode_cursor(cursor) if cursor else None
+        totals = [0, 0.0]
+
+        def remaining():
+            for entry in self._unmastered_entries(**filters):
+                totals[0] += 1
+                totals[1] += entry[0][0]
+                if after is None or entry[0] > after:
+                    yield entry
+
+        page = heapq.nsmallest(limit + 1, remaining(), key=itemgetter(0))
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            'words': [unmastered_item(found, word_item, key[0]) for key, found, word_item in page],
+            'next_cursor': encode_cursor(page[-1][0]) if has_more else None,
+            'total': totals[0],
+            'avg_accuracy': round(totals[1] / totals[0], 1) if totals[0] else 0
+        }
+
+    def unmastered_count(self, **filters):
+        """符合條件的未掌握詞語數；只按課程或語言過濾時直接用各課程的掌握計數"""
+        if filters.get('min_accuracy') is None and filters.get('max_accuracy') is None \
+                and not filters.get('never_attempted'):
+            count = 0
+            for found in self:
+                if filters.get('language') is not None and found.language != filters['language']:
+                    continue
+                if filters.get('lesson') is not None and found.name != filters['lesson']:
+                    continue
+                total, mastered = found.word_counts()
+                count += total - mastered
+            return count
+        return sum(1 for _ in self._unmastered_entries(**filters))
+
+    def word_mastery_counts(self):
+        """所有詞語的總數、已掌握數和未掌握數"""
+        total_words = 0
+        mastered_words = 0
+        for lesson in self:
+            total, mastered = lesson.word_counts()
+            total_words += total
+            mastered_words += mastered
+        return {
+            'total': total_words,
+            'mastered': mastered_words,
+            'unmastered': total_words - mastered_words
+        }
+
+    def lesson_unmastered_counts(self):
+        """每個有詞語的課程的未掌握詞語數"""
+        counts = {}
+        for lesson in self:
+            if '詞語' in lesson.content:
+                total, mastered = lesson.word_counts()
+                counts[lesson.count_key] = total - mastered
+        return counts
+
+    def search(self, keyword, limit=None):
+        """
+        按標題和內容搜索課程，按課程順序返回摘要，matched_field 為匹配的字段
+
+        倒排索引給出候選課程（包含關鍵字的所有 n-gram），再用子串匹配確認
+        """
+        keyword = keyword.lower()
+        if self._gram_index is None:
+            self._gram_index = {}
+            for lesson in self:
+                self._index_grams(lesson)
+        grams = _query_grams(keyword)
+        if grams:
+            postings = sorted((self._gram_index.get(gram, set()) for gram in grams), key=len)
+            candidates = postings[0].intersection(*postings[1:])
+        else:
+            candidates = self._indexed_grams.keys()
+        results = []
+        for key in sorted(candidates, key=self._position.__getitem__):
+            if limit is not None and len(results) >= limit:
+                break
+            lesson = self._lessons[key]
+            field = lesson.match_field(keyword)
+            if field is None:
+                continue
+            summary = lesson.summary()
+            summary['matched_field'] = field
+            results.append(summary)
+        return results